@@ -48,7 +48,17 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 # ミドルウェア（CORS はできれば上の方）
-MIDDLEWARE = ['corsheaders.middleware.CorsMiddleware'] + MIDDLEWARE
+# - CompressionMiddleware: brotli/gzip 圧縮（COMPRESSION）。本文を書き換えるため外側に置く
+# - ConditionalGetMiddleware: ETag の無い GET 応答に本文ハッシュの ETag を付け、一致すれば 304（圧縮前の本文で計算）
+# - RequestMetricsMiddleware: クエリ数/DB時間/レンダリング時間の計測（Server-Timing・構造化ログ）
+# - RateLimitHeadersMiddleware: レート制限（core.ratelimit）の判定結果を RateLimit-* ヘッダで返す
+MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.RateLimitHeadersMiddleware',
+] + MIDDLEWARE
 
 ROOT_URLCONF = 'config.urls'
 
@@ -115,6 +125,10 @@ CORS_EXPOSE_HEADERS = [
     'RateLimit-Limit',
     'RateLimit-Remaining',
     'RateLimit-Reset',
+    'Server-Timing',
+    'X-Trace-Id',
+    'ETag',
+    'Idempotent-Replayed',
 ]
 
 # CSRF の信頼オリジン（カンマ区切り）
@@ -127,9 +141,20 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # 読み取り系はクレームのみで認証（User を読まない）。書き込み系は従来どおり DB の User
+        'core.authentication.ClaimsJWTAuthentication',
+    ],
+    # JSON は orjson で出力（core.renderers）。ブラウザブル API は DEBUG 時のみ
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        *(['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # レート制限（GCRA, core.ratelimit / RATE_LIMIT）。リバースプロキシ配下では NUM_PROXIES を設定する
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.ratelimit.GCRAThrottle',
+    ],
+    'NUM_PROXIES': int(os.environ['API_NUM_PROXIES']) if os.environ.get('API_NUM_PROXIES') else None,
     # 例外時の応答フォーマットを統一
     'EXCEPTION_HANDLER': 'core.exceptions.custom_exception_handler',
 }
@@ -156,6 +181,208 @@ SIMPLE_JWT = {
     'UPDATE_LAST_LOGIN': True,
 }
 
+# キャッシュ（既定はプロセス内。複数ワーカーで失効を揃えるなら共有のバックエンドに差し替える）
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'oyako-api'),
+    }
+}
+
+# 認証まわりのキャッシュ（core.authentication / core.auth_views）
+# - VERSION_TTL_S: クレームの世代（user_auth_versions）をキャッシュする秒数。権限変更の反映はこの秒数まで遅れる
+# - PROFILE_TTL_S: /api/me などで返すプロフィールをキャッシュする秒数（更新時は書き換える）
+AUTH_CACHE = {
+    'VERSION_TTL_S': int(os.environ.get('AUTH_VERSION_TTL_S', '30')),
+    'PROFILE_TTL_S': int(os.environ.get('AUTH_PROFILE_TTL_S', '300')),
+}
+
+# リクエスト計測（core.middleware.RequestMetricsMiddleware）
+# - SLOW_MS: これ以上かかったリクエストは WARNING で記録
+# - LOG_ALL: False の場合は遅いリクエストのみ記録
+REQUEST_METRICS = {
+    'SLOW_MS': float(os.environ.get('REQUEST_SLOW_MS', '500')),
+    'LOG_ALL': os.environ.get('REQUEST_LOG_ALL', '1') == '1',
+}
+
+# 検索 sort=score のベイズ平均（core.ranking）。PRIOR_WEIGHT はレビュー何件分を全体平均に寄せるか
+# RELEVANCE: sort=relevance の重み等（未指定のキーは core.ranking.RELEVANCE_DEFAULTS）
+SEARCH_RANKING = {
+    'PRIOR_WEIGHT': float(os.environ.get('SEARCH_RANK_PRIOR_WEIGHT', '5')),
+    'RELEVANCE': {
+        'WEIGHTS': {'distance': 0.45, 'rating': 0.30, 'reviews': 0.10, 'text': 0.15},
+        'DISTANCE_HALF_LIFE_M': 1500.0,
+        'CANDIDATES': 400,
+    },
+}
+
+# メモリ内検索インデックス（core.search_index。NumPy が必要・任意）
+# - 有効時は各プロセスが places をメモリに読み込み、q・open_at・age_band（プロフィールからの既定を含む）を含まない検索をメモリ内で処理する
+# - MODE='mmap': build_search_snapshot --loop が SNAPSHOT_DIR に書き出したファイルを全ワーカーで共有（mmap）する
+SEARCH_INDEX = {
+    'ENABLED': os.environ.get('SEARCH_INDEX_ENABLED', '0') == '1',
+    'MODE': os.environ.get('SEARCH_INDEX_MODE', 'memory'),
+    'SNAPSHOT_DIR': os.environ.get('SEARCH_SNAPSHOT_DIR') or None,
+    'REFRESH_INTERVAL_S': float(os.environ.get('SEARCH_INDEX_REFRESH_S', '60')),
+    'FULL_RELOAD_S': 3600.0,
+    'OVERLAP_S': 300.0,
+}
+
+# 営業時間の検索条件（core.opening_hours。/api/places?open_at=...）
+# - TIME_ZONE: 施設の現地時刻。open_at をこのタイムゾーンの曜日・時刻に直して places.opening_minutes と比べる
+OPENING_HOURS = {
+    'TIME_ZONE': os.environ.get('PLACES_TIME_ZONE', 'Asia/Tokyo'),
+}
+
+# 応答圧縮（core.middleware.CompressionMiddleware）
+# - ALGORITHMS はサーバー側の優先順。'br' は brotli パッケージが入っている場合のみ有効
+COMPRESSION = {
+    'MIN_SIZE': int(os.environ.get('COMPRESSION_MIN_SIZE', '1024')),
+    'ALGORITHMS': [a for a in os.environ.get('COMPRESSION_ALGORITHMS', 'br,gzip').split(',') if a],
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+}
+
+# メトリクス（/metrics, core.metrics）
+# - MULTIPROC_DIR: prefork 時に各ワーカーの値を書き出して合算するディレクトリ（未設定ならプロセス内の値のみ）
+# - TOKEN: 設定時は Authorization: Bearer <TOKEN> を要求
+# - ALLOW_UNAUTHENTICATED: TOKEN 未設定時に公開するか（既定は DEBUG 時のみ。内部ネットワークだけに
+#   bind したメトリクス用のプロセスなどでは METRICS_ALLOW_UNAUTHENTICATED=1）。False なら 403
+METRICS = {
+    'MULTIPROC_DIR': os.environ.get('PROMETHEUS_MULTIPROC_DIR') or None,
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': os.environ.get('METRICS_TOKEN') or None,
+    'ALLOW_UNAUTHENTICATED': DEBUG or os.environ.get('METRICS_ALLOW_UNAUTHENTICATED', '0') == '1',
+}
+
+# レート制限（core.ratelimit。GCRA / DRF スロットル）
+# - ROUTES: URL名 → {'anon': 未認証(IP単位), 'user': 認証済み(ユーザー単位, 省略時は anon と同じ), 'burst': 連続許容数}
+#   None を指定したルートは制限しない。ROUTES に無いルートは DEFAULT を共有のバケットで適用する
+# - STORE: 'memory'（ワーカーごと）/ 'shared'（同一ホストの全ワーカーで SHARED_PATH の mmap ファイルを共有）
+RATE_LIMIT = {
+    'ENABLED': os.environ.get('RATE_LIMIT_ENABLED', '1') == '1',
+    'STORE': os.environ.get('RATE_LIMIT_STORE', 'memory'),
+    'SHARED_PATH': os.environ.get('RATE_LIMIT_SHARED_PATH') or None,
+    'SHARED_SLOTS': 65536,
+    'DEFAULT': {'anon': '300/min', 'user': '600/min'},
+    'ROUTES': {
+        'places-search': {'anon': '60/min', 'user': '180/min', 'burst': 20},
+        'places-batch': {'anon': '30/min', 'user': '120/min', 'burst': 10},
+        'auth-login': {'anon': '10/min', 'burst': 5},
+        'auth-signup': {'anon': '5/min', 'burst': 3},
+        'auth-refresh': {'anon': '30/min'},
+        'reviews-create': {'user': '20/min', 'burst': 5},
+        'photo-upload': {'user': '30/min', 'burst': 10},
+    },
+}
+
+# レビュー投稿時の place_stats 更新（core.review_views / core.stats_flusher）
+# - MODE: 'sync'（投稿と同じトランザクションで再計算）/ 'write_behind'（place_stats_dirty へ登録し、
+#   manage.py flush_place_stats --loop が FLUSH_INTERVAL_S ごとに BATCH_SIZE 件ずつまとめて再計算）
+PLACE_STATS = {
+    'MODE': os.environ.get('PLACE_STATS_MODE', 'sync'),
+    'FLUSH_INTERVAL_S': float(os.environ.get('PLACE_STATS_FLUSH_INTERVAL_S', '5')),
+    'BATCH_SIZE': 500,
+}
+
+# 施設集計の整合性チェック（manage.py audit_place_stats / core.stats_audit。夜間に実行する想定）
+# - places を WORKERS × RANGES_PER_WORKER 個の id 範囲に分け、WORKERS 本の DB 接続で並列に集計し直す
+# - ずれた施設は REPAIR_BATCH 件ずつ 1 トランザクションで再計算する
+STATS_AUDIT = {
+    'WORKERS': int(os.environ.get('STATS_AUDIT_WORKERS', '4')),
+    'RANGES_PER_WORKER': 4,
+    'REPAIR_BATCH': 1000,
+}
+
+# JWT ブラックリストの掃除（manage.py prune_tokens / core.token_maintenance）
+# - BATCH_SIZE 件ずつ 1 トランザクションで削除し、バッチ間で SLEEP_S 秒待つ
+# - パーティション構成（prune_tokens --convert-partitioned）では PARTITION_PERIOD ごとに分割し、
+#   PARTITIONS_AHEAD 期間先まで作っておく
+TOKEN_PRUNE = {
+    'BATCH_SIZE': int(os.environ.get('TOKEN_PRUNE_BATCH_SIZE', '5000')),
+    'SLEEP_S': 0.05,
+    'PARTITION_PERIOD': os.environ.get('TOKEN_PARTITION_PERIOD', 'month'),
+    'PARTITIONS_AHEAD': 3,
+}
+
+# POST の冪等化（Idempotency-Key, core.idempotency）
+# - TTL_HOURS: 保存した応答を再送に返す期間 / WAIT_S: 同じキーの同時リクエストが先着の完了を待つ上限
+# - PRUNE_PROBABILITY: 保存時に期限切れ行を PRUNE_BATCH 件削除する確率
+IDEMPOTENCY = {
+    'TTL_HOURS': int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24')),
+    'WAIT_S': 10.0,
+    'PRUNE_PROBABILITY': 0.01,
+    'PRUNE_BATCH': 1000,
+}
+
+# エクスポート（core.export / manage.py export_places / /api/admin/export）
+# - OVERLAP_S: 差分出力で since からさかのぼる秒数（遅れてコミットされた更新の取りこぼし防止）
+EXPORT = {
+    'OVERLAP_S': float(os.environ.get('EXPORT_OVERLAP_S', '300')),
+}
+
+# 遅いクエリの EXPLAIN サンプリング（core.query_plans / manage.py query_plans）
+# - SAMPLE_RATE の割合のリクエストの SELECT と、SLOW_MS 以上の SELECT を EXPLAIN (ANALYZE, BUFFERS) する
+# - STORE: 'table'（query_plan_samples）または 'file'（FILE_PATH へ NDJSON）
+# - EXPLAIN は応答後にプロセスごとのバックグラウンドスレッドで行う（QUEUE_SIZE を超えた分は捨てる）
+QUERY_PLANS = {
+    'ENABLED': os.environ.get('QUERY_PLANS_ENABLED', '0') == '1',
+    'SAMPLE_RATE': float(os.environ.get('QUERY_PLANS_SAMPLE_RATE', '0.0')),
+    'SLOW_MS': float(os.environ.get('QUERY_PLANS_SLOW_MS', '200')),
+    'STORE': os.environ.get('QUERY_PLANS_STORE', 'table'),
+    'FILE_PATH': os.environ.get('QUERY_PLANS_FILE') or None,
+    'MAX_PER_REQUEST': 3,
+    'SHAPE_COOLDOWN_S': 60.0,
+    'TIMEOUT_MS': 5000,
+    'QUEUE_SIZE': 100,
+}
+
+# ログ（構造化リクエストログ core.request を標準出力へ）
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'core': {'handlers': ['console'], 'level': os.environ.get('CORE_LOG_LEVEL', 'INFO'), 'propagate': False},
+    },
+}
+
+# パスワードハッシュ（core.passwords）
+# - ALGORITHM: 'pbkdf2'（既定）/ 'argon2'（argon2-cffi が必要）。変更後は各ユーザーの次回ログイン時に再ハッシュされる
+# - MAX_CONCURRENCY: 同時に計算するハッシュの上限（SCOPE='process' はワーカー単位、'host' は同一ホスト合計）
+# - WAIT_S: 空きを待つ上限。超えたログイン/サインアップは 503 を返す
+PASSWORD_HASHING = {
+    'ALGORITHM': os.environ.get('PASSWORD_HASHER', 'pbkdf2'),
+    'PBKDF2_ITERATIONS': int(os.environ['PASSWORD_PBKDF2_ITERATIONS']) if os.environ.get('PASSWORD_PBKDF2_ITERATIONS') else None,
+    'ARGON2': {
+        'TIME_COST': int(os.environ.get('PASSWORD_ARGON2_TIME_COST', '2')),
+        'MEMORY_COST': int(os.environ.get('PASSWORD_ARGON2_MEMORY_KIB', '19456')),
+        'PARALLELISM': 1,
+    },
+    'MAX_CONCURRENCY': int(os.environ.get('PASSWORD_HASH_CONCURRENCY', '2')),
+    'SCOPE': os.environ.get('PASSWORD_HASH_SCOPE', 'process'),
+    'LOCK_PATH': os.environ.get('PASSWORD_HASH_LOCK_PATH') or None,
+    'WAIT_S': float(os.environ.get('PASSWORD_HASH_WAIT_S', '3')),
+}
+
+# 先頭が新規ハッシュに使う方式。残りは既存ハッシュの検証用（ログイン時に先頭の方式へ再ハッシュされる）
+_TUNED_HASHERS = {
+    'pbkdf2': 'core.passwords.TunedPBKDF2PasswordHasher',
+    'argon2': 'core.passwords.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [
+    _TUNED_HASHERS[PASSWORD_HASHING['ALGORITHM']],
+    *[h for a, h in _TUNED_HASHERS.items() if a != PASSWORD_HASHING['ALGORITHM']],
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -198,3 +425,20 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# 外部プロバイダ同期（manage.py sync_places）
+# - PROVIDERS: プロバイダ名 → {'CLASS': クライアントクラスのドット区切りパス, 'OPTIONS': コンストラクタの引数}
+#   （HttpJsonClient 系は OPTIONS に base_url が必要。テスト時は疑似サーバーに向けられる）
+# - RATE_LIMITS: プロバイダ単位の 1 秒あたりリクエスト数
+# - DEFAULT_CATEGORY: type からカテゴリを決められない新規施設に使う categories.code（None なら取込失敗）
+PLACE_SYNC = {
+    'PROVIDERS': {'google': {'CLASS': 'core.sync.GooglePlacesClient', 'OPTIONS': {}}},
+    'BATCH_SIZE': int(os.environ.get('PLACE_SYNC_BATCH_SIZE', '50')),
+    'CONCURRENCY': int(os.environ.get('PLACE_SYNC_CONCURRENCY', '8')),
+    'RATE_LIMITS': {'google': float(os.environ.get('PLACE_SYNC_GOOGLE_RPS', '10'))},
+    'TIMEOUT': 10.0,
+    'STALE_RUNNING_MINUTES': 30,
+    'DEFAULT_CATEGORY': os.environ.get('PLACE_SYNC_DEFAULT_CATEGORY') or None,
+}
+GOOGLE_PLACES_API_KEY = os.environ.get('GOOGLE_PLACES_API_KEY', '')
+GOOGLE_PLACES_BASE_URL = os.environ.get('GOOGLE_PLACES_BASE_URL', 'https://places.googleapis.com/v1')
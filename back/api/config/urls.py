@@ -11,9 +11,13 @@ from core.auth_views import (
 )
 from core.review_views import ReviewCreateView, ReviewListView
 from core.upload_views import UploadView
+from core.export_views import ExportView
+from core.moderation_views import ReviewModerationView
 from core.views import (
     PingView,
+    MetricsView,
     PlacesSearchView,
+    PlacesBatchView,
     PlaceDetailView,
     CategoriesListView,
     FeaturesListView,
@@ -24,6 +28,8 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, Sp
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/ping/', PingView.as_view(), name='ping'),
+    # メトリクス（Prometheus テキスト形式）
+    path('metrics', MetricsView.as_view(), name='metrics'),
     # 認証
     path('api/auth/signup', SignupView.as_view(), name='auth-signup'),
     path('api/auth/login', LoginView.as_view(), name='auth-login'),
@@ -35,12 +41,18 @@ urlpatterns = [
     path('api/uploads', UploadView.as_view(), name='photo-upload'),
     # 施設検索（距離順・半径フィルタ・limit・cursor）
     path('api/places', PlacesSearchView.as_view(), name='places-search'),
+    # 施設要約の一括取得（ID 最大100件）
+    path('api/places/batch', PlacesBatchView.as_view(), name='places-batch'),
     # 施設詳細
     path('api/places/<uuid:place_id>', PlaceDetailView.as_view(), name='place-detail'),
     # マスタ参照
     path('api/categories', CategoriesListView.as_view(), name='categories-list'),
     path('api/features', FeaturesListView.as_view(), name='features-list'),
     path('api/age-bands', AgeBandsListView.as_view(), name='age-bands-list'),
+    # 管理: 全件/差分エクスポート（NDJSON/CSV, gzip ストリーム）
+    path('api/admin/export/<str:dataset>', ExportView.as_view(), name='admin-export'),
+    # 管理: レビューの一括モデレーション（status 遷移と集計への差分反映）
+    path('api/admin/reviews/moderate', ReviewModerationView.as_view(), name='admin-reviews-moderate'),
     # OpenAPI スキーマ（JSON）
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     # Swagger UI（/api/schema/ を参照）
@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from core import metrics
+        from core.schema import reset_capabilities
+        from core.stats_flusher import dirty_gauges
+
+        # migrate でテーブル構成が変わった場合はスキーマ検出結果を取り直す
+        post_migrate.connect(reset_capabilities, dispatch_uid="core_reset_schema_capabilities")
+        # write-behind の place_stats の遅れを /metrics に出す
+        metrics.register_collector(dirty_gauges)
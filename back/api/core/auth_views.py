@@ -1,15 +1,19 @@
 from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
 from django.db import transaction
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError, InvalidToken
 
+from core import metrics
+from core.authentication import ClaimsRefreshToken, ClaimsTokenRefreshSerializer, conf as auth_cache_conf
 from core.exceptions import error_response
 from core.models import UserProfile
+from core.passwords import HashingBusy, hashing_slot
 from core.serializers import (
     LoginSerializer,
     ProfileUpdateSerializer,
@@ -31,20 +35,56 @@ def _serialize_child_age_band(profile: UserProfile) -> dict | None:
     }
 
 
-def _serialize_user(user: User) -> dict:
-    profile, _ = UserProfile.objects.get_or_create(user=user)
+def _profile_cache_key(user_id) -> str:
+    return f"profile:{user_id}"
+
+
+def cache_profile(user_id, profile: UserProfile | None) -> dict:
+    """プロフィールの表示用の値をキャッシュに入れて返す（プロフィールが無ければ各項目 None）。"""
+    data = {
+        "nickname": profile.nickname if profile else None,
+        "home_area": profile.home_area if profile else None,
+        "child_age_band": _serialize_child_age_band(profile) if profile else None,
+    }
+    cache.set(_profile_cache_key(user_id), data, auth_cache_conf()["PROFILE_TTL_S"])
+    return data
+
+
+def profile_summary(user_id) -> dict:
+    """プロフィールの表示用の値（読み取りのみ。行を作らない）。キャッシュに無いときだけ 1 クエリ。"""
+    data = cache.get(_profile_cache_key(user_id))
+    metrics.record_cache("profile", data is not None)
+    if data is None:
+        profile = UserProfile.objects.select_related("child_age_band").filter(user_id=user_id).first()
+        data = cache_profile(user_id, profile)
+    return data
+
+
+def _serialize_user(user: User, profile: dict | None = None) -> dict:
+    """user は User でも、クレームから作った TokenUser（core.authentication）でもよい。"""
+    profile = profile if profile is not None else profile_summary(user.id)
     return {
         "id": str(user.id),
         "email": user.email,
         "role": "admin" if user.is_staff else "member",
-        "nickname": profile.nickname,
-        "home_area": profile.home_area,
-        "child_age_band": _serialize_child_age_band(profile),
+        "nickname": profile["nickname"],
+        "home_area": profile["home_area"],
+        "child_age_band": profile["child_age_band"],
     }
 
 
+def _hashing_busy_response() -> Response:
+    response = error_response(
+        code="SERVICE_UNAVAILABLE",
+        message="混み合っています。しばらくしてから再度お試しください",
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+    response["Retry-After"] = "1"
+    return response
+
+
 def _token_response(user: User) -> Response:
-    refresh = RefreshToken.for_user(user)
+    refresh = ClaimsRefreshToken.for_user(user)
     data = {
         "user": _serialize_user(user),
         "access_token": str(refresh.access_token),
@@ -66,12 +106,20 @@ class SignupView(APIView):
                 status_code=status.HTTP_400_BAD_REQUEST,
             )
         data = serializer.validated_data
+        # ハッシュ計算はトランザクションの外で、同時実行数の上限内で行う
+        try:
+            with hashing_slot():
+                hashed_password = make_password(data["password"])
+        except HashingBusy:
+            return _hashing_busy_response()
         with transaction.atomic():
-            user = User.objects.create_user(
-                username=data["email"],
-                email=data["email"],
-                password=data["password"],
+            # UserManager.create_user と同じ正規化で作成し、計算済みのハッシュを設定する
+            user = User(
+                username=User.normalize_username(data["email"]),
+                email=User.objects.normalize_email(data["email"]),
             )
+            user.password = hashed_password
+            user.save()
             nickname = data.get("nickname") or data["email"].split("@")[0]
             home_area = data.get("home_area") or None
             child_age_band = data.get("child_age_band_id")
@@ -99,7 +147,12 @@ class LoginView(APIView):
                 status_code=status.HTTP_400_BAD_REQUEST,
             )
         data = serializer.validated_data
-        user = authenticate(request, username=data["email"], password=data["password"])
+        # 検証（と方式・パラメータ変更時の再ハッシュ）は同時実行数の上限内で行う
+        try:
+            with hashing_slot():
+                user = authenticate(request, username=data["email"], password=data["password"])
+        except HashingBusy:
+            return _hashing_busy_response()
         if not user:
             return error_response(
                 code="UNAUTHORIZED",
@@ -121,7 +174,7 @@ class RefreshView(APIView):
                 details={"field": "refresh_token"},
                 status_code=status.HTTP_400_BAD_REQUEST,
             )
-        serializer = TokenRefreshSerializer(data={"refresh": refresh_token})
+        serializer = ClaimsTokenRefreshSerializer(data={"refresh": refresh_token})
         try:
             serializer.is_valid(raise_exception=True)
         except TokenError as exc:
@@ -188,4 +241,4 @@ class MeView(APIView):
         if "child_age_band_id" in data:
             profile.child_age_band = data.get("child_age_band_id")
         profile.save()
-        return Response({"user": _serialize_user(request.user)}, status=status.HTTP_200_OK)
+        return Response({"user": _serialize_user(request.user, cache_profile(request.user.id, profile))}, status=status.HTTP_200_OK)
@@ -0,0 +1,119 @@
+"""JWT 認証（読み取りはトークンのクレームだけで認証し、User 行を読まない）。
+
+- アクセストークンに user_id / email / is_staff / is_superuser / ver（クレームの世代）を載せる。
+  ver は user_auth_versions.version（auth_user の is_active / is_staff / is_superuser が変わるとトリガーで +1）。
+- GET / HEAD / OPTIONS では、ver が現在の世代と一致すれば User を読まず TokenUser（クレームを属性として返す）を
+  request.user にする。現在の世代はキャッシュ（AUTH_CACHE['VERSION_TTL_S'] 秒）から読み、無いときだけ DB を 1 回引く。
+- 世代が変わったトークン・ver を持たない旧トークン・書き込み系のメソッドは、従来どおり User を DB から読む
+  （ForeignKey に渡せる実体が要るため）。
+- user_auth_versions の行は全ユーザーにある（0023 の挿入トリガ）。行が無い（削除されたユーザー・テーブルが無い
+  環境）ときは世代を None とし、クレームでは認証せず User を DB から読む（削除済みなら認証に失敗する）。
+- 失効の反映は最大 VERSION_TTL_S 秒遅れる（共有キャッシュを使う場合は全ワーカーで同じ）。
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.conf import settings
+from django.db import connection
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import metrics
+from core.schema import has_table
+
+VERSION_CLAIM = "ver"
+
+
+def conf() -> dict:
+    return {"VERSION_TTL_S": 30, "PROFILE_TTL_S": 300, **getattr(settings, "AUTH_CACHE", {})}
+
+
+def _version_cache_key(user_id) -> str:
+    return f"auth:ver:{user_id}"
+
+
+# 行が無いことをキャッシュに残す値（世代は 0 以上）
+_NO_VERSION = -1
+
+
+def load_auth_version(user_id) -> int | None:
+    """DB から現在の世代を読み、キャッシュに入れて返す（行が無ければ None）。"""
+    version = None
+    if has_table("user_auth_versions"):
+        with connection.cursor() as cur:
+            cur.execute("SELECT version FROM user_auth_versions WHERE user_id = %s", [user_id])
+            row = cur.fetchone()
+        version = int(row[0]) if row else None
+    cache.set(_version_cache_key(user_id), _NO_VERSION if version is None else version, conf()["VERSION_TTL_S"])
+    return version
+
+
+def current_auth_version(user_id) -> int | None:
+    version = cache.get(_version_cache_key(user_id))
+    metrics.record_cache("auth_version", version is not None)
+    if version is None:
+        return load_auth_version(user_id)
+    return None if version == _NO_VERSION else version
+
+
+def stamp_claims(token, user) -> None:
+    """トークンに認可判定用のクレームを書き込む。"""
+    token["email"] = user.email
+    token["is_staff"] = bool(user.is_staff)
+    token["is_superuser"] = bool(user.is_superuser)
+    token[VERSION_CLAIM] = load_auth_version(user.pk)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """発行・リフレッシュのたびに、アクセストークンへ最新のクレームを載せる RefreshToken。"""
+
+    _claims_user = None
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token._claims_user = user
+        return token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        user = self._claims_user
+        if user is None:
+            user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+            user = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is not None:
+            stamp_claims(access, user)
+        return access
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """読み取り系はクレームで、書き込み系は DB の User で認証する JWTAuthentication。"""
+
+    def authenticate(self, request):
+        if request.method not in SAFE_METHODS:
+            return super().authenticate(request)
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_claims_user(validated_token), validated_token
+
+    def get_claims_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        version = validated_token.get(VERSION_CLAIM)
+        if user_id is None or version is None:
+            return self.get_user(validated_token)
+        current = current_auth_version(user_id)
+        if current is None or version != current:
+            return self.get_user(validated_token)
+        return api_settings.TOKEN_USER_CLASS(validated_token)
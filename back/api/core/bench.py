@@ -0,0 +1,568 @@
+"""API のホットパス向けベンチマーク（合成データ生成・ワークロード再生・ベースライン比較）。
+
+- 合成データ: setseed + generate_series による集合演算で places / place_features / reviews /
+  review_scores / photos を生成する（同じ seed・同じ件数なら同じデータになる）。
+- 再生: django.test.Client でプロセス内から API を呼び、レイテンシ（p50/p95/p99）・スループット・
+  1 リクエストあたりのクエリ数を計測する。
+- 比較: 結果 JSON をベースラインとして保存し、p95 の悪化率・クエリ数の増加で回帰を判定する。
+"""
+import json
+import platform
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import django
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.opening_hours import local_zone, parse_open_at
+from core.ratelimit import reset_limiter
+from core.review_views import refresh_place_stats_bulk
+from core.schema import has_table
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# 合成データの識別子（google_place_id の接頭辞 / ユーザー名の接頭辞）
+BENCH_PREFIX = "bench:"
+BENCH_USER_PREFIX = "bench_user_"
+
+# 生成範囲（東京 23 区周辺）
+LAT_MIN, LAT_MAX = 35.55, 35.85
+LNG_MIN, LNG_MAX = 139.55, 139.90
+
+# 名称/説明に使う語彙（q 検索がヒットするように）
+WORDS = ("公園", "ひろば", "キッズ", "カフェ", "図書館", "児童館", "プール", "動物園")
+
+# 再生する検索の sort 一覧（並び替えモードを追加したらここにも追加する）
+SEARCH_SORTS = ["distance", "score", "reviews", "new", "relevance"]
+RADII = (1000, 3000, 3000, 10000, 30000)
+
+# 合成の営業時間（opening_hours_json）。1 行ごとに評価されるよう g を参照する相関副問い合わせにしている。
+# 10% は不明（NULL）、5% は Google 形式の 24 時間営業、残りは API 形式で 7〜10 時開店・16〜21 時閉店・週 1 日休み
+OPENING_HOURS_SQL = """
+(SELECT CASE
+          WHEN h.r < 0.10 THEN NULL
+          WHEN h.r < 0.15 THEN '{"periods": [{"open": {"day": 0, "hour": 0, "minute": 0}}]}'::jsonb
+          ELSE (SELECT jsonb_object_agg(
+                         d.code,
+                         CASE WHEN d.i = h.closed THEN '[]'::jsonb
+                              ELSE jsonb_build_array(jsonb_build_array(lpad(h.o::text, 2, '0') || ':00', h.c::text || ':00'))
+                         END)
+                FROM unnest(ARRAY['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']) WITH ORDINALITY AS d(code, i))
+        END
+ FROM (SELECT random() AS r, 7 + floor(random() * 4)::int AS o, 16 + floor(random() * 6)::int AS c,
+              1 + floor(random() * 7)::int AS closed, g) AS h)
+"""
+
+# リクエスト種別ごとの比率
+DEFAULT_MIX = {
+    "search": 0.60,
+    "detail": 0.20,
+    "reviews": 0.12,
+    "review_create": 0.08,
+}
+
+
+def _seed_to_pg(seed: int) -> float:
+    """PostgreSQL の setseed は [-1, 1] の実数を受け取る。"""
+    return (seed % 2000) / 1000.0 - 1.0
+
+
+def _ensure_users(count: int) -> list[int]:
+    User = get_user_model()
+    existing = set(User.objects.filter(username__startswith=BENCH_USER_PREFIX).values_list("username", flat=True))
+    missing = [
+        User(username=f"{BENCH_USER_PREFIX}{i}", email=f"{BENCH_USER_PREFIX}{i}@example.invalid", password="!")
+        for i in range(count)
+        if f"{BENCH_USER_PREFIX}{i}" not in existing
+    ]
+    User.objects.bulk_create(missing, batch_size=1000)
+    return list(
+        User.objects.filter(username__startswith=BENCH_USER_PREFIX).order_by("username").values_list("id", flat=True)[:count]
+    )
+
+
+def reset_dataset() -> None:
+    """合成データを削除する（Django 管理テーブルは DB 側 CASCADE が無いため子から順に消す）。"""
+    prefix = BENCH_PREFIX + "%"
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute("CREATE TEMP TABLE bench_places ON COMMIT DROP AS SELECT id FROM places WHERE google_place_id LIKE %s", [prefix])
+        cur.execute(
+            "DELETE FROM review_scores WHERE review_id IN (SELECT r.id FROM reviews r JOIN bench_places b ON b.id = r.place_id)"
+        )
+        cur.execute("DELETE FROM photos WHERE place_id IN (SELECT id FROM bench_places)")
+        cur.execute("DELETE FROM reviews WHERE place_id IN (SELECT id FROM bench_places)")
+        cur.execute("DELETE FROM places WHERE id IN (SELECT id FROM bench_places)")
+
+
+def generate_dataset(
+    count: int,
+    seed: int = 42,
+    reviews_per_place: float = 2.0,
+    photos_per_place: float = 0.5,
+    feature_ratio: float = 0.35,
+    users: int = 1000,
+    log=print,
+) -> dict:
+    """合成データを生成し、テーブルごとの件数と所要時間を返す。"""
+    started = time.monotonic()
+    user_ids = _ensure_users(users)
+    with connection.cursor() as cur:
+        cur.execute("SELECT id FROM categories ORDER BY code")
+        categories = [str(r[0]) for r in cur.fetchall()]
+        cur.execute("SELECT id FROM age_bands ORDER BY code")
+        age_bands = [str(r[0]) for r in cur.fetchall()]
+
+    params = {
+        "seed": str(seed),
+        "prefix": f"{BENCH_PREFIX}{seed}:%",
+        "count": int(count),
+        "categories": categories,
+        "n_categories": len(categories),
+        "age_bands": age_bands,
+        "n_age_bands": max(1, len(age_bands)),
+        "users": user_ids,
+        "n_users": len(user_ids),
+        "words": list(WORDS),
+        "n_words": len(WORDS),
+        "lat_min": LAT_MIN,
+        "lat_span": LAT_MAX - LAT_MIN,
+        "lng_min": LNG_MIN,
+        "lng_span": LNG_MAX - LNG_MIN,
+        "rpp": float(reviews_per_place),
+        "ppp": float(photos_per_place),
+        "feature_ratio": float(feature_ratio),
+    }
+    counts = {}
+    with connection.cursor() as cur:
+        cur.execute("SELECT setseed(%s)", [_seed_to_pg(seed)])
+
+        log(f"places: {count} 件を生成")
+        cur.execute(
+            f"""
+            INSERT INTO places (id, name, category_id, description, address, geog, google_place_id, data_source, created_at,
+                                opening_hours_json)
+            SELECT md5(%(seed)s || ':place:' || g)::uuid,
+                   (%(words)s::text[])[1 + floor(random() * %(n_words)s)::int] || ' ' || g,
+                   (%(categories)s::uuid[])[1 + floor(random() * %(n_categories)s)::int],
+                   'bench ' || (%(words)s::text[])[1 + floor(random() * %(n_words)s)::int],
+                   'bench address ' || g,
+                   ST_SetSRID(ST_MakePoint(%(lng_min)s + random() * %(lng_span)s, %(lat_min)s + random() * %(lat_span)s), 4326)::geography,
+                   'bench:' || %(seed)s || ':' || g,
+                   'manual',
+                   NOW() - random() * interval '730 days',
+                   {OPENING_HOURS_SQL}
+            FROM generate_series(1, %(count)s) AS g
+            ON CONFLICT (google_place_id) DO NOTHING
+            """,
+            params,
+        )
+        counts["places"] = cur.rowcount
+
+        log("place_features を生成")
+        cur.execute(
+            """
+            INSERT INTO place_features (place_id, feature_id, value)
+            SELECT p.id, f.id, 1
+            FROM (SELECT id FROM places WHERE google_place_id LIKE %(prefix)s ORDER BY google_place_id) p
+            CROSS JOIN (SELECT id FROM features ORDER BY code) f
+            WHERE random() < %(feature_ratio)s
+            ON CONFLICT DO NOTHING
+            """,
+            params,
+        )
+        counts["place_features"] = cur.rowcount
+
+        log("reviews を生成")
+        cur.execute(
+            """
+            INSERT INTO reviews (id, place_id, user_id, overall, age_band_id, stay_minutes, revisit_intent,
+                                 text, status, created_at, updated_at)
+            SELECT x.id, x.place_id, x.user_id, x.overall, x.age_band_id, x.stay_minutes, x.revisit_intent,
+                   'bench review', 'public', x.t, x.t
+            FROM (
+                SELECT md5(p.google_place_id || ':review:' || k)::uuid AS id,
+                       p.id AS place_id,
+                       (%(users)s::int[])[1 + floor(random() * %(n_users)s)::int] AS user_id,
+                       1 + floor(random() * 5)::int AS overall,
+                       (%(age_bands)s::uuid[])[1 + floor(random() * %(n_age_bands)s)::int] AS age_band_id,
+                       floor(random() * 180)::int AS stay_minutes,
+                       1 + floor(random() * 5)::int AS revisit_intent,
+                       NOW() - random() * interval '365 days' AS t
+                FROM (
+                    SELECT id, google_place_id, floor(random() * (2 * %(rpp)s + 1))::int AS n
+                    FROM places WHERE google_place_id LIKE %(prefix)s ORDER BY google_place_id
+                ) p
+                CROSS JOIN LATERAL generate_series(1, p.n) AS k
+            ) x
+            ON CONFLICT (id) DO NOTHING
+            """,
+            params,
+        )
+        counts["reviews"] = cur.rowcount
+
+        log("review_scores を生成")
+        cur.execute(
+            """
+            INSERT INTO review_scores (review_id, axis_id, score)
+            SELECT r.id, a.id, LEAST(5, GREATEST(1, r.overall + floor(random() * 3)::int - 1))
+            FROM (
+                SELECT r.id, r.overall FROM reviews r
+                JOIN places p ON p.id = r.place_id
+                WHERE p.google_place_id LIKE %(prefix)s
+                ORDER BY r.id
+            ) r
+            CROSS JOIN (SELECT id FROM review_axes ORDER BY code) a
+            WHERE random() < 0.7
+            ON CONFLICT DO NOTHING
+            """,
+            params,
+        )
+        counts["review_scores"] = cur.rowcount
+
+        log("photos を生成")
+        cur.execute(
+            """
+            INSERT INTO photos (id, place_id, review_id, uploaded_by_id, purpose, storage_path,
+                                mime_type, width, height, file_size, created_at)
+            SELECT md5(p.google_place_id || ':photo:' || k)::uuid, p.id, NULL,
+                   (%(users)s::int[])[1 + floor(random() * %(n_users)s)::int],
+                   'place_photo', '/media/bench/' || md5(p.google_place_id || ':photo:' || k) || '.jpg',
+                   'image/jpeg', 1600, 1200, 250000,
+                   NOW() - random() * interval '365 days'
+            FROM (
+                SELECT id, google_place_id, floor(random() * (2 * %(ppp)s + 1))::int AS n
+                FROM places WHERE google_place_id LIKE %(prefix)s ORDER BY google_place_id
+            ) p
+            CROSS JOIN LATERAL generate_series(1, p.n) AS k
+            ON CONFLICT (id) DO NOTHING
+            """,
+            params,
+        )
+        counts["photos"] = cur.rowcount
+
+    if has_table("place_stats"):
+        log("place_stats を再計算")
+        with connection.cursor() as cur:
+            cur.execute("SELECT id FROM places WHERE google_place_id LIKE %s ORDER BY id", [params["prefix"]])
+            place_ids = [str(r[0]) for r in cur.fetchall()]
+        for i in range(0, len(place_ids), 50_000):
+            refresh_place_stats_bulk(place_ids[i : i + 50_000])
+
+    with connection.cursor() as cur:
+        for table in ("places", "place_features", "reviews", "review_scores", "photos"):
+            cur.execute(f"ANALYZE {table}")
+
+    counts["elapsed_s"] = round(time.monotonic() - started, 2)
+    return counts
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float | None:
+    """最近傍順位法によるパーセンタイル。"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def build_workload(total: int, seed: int, place_ids: list[str], axis_codes: list[str], feature_codes: list[str],
+                   category_codes: list[str], include_writes: bool = True, mix: dict | None = None) -> list[dict]:
+    """再現可能なリクエスト列を生成する。"""
+    rng = random.Random(seed)
+    mix = dict(mix or DEFAULT_MIX)
+    if not include_writes:
+        mix.pop("review_create", None)
+    kinds = list(mix.keys())
+    weights = [mix[k] for k in kinds]
+
+    workload = []
+    for _ in range(total):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "search":
+            sort = rng.choice(SEARCH_SORTS)
+            params = {
+                "lat": round(rng.uniform(LAT_MIN, LAT_MAX), 5),
+                "lng": round(rng.uniform(LNG_MIN, LNG_MAX), 5),
+                "radius_m": rng.choice(RADII),
+                "limit": 20,
+                "sort": sort,
+            }
+            if feature_codes and rng.random() < 0.3:
+                params["features"] = rng.sample(feature_codes, k=min(len(feature_codes), rng.randint(1, 2)))
+            if category_codes and rng.random() < 0.2:
+                params["category"] = rng.choice(category_codes)
+            if rng.random() < 0.1:
+                params["q"] = rng.choice(WORDS)
+            if rng.random() < 0.15:
+                params["open_at"] = _random_open_at(rng)
+            workload.append({"name": f"search:{sort}", "method": "get", "path": "/api/places", "params": params})
+        elif kind == "detail":
+            workload.append({"name": "detail", "method": "get", "path": f"/api/places/{rng.choice(place_ids)}", "params": {}})
+        elif kind == "reviews":
+            params = {"limit": 5, "sort": rng.choice(["new", "rating"])}
+            workload.append({"name": "reviews", "method": "get", "path": f"/api/places/{rng.choice(place_ids)}/reviews", "params": params})
+        elif kind == "review_create":
+            axes = rng.sample(axis_codes, k=min(len(axis_codes), 2))
+            body = {
+                "place_id": rng.choice(place_ids),
+                "overall": rng.randint(1, 5),
+                "text": "bench review",
+                "axes": [{"code": code, "score": rng.randint(1, 5)} for code in axes],
+            }
+            workload.append({"name": "review_create", "method": "post", "path": "/api/reviews", "body": body})
+    return workload
+
+
+def _random_open_at(rng: random.Random) -> str:
+    """任意の曜日の 6〜22 時の現地時刻（ISO 8601、オフセット付き）。再現できるよう固定の週（2024-01-01 は月曜）を使う。"""
+    base = datetime(2024, 1, 1, tzinfo=local_zone())
+    return (base + timedelta(days=rng.randrange(7), hours=rng.randint(6, 21), minutes=rng.randrange(0, 60, 15))).isoformat()
+
+
+def _load_workload_inputs(sample: int) -> tuple[list[str], list[str], list[str], list[str]]:
+    with connection.cursor() as cur:
+        cur.execute("SELECT id FROM places ORDER BY id LIMIT %s", [sample])
+        place_ids = [str(r[0]) for r in cur.fetchall()]
+        cur.execute("SELECT code FROM review_axes ORDER BY code")
+        axis_codes = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT code FROM features ORDER BY code")
+        feature_codes = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT code FROM categories ORDER BY code")
+        category_codes = [r[0] for r in cur.fetchall()]
+    return place_ids, axis_codes, feature_codes, category_codes
+
+
+def run_benchmark(requests: int = 2000, seed: int = 42, warmup: int = 50, include_writes: bool = True,
+                  mix: dict | None = None) -> dict:
+    """ワークロードを再生して集計結果を返す。"""
+    place_ids, axis_codes, feature_codes, category_codes = _load_workload_inputs(1000)
+    if not place_ids:
+        raise RuntimeError("places が空です。先に bench_seed でデータを生成してください")
+    workload = build_workload(warmup + requests, seed, place_ids, axis_codes, feature_codes, category_codes,
+                              include_writes=include_writes, mix=mix)
+
+    client = Client()
+    User = get_user_model()
+    user = User.objects.filter(username__startswith=BENCH_USER_PREFIX).order_by("username").first()
+    auth_header = {}
+    if user is not None:
+        auth_header = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+    elif include_writes:
+        raise RuntimeError("ベンチ用ユーザーがいません。先に bench_seed を実行してください")
+
+    samples: dict[str, dict] = {}
+    started = None
+    # 1 ユーザー・1 IP から数千件を再生するため、レート制限は外す（有効なままだと 429 を計測してしまう）
+    with override_settings(ALLOWED_HOSTS=["*"], RATE_LIMIT={**settings.RATE_LIMIT, "ENABLED": False}):
+        reset_limiter()
+        try:
+            for i, req in enumerate(workload):
+                if i == warmup:
+                    started = time.perf_counter()
+                with CaptureQueriesContext(connection) as ctx:
+                    t0 = time.perf_counter()
+                    if req["method"] == "get":
+                        resp = client.get(req["path"], req["params"], **auth_header)
+                    else:
+                        resp = client.post(req["path"], json.dumps(req["body"]), content_type="application/json", **auth_header)
+                    elapsed_ms = (time.perf_counter() - t0) * 1000.0
+                if i < warmup:
+                    continue
+                entry = samples.setdefault(req["name"], {"latencies": [], "queries": 0, "errors": 0})
+                entry["latencies"].append(elapsed_ms)
+                entry["queries"] += len(ctx.captured_queries)
+                if resp.status_code >= 400:
+                    entry["errors"] += 1
+        finally:
+            reset_limiter()
+    wall = time.perf_counter() - (started or time.perf_counter())
+
+    def summarize(latencies: list[float], queries: int, errors: int) -> dict:
+        latencies = sorted(latencies)
+        n = len(latencies)
+        return {
+            "count": n,
+            "errors": errors,
+            "mean_ms": round(sum(latencies) / n, 3) if n else None,
+            "p50_ms": round(_percentile(latencies, 50), 3) if n else None,
+            "p95_ms": round(_percentile(latencies, 95), 3) if n else None,
+            "p99_ms": round(_percentile(latencies, 99), 3) if n else None,
+            "queries_per_request": round(queries / n, 3) if n else None,
+        }
+
+    endpoints = {name: summarize(e["latencies"], e["queries"], e["errors"]) for name, e in sorted(samples.items())}
+    all_latencies = [v for e in samples.values() for v in e["latencies"]]
+    overall = summarize(all_latencies, sum(e["queries"] for e in samples.values()), sum(e["errors"] for e in samples.values()))
+    overall["throughput_rps"] = round(len(all_latencies) / wall, 2) if wall > 0 else None
+
+    with connection.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM places")
+        place_count = cur.fetchone()[0]
+
+    return {
+        "meta": {
+            "seed": seed,
+            "requests": requests,
+            "warmup": warmup,
+            "include_writes": include_writes,
+            "places": place_count,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+        },
+        "overall": overall,
+        "endpoints": endpoints,
+    }
+
+
+def compare_to_baseline(result: dict, baseline: dict, tolerance: float = 0.2) -> list[str]:
+    """ベースラインと比較し、回帰の説明文の一覧を返す（空なら合格）。
+    - p95 が (1 + tolerance) 倍を超えて悪化した場合
+    - 1 リクエストあたりのクエリ数が増えた場合
+    """
+    regressions = []
+    for name, base in baseline.get("endpoints", {}).items():
+        cur = result.get("endpoints", {}).get(name)
+        if not cur or not cur.get("count"):
+            continue
+        if base.get("p95_ms") and cur["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {cur['p95_ms']}ms")
+        if base.get("queries_per_request") is not None and cur["queries_per_request"] > base["queries_per_request"] + 0.01:
+            regressions.append(
+                f"{name}: queries/request {base['queries_per_request']} -> {cur['queries_per_request']}"
+            )
+    return regressions
+
+
+def sample_search_page(items: int = 50, seed: int = 42) -> dict:
+    """PlacesSearchView と同じ形の検索結果 1 ページ分（レンダラ計測用、DB 不要）。"""
+    rnd = random.Random(seed)
+    codes = ("park", "indoor_play", "cafe", "library")
+    features = ("diaper_table", "nursing_room", "stroller_ok", "kids_toilet", "parking")
+    now = datetime.now(timezone.utc)
+    page = []
+    for i in range(items):
+        page.append(
+            {
+                "id": str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+                "name": f"{rnd.choice(WORDS)} {i}",
+                "category": {"code": rnd.choice(codes), "label": rnd.choice(WORDS)},
+                "location": {
+                    "lat": rnd.uniform(LAT_MIN, LAT_MAX),
+                    "lng": rnd.uniform(LNG_MIN, LNG_MAX),
+                    "distance_m": rnd.uniform(0, 3000),
+                },
+                "features_summary": rnd.sample(features, 3),
+                "rating": {"overall": round(rnd.uniform(1, 5), 2), "count": rnd.randint(0, 500)},
+                "thumbnail_url": None,
+                "created_at": now - timedelta(seconds=rnd.randint(0, 10**8)),
+            }
+        )
+    return {"items": page, "next_cursor": "eyJvZmZzZXQiOiA1MH0="}
+
+
+def bench_renderers(pages: int = 2000, items: int = 50, seed: int = 42) -> dict:
+    """検索 1 ページあたりのレンダリング CPU 時間（µs）を DRF 標準と FastJSONRenderer で比較する。"""
+    from rest_framework.renderers import JSONRenderer
+
+    from core.renderers import FastJSONRenderer
+
+    data = sample_search_page(items, seed)
+    results = {}
+    for name, renderer in (("drf_json", JSONRenderer()), ("fast_json", FastJSONRenderer())):
+        body = renderer.render(data, "application/json")
+        for _ in range(min(50, pages)):  # ウォームアップ
+            renderer.render(data, "application/json")
+        samples = []
+        for _ in range(pages):
+            t0 = time.process_time_ns()
+            renderer.render(data, "application/json")
+            samples.append((time.process_time_ns() - t0) / 1000.0)
+        samples.sort()
+        results[name] = {
+            "bytes": len(body),
+            "mean_us": round(sum(samples) / len(samples), 2),
+            "p50_us": round(_percentile(samples, 50), 2),
+            "p95_us": round(_percentile(samples, 95), 2),
+        }
+    speedup = round(results["drf_json"]["mean_us"] / max(results["fast_json"]["mean_us"], 0.01), 2)
+    return {"pages": pages, "items": items, "renderers": results, "speedup": speedup}
+
+
+def _plan_indexes(plan: dict) -> set[str]:
+    names = set()
+    if plan.get("Index Name"):
+        names.add(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names |= _plan_indexes(child)
+    return names
+
+
+def bench_open_at(queries: int = 500, seed: int = 42, radius_m: float = 3000.0, sort: str = "distance") -> dict:
+    """同じ検索を open_at なし / ありで実行し、SQL 検索のレイテンシと件数、open_at 検索の実行計画の索引を返す。"""
+    from core.views import search_places_sql
+
+    with connection.cursor() as cur:
+        cur.execute("SELECT COUNT(*), COUNT(opening_minutes) FROM places")
+        place_count, with_hours = cur.fetchone()
+    if not place_count:
+        raise RuntimeError("places が空です。先に bench_seed でデータを生成してください")
+
+    rng = random.Random(seed)
+    cases = [
+        {
+            "lat": round(rng.uniform(LAT_MIN, LAT_MAX), 5),
+            "lng": round(rng.uniform(LNG_MIN, LNG_MAX), 5),
+            "open_minute": parse_open_at(_random_open_at(rng)),
+        }
+        for _ in range(queries)
+    ]
+    results = {}
+    for name, use_open in (("all", False), ("open_at", True)):
+        latencies, items = [], 0
+        for case in cases:
+            t0 = time.perf_counter()
+            rows = search_places_sql(
+                lat=case["lat"], lng=case["lng"], radius_m=radius_m, limit=20, offset=0, sort=sort,
+                open_minute=case["open_minute"] if use_open else None,
+            )
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            items += len(rows)
+        latencies.sort()
+        results[name] = {
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "p50_ms": round(_percentile(latencies, 50), 3),
+            "p95_ms": round(_percentile(latencies, 95), 3),
+            "items_per_query": round(items / len(cases), 2),
+        }
+
+    # 実行計画（open_at 付きの 1 件目）で使われた索引
+    case = cases[0]
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            EXPLAIN (FORMAT JSON)
+            SELECT p.id FROM places p
+            WHERE ST_DWithin(p.geog, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
+              AND p.opening_minutes @> %s::int4
+            """,
+            [case["lng"], case["lat"], radius_m, case["open_minute"]],
+        )
+        plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return {
+        "places": place_count,
+        "places_with_hours": with_hours,
+        "queries": queries,
+        "radius_m": radius_m,
+        "sort": sort,
+        "results": results,
+        "plan_indexes": sorted(_plan_indexes(plan[0]["Plan"])),
+    }
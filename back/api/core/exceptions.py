@@ -1,4 +1,5 @@
 import uuid
+from contextvars import ContextVar
 from typing import Any
 
 from rest_framework.response import Response
@@ -16,6 +17,10 @@ from rest_framework.exceptions import (
 )
 
 
+# リクエスト単位のトレースID（RequestMetricsMiddleware が設定する）
+_trace_id_var: ContextVar[str | None] = ContextVar("trace_id", default=None)
+
+
 def _new_trace_id() -> str:
     """トレースIDを生成する（例: req_ab12cd34ef56）。
     - クライアント問い合わせ時の追跡に利用する。
@@ -23,6 +28,13 @@ def _new_trace_id() -> str:
     return f"req_{uuid.uuid4().hex[:12]}"
 
 
+def current_trace_id() -> str:
+    """処理中リクエストのトレースIDを返す（リクエスト外では新規に生成する）。
+    - エラー応答の trace_id とアクセスログの trace_id を一致させるために使う。
+    """
+    return _trace_id_var.get() or _new_trace_id()
+
+
 def error_response(code: str, message: str, details: dict | list | None = None, status_code: int = 400) -> Response:
     """共通のエラーレスポンスを生成する。
     - code: エラー分類（VALIDATION_ERROR / UNAUTHORIZED / FORBIDDEN / NOT_FOUND / RATE_LIMITED / CONFLICT / SERVER_ERROR など）
@@ -35,7 +47,7 @@ def error_response(code: str, message: str, details: dict | list | None = None,
             "code": code,
             "message": message,
             "details": details or {},
-            "trace_id": _new_trace_id(),
+            "trace_id": current_trace_id(),
         }
     }
     return Response(payload, status=status_code)
@@ -117,7 +129,7 @@ def custom_exception_handler(exc: Exception, context: dict) -> Response:
                 "code": code,
                 "message": message,
                 "details": details or {},
-                "trace_id": _new_trace_id(),
+                "trace_id": current_trace_id(),
             }
         }
         return resp
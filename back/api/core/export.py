@@ -0,0 +1,256 @@
+"""施設・レビューの全件エクスポート（NDJSON / CSV のストリーム出力）。
+
+- NDJSON: サーバーサイド（名前付き）カーソルで row_to_json の結果を itersize 件ずつ取得する。
+- CSV: COPY (...) TO STDOUT をワーカースレッドで実行し、容量制限付きキュー経由で逐次返す。
+- どちらもテーブルサイズに関係なくメモリ使用量は一定。
+- since（changed_at の透かし）を指定すると、それ以降に変わった行だけを出力する。
+  - places の changed_at は places.updated_at（place_features の変更もトリガで進む）と place_stats.updated_at の新しい方。
+    変わった施設は両テーブルの updated_at の索引から別々に集めて UNION する（GREATEST では索引が効かない）。
+    削除された施設は place_tombstones から deleted=true の行（id と changed_at 以外は空）として出す。
+  - reviews は status によらず出力し、public でないレビューは deleted=true（本文・評価は空）として出す。
+  - NOW() はトランザクション開始時刻のため、透かしより前の時刻で遅れてコミットされた行を拾えるよう
+    since から EXPORT['OVERLAP_S'] 秒さかのぼって出力する。重複した行は受け手が id で上書きすること。
+"""
+import queue
+import threading
+import zlib
+from datetime import datetime
+from typing import Iterator
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core.schema import has_table
+
+DATASETS = ("places", "reviews")
+FORMATS = ("ndjson", "csv")
+
+# NDJSON の名前付きカーソルで 1 回に取得する行数
+ITERSIZE = 2000
+# COPY スレッドと応答の間に溜めるチャンク数（1チャンク ≒ 8KB）
+COPY_QUEUE_SIZE = 64
+
+_RANGE_SQL = """
+    (%(since)s::timestamptz IS NULL OR {col} > %(since)s::timestamptz - make_interval(secs => %(overlap_s)s))
+    AND (%(until)s::timestamptz IS NULL OR {col} <= %(until)s::timestamptz)
+"""
+
+PLACE_COLUMNS = (
+    "name", "kana", "category", "description", "address", "phone", "website_url", "price_range",
+    "opening_hours_json", "lat", "lng", "google_place_id", "data_source", "manual_lock", "features",
+    "avg_overall", "review_count", "photo_count", "last_reviewed_at", "created_at", "updated_at",
+)
+
+
+def conf() -> dict:
+    return {"OVERLAP_S": 300.0, **getattr(settings, "EXPORT", {})}
+
+
+def _places_sql(incremental: bool = False) -> tuple[str, str]:
+    """places の出力 SQL と透かしの SQL。
+    incremental（since 指定）では places.updated_at / place_stats.updated_at それぞれの索引（0012）で
+    変わった施設 ID を集めて UNION で重複を除き、その施設だけを読む（全件の走査・並べ替えをしない）。
+    """
+    if has_table("place_stats"):
+        stats_cols = "ps.avg_overall, ps.review_count, ps.photo_count, ps.last_reviewed_at"
+        stats_join = "LEFT JOIN place_stats ps ON ps.place_id = p.id"
+        changed_expr = "GREATEST(p.updated_at, ps.updated_at)"
+        stats_changed = f"UNION SELECT place_id FROM place_stats WHERE {_RANGE_SQL.format(col='updated_at')}"
+        stats_wm = "(SELECT MAX(updated_at) FROM place_stats)"
+    else:
+        stats_cols = (
+            "NULL::numeric AS avg_overall, 0 AS review_count, 0 AS photo_count, NULL::timestamptz AS last_reviewed_at"
+        )
+        stats_join = ""
+        changed_expr = "p.updated_at"
+        stats_changed = ""
+        stats_wm = "NULL::timestamptz"
+    tombstones_sql = ""
+    tombstones_wm = "NULL::timestamptz"
+    if has_table("place_tombstones"):
+        tombstones_wm = "(SELECT MAX(deleted_at) FROM place_tombstones)"
+    if incremental and has_table("place_tombstones"):
+        # 全件出力（since なし）には削除済みの行を含めない
+        nulls = ", ".join(f"NULL AS {col}" for col in PLACE_COLUMNS)
+        tombstones_sql = f"""
+        UNION ALL
+        SELECT t.place_id AS id, {nulls}, true AS deleted, t.deleted_at AS changed_at
+        FROM place_tombstones t
+        WHERE {_RANGE_SQL.format(col="t.deleted_at")}
+          AND NOT EXISTS (SELECT 1 FROM places WHERE id = t.place_id)
+        """
+    if incremental:
+        changed_cte = f"""
+        WITH changed AS (
+            SELECT id AS place_id FROM places WHERE {_RANGE_SQL.format(col="updated_at")}
+            {stats_changed}
+        )"""
+        changed_join = "JOIN changed ch ON ch.place_id = p.id"
+        order_sql = "ORDER BY changed_at, id"
+    else:
+        # 全件出力は主キー順（並べ替えなしで名前付きカーソル / COPY から流せる）
+        changed_cte = ""
+        changed_join = ""
+        order_sql = "ORDER BY id"
+    sql = f"""
+        {changed_cte}
+        SELECT * FROM (
+            SELECT p.id, p.name, p.kana, c.code AS category, p.description, p.address, p.phone,
+                   p.website_url, p.price_range, p.opening_hours_json, p.lat, p.lng,
+                   p.google_place_id, p.data_source, p.manual_lock,
+                   COALESCE((
+                     SELECT jsonb_agg(jsonb_build_object('code', f.code, 'value', pf.value, 'detail', pf.detail) ORDER BY f.code)
+                     FROM place_features pf
+                     JOIN features f ON f.id = pf.feature_id
+                     WHERE pf.place_id = p.id
+                   ), '[]'::jsonb) AS features,
+                   {stats_cols},
+                   p.created_at, p.updated_at,
+                   false AS deleted, {changed_expr} AS changed_at
+            FROM places p
+            {changed_join}
+            JOIN categories c ON c.id = p.category_id
+            {stats_join}
+            {tombstones_sql}
+        ) AS x
+        {order_sql}
+    """
+    return sql, f"SELECT GREATEST((SELECT MAX(updated_at) FROM places), {stats_wm}, {tombstones_wm})"
+
+
+def _reviews_sql(incremental: bool = False) -> tuple[str, str]:
+    # public でなくなったレビューも受け手が削除できるよう出力する（内容は出さない）
+    sql = f"""
+        SELECT r.id, r.place_id, r.user_id,
+               CASE WHEN r.status = 'public' THEN r.overall END AS overall,
+               ab.code AS age_band,
+               CASE WHEN r.status = 'public' THEN r.stay_minutes END AS stay_minutes,
+               CASE WHEN r.status = 'public' THEN r.revisit_intent END AS revisit_intent,
+               CASE WHEN r.status = 'public' THEN r.text END AS text,
+               CASE WHEN r.status = 'public' THEN COALESCE((
+                 SELECT jsonb_object_agg(ra.code, rs.score)
+                 FROM review_scores rs
+                 JOIN review_axes ra ON ra.id = rs.axis_id
+                 WHERE rs.review_id = r.id
+               ), '{{}}'::jsonb) END AS axes,
+               r.status <> 'public' AS deleted,
+               r.created_at, r.updated_at
+        FROM reviews r
+        LEFT JOIN age_bands ab ON ab.id = r.age_band_id
+        WHERE (r.status = 'public' OR %(since)s::timestamptz IS NOT NULL)
+          AND {_RANGE_SQL.format(col="r.updated_at")}
+        ORDER BY r.updated_at, r.id
+    """
+    return sql, "SELECT MAX(updated_at) FROM reviews"
+
+
+_DATASET_SQL = {
+    "places": _places_sql,
+    "reviews": _reviews_sql,
+}
+
+
+def current_watermark(dataset: str) -> datetime | None:
+    """出力の上限となる changed_at（次回の since に使う値）を返す。"""
+    _, watermark_sql = _DATASET_SQL[dataset]()
+    with connection.cursor() as cur:
+        cur.execute(watermark_sql)
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _params(since: datetime | None, until: datetime | None) -> dict:
+    return {"since": since, "until": until, "overlap_s": float(conf()["OVERLAP_S"])}
+
+
+def iter_ndjson(dataset: str, since: datetime | None, until: datetime | None) -> Iterator[bytes]:
+    """名前付きカーソルで 1 行 1 JSON を返す。"""
+    sql, _ = _DATASET_SQL[dataset](incremental=since is not None)
+    params = _params(since, until)
+    # トランザクション内で宣言し、WITH HOLD による結果全体の実体化を避ける
+    with transaction.atomic(), connection.chunked_cursor() as cur:
+        cur.cursor.itersize = ITERSIZE
+        cur.execute(f"SELECT row_to_json(t)::text FROM ({sql}) AS t", params)
+        for (line,) in cur:
+            yield line.encode("utf-8") + b"\n"
+
+
+class _QueueWriter:
+    """copy_expert の書き込み先。容量制限付きキューへ渡し、読み手が止まれば COPY を中断する。"""
+
+    def __init__(self, chunks: queue.Queue, stop: threading.Event):
+        self.chunks = chunks
+        self.stop = stop
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        while True:
+            if self.stop.is_set():
+                raise IOError("export consumer went away")
+            try:
+                self.chunks.put(data, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+
+_DONE = object()
+
+
+def iter_csv(dataset: str, since: datetime | None, until: datetime | None) -> Iterator[bytes]:
+    """COPY (...) TO STDOUT WITH CSV HEADER の出力を逐次返す。"""
+    sql, _ = _DATASET_SQL[dataset](incremental=since is not None)
+    chunks: queue.Queue = queue.Queue(maxsize=COPY_QUEUE_SIZE)
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def run():
+        # 別スレッドでは Django がスレッド専用の接続を開くため、終了時に明示的に閉じる
+        try:
+            with connection.cursor() as cur:
+                query = cur.mogrify(sql, _params(since, until))
+                if isinstance(query, bytes):
+                    query = query.decode("utf-8")
+                cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", _QueueWriter(chunks, stop))
+        except BaseException as exc:  # 読み手側へ伝播させる
+            if not stop.is_set():
+                errors.append(exc)
+        finally:
+            connection.close()
+            while True:
+                try:
+                    chunks.put(_DONE, timeout=1.0)
+                    break
+                except queue.Full:
+                    if stop.is_set():
+                        break
+
+    worker = threading.Thread(target=run, name=f"export-{dataset}", daemon=True)
+    worker.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+
+
+def iter_export(dataset: str, fmt: str, since: datetime | None, until: datetime | None) -> Iterator[bytes]:
+    if fmt == "csv":
+        return iter_csv(dataset, since, until)
+    return iter_ndjson(dataset, since, until)
+
+
+def gzip_chunks(chunks: Iterator[bytes], level: int = 6) -> Iterator[bytes]:
+    """チャンク列を gzip ストリームに変換する（全体をバッファしない）。"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
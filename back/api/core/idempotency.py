@@ -0,0 +1,221 @@
+"""POST の冪等化（Idempotency-Key ヘッダ）。
+
+- (ユーザー, キー) ごとに最初の応答（ステータス + 本文）を idempotency_keys に保存し、同じキーの再送には
+  保存済みの応答をそのまま返す（`Idempotent-Replayed: true`）。再送は主キー検索 1 回で終わる。
+  - 本文はレンダラと同じ core.renderers.dumps で直列化して json 列（書いたとおりの文字列）に保存するため、
+    再送の本文は最初の応答とバイト単位で同じになる（日時の小数部もマイクロ秒のまま）。
+- 同じキーの同時リクエストは PostgreSQL の advisory lock で直列化する。後着は先着の完了を待ち
+  （最大 IDEMPOTENCY['WAIT_S'] 秒。超えたら 409 CONFLICT）、保存された応答を返す。
+- ビュー本体と応答の保存は 1 トランザクションで行うため、書き込みだけ成功して応答が残らないことはない。
+- 5xx / 409 / 429 の応答は保存しない（再送で処理をやり直せる）。
+- 同じキーを別内容（メソッド・パス・本文のハッシュが異なる）に使うと 422 VALIDATION_ERROR。
+- 期限切れ（TTL_HOURS）の行は参照されず、同じキーの再利用時に上書きされる。保存時に PRUNE_PROBABILITY の
+  確率で期限切れ行を PRUNE_BATCH 件ずつ削除する。
+- Idempotency-Key が無いリクエスト・未認証・idempotency_keys 未作成の環境ではそのままビューを実行する。
+"""
+import functools
+import hashlib
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from rest_framework.response import Response
+
+from core.exceptions import error_response
+from core.renderers import dumps
+from core.schema import has_table
+
+logger = logging.getLogger("core.idempotency")
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def conf() -> dict:
+    defaults = {
+        "TTL_HOURS": 24,
+        "WAIT_S": 10.0,
+        "PRUNE_PROBABILITY": 0.01,
+        "PRUNE_BATCH": 1000,
+    }
+    return {**defaults, **getattr(settings, "IDEMPOTENCY", {})}
+
+
+def request_fingerprint(request) -> str:
+    """メソッド・パス・本文から再送判定用のハッシュを作る。
+    - request.body は上限（DATA_UPLOAD_MAX_MEMORY_SIZE）があるため、パース済みの request.data を使う。
+    - アップロードファイルは内容をチャンクで読んでハッシュに含め、読み位置を戻す。
+    """
+    h = hashlib.sha256(f"{request.method} {request.path}\n".encode("utf-8"))
+    data = request.data
+    if hasattr(data, "lists"):
+        items = sorted(data.lists(), key=lambda kv: kv[0])
+    else:
+        items = [(None, data)]
+    for name, values in items:
+        h.update(f"{name}\n".encode("utf-8"))
+        for value in values if name is not None else [values]:
+            if hasattr(value, "chunks"):
+                for chunk in value.chunks():
+                    h.update(chunk)
+                value.seek(0)
+            else:
+                h.update(json.dumps(value, sort_keys=True, cls=DjangoJSONEncoder, ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _lock_id(user_id, key: str) -> int:
+    """advisory lock 用の符号付き 64bit 値。"""
+    digest = hashlib.blake2b(f"idem:{user_id}:{key}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _load(user_id, key: str) -> tuple[str, int, object] | None:
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT request_hash, status_code, response_body
+            FROM idempotency_keys
+            WHERE user_id = %s AND idem_key = %s AND expires_at > NOW()
+            """,
+            [user_id, key],
+        )
+        row = cur.fetchone()
+    if row is None:
+        return None
+    body = row[2]
+    if isinstance(body, str):
+        body = json.loads(body)
+    return row[0], int(row[1]), body
+
+
+def _save(user_id, key: str, route: str, request_hash: str, response) -> None:
+    c = conf()
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO idempotency_keys (user_id, idem_key, route, request_hash, status_code, response_body, expires_at)
+            VALUES (%s, %s, %s, %s, %s, %s::json, NOW() + make_interval(hours => %s))
+            ON CONFLICT (user_id, idem_key) DO UPDATE
+            SET route = EXCLUDED.route,
+                request_hash = EXCLUDED.request_hash,
+                status_code = EXCLUDED.status_code,
+                response_body = EXCLUDED.response_body,
+                created_at = NOW(),
+                expires_at = EXCLUDED.expires_at
+            """,
+            [
+                user_id,
+                key,
+                route,
+                request_hash,
+                response.status_code,
+                dumps(response.data).decode("utf-8"),
+                int(c["TTL_HOURS"]),
+            ],
+        )
+
+
+def prune_expired(batch: int | None = None) -> int:
+    """期限切れの行を最大 batch 件削除し、削除件数を返す。"""
+    batch = int(batch or conf()["PRUNE_BATCH"])
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            DELETE FROM idempotency_keys
+            WHERE ctid IN (SELECT ctid FROM idempotency_keys WHERE expires_at <= NOW() LIMIT %s)
+            """,
+            [batch],
+        )
+        return cur.rowcount
+
+
+def _should_store(status_code: int) -> bool:
+    return 200 <= status_code < 500 and status_code not in (409, 429)
+
+
+def _replay(stored: tuple[str, int, object], request_hash: str):
+    stored_hash, status_code, body = stored
+    if stored_hash != request_hash:
+        return error_response(
+            code="VALIDATION_ERROR",
+            message="Idempotency-Key が別の内容のリクエストに使われています",
+            details={"header": HEADER},
+            status_code=422,
+        )
+    return Response(body, status=status_code, headers={"Idempotent-Replayed": "true"})
+
+
+def _acquire(lock_id: int, wait_s: float) -> bool:
+    deadline = time.monotonic() + wait_s
+    with connection.cursor() as cur:
+        while True:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", [lock_id])
+            if cur.fetchone()[0]:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+
+def _release(lock_id: int) -> None:
+    with connection.cursor() as cur:
+        cur.execute("SELECT pg_advisory_unlock(%s)", [lock_id])
+
+
+def idempotent(route: str):
+    """APIView の post に付けるデコレータ。route は保存行に残す識別名（URL名）。"""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            user = getattr(request, "user", None)
+            if not key or user is None or not user.is_authenticated or not has_table("idempotency_keys"):
+                return method(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return error_response(
+                    code="VALIDATION_ERROR",
+                    message=f"Idempotency-Key は {MAX_KEY_LENGTH} 文字以内で指定してください",
+                    details={"header": HEADER},
+                )
+
+            request_hash = request_fingerprint(request)
+            stored = _load(user.pk, key)
+            if stored is not None:
+                return _replay(stored, request_hash)
+
+            c = conf()
+            lock_id = _lock_id(user.pk, key)
+            if not _acquire(lock_id, float(c["WAIT_S"])):
+                return error_response(
+                    code="CONFLICT",
+                    message="同じ Idempotency-Key のリクエストを処理中です",
+                    details={"header": HEADER},
+                    status_code=409,
+                )
+            try:
+                # 待っている間に先着が完了していれば、その応答を返す
+                stored = _load(user.pk, key)
+                if stored is not None:
+                    return _replay(stored, request_hash)
+                with transaction.atomic():
+                    response = method(self, request, *args, **kwargs)
+                    if _should_store(response.status_code):
+                        _save(user.pk, key, route, request_hash, response)
+                if random.random() < float(c["PRUNE_PROBABILITY"]):
+                    try:
+                        prune_expired()
+                    except Exception:
+                        logger.exception("期限切れの Idempotency-Key の削除に失敗しました")
+                return response
+            finally:
+                _release(lock_id)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.stats_audit import FIELDS, run
+
+
+class Command(BaseCommand):
+    help = "place_stats / place_age_band_stats を reviews・photos から集計し直して保存値と比べ、ずれた施設を再計算する（夜間バッチ用）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="並列数（DB 接続数。既定: STATS_AUDIT['WORKERS']）")
+        parser.add_argument("--ranges", type=int, default=None, help="places を分割する範囲の数（既定: WORKERS × RANGES_PER_WORKER）")
+        parser.add_argument("--repair-batch", type=int, default=None, help="1 トランザクションで再計算する施設数")
+        parser.add_argument("--dry-run", action="store_true", help="ずれの件数を報告するだけで修復しない")
+        parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+
+    def handle(self, *args, **options):
+        log = None if options["json"] else self.stdout.write
+        try:
+            result = run(
+                workers=options["workers"],
+                ranges=options["ranges"],
+                repair=not options["dry_run"],
+                repair_batch=options["repair_batch"],
+                log=log,
+            )
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        if options["json"]:
+            self.stdout.write(json.dumps(result, ensure_ascii=False, indent=2))
+            return
+        for name in FIELDS:
+            self.stdout.write(f"{name:<18} {result['fields'][name]:>8}")
+        action = "修復なし（--dry-run）" if result["dry_run"] else f"修復 {result['repaired']} 件"
+        self.stdout.write(
+            f"ずれ {result['drifted']} 件 / {action} / {result['ranges']} 範囲・{result['workers']} 並列 / {result['seconds']}s"
+        )
@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bench import compare_to_baseline, run_benchmark
+
+
+class Command(BaseCommand):
+    help = "検索/詳細/レビュー一覧/レビュー投稿の混合ワークロードを再生し、p50/p95/p99・スループット・クエリ数を計測する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="計測するリクエスト数（ウォームアップを除く）")
+        parser.add_argument("--warmup", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=42, help="ワークロード生成の seed")
+        parser.add_argument("--no-writes", action="store_true", help="レビュー投稿を含めない（読み取りのみ）")
+        parser.add_argument("--output", default=None, help="結果 JSON の出力先（ベースラインとして保存する場合もこれを使う）")
+        parser.add_argument("--baseline", default=None, help="比較するベースライン JSON")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="p95 の許容悪化率（0.2 = 20%%）")
+
+    def handle(self, *args, **options):
+        try:
+            result = run_benchmark(
+                requests=options["requests"],
+                seed=options["seed"],
+                warmup=options["warmup"],
+                include_writes=not options["no_writes"],
+            )
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(f"{'endpoint':<20} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'q/req':>6} {'err':>4}")
+        for name, row in result["endpoints"].items():
+            self.stdout.write(
+                f"{name:<20} {row['count']:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} "
+                f"{row['p99_ms']:>9.2f} {row['queries_per_request']:>6.2f} {row['errors']:>4}"
+            )
+        self.stdout.write(f"throughput: {result['overall']['throughput_rps']} req/s")
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                baseline = json.load(f)
+            regressions = compare_to_baseline(result, baseline, options["tolerance"])
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(f"REGRESSION {line}")
+                raise CommandError(f"{len(regressions)} 件の回帰を検出しました")
+            self.stdout.write("ベースラインとの比較: 回帰なし")
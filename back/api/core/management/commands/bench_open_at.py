@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bench import bench_open_at
+
+
+class Command(BaseCommand):
+    help = "合成データ上で open_at（営業中）フィルタの有無による施設検索 SQL のレイテンシを比較し、使われる索引を表示する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=500, help="計測する検索の回数（それぞれ open_at なし/ありで実行）")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--radius-m", type=float, default=3000.0)
+        parser.add_argument("--sort", default="distance", choices=["distance", "score", "reviews", "new", "relevance"])
+        parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+
+    def handle(self, *args, **options):
+        try:
+            result = bench_open_at(
+                queries=options["queries"], seed=options["seed"], radius_m=options["radius_m"], sort=options["sort"]
+            )
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        if options["json"]:
+            self.stdout.write(json.dumps(result, ensure_ascii=False, indent=2))
+            return
+        self.stdout.write(f"places: {result['places']}（営業時間あり {result['places_with_hours']}）")
+        self.stdout.write(f"{'filter':<10} {'mean_ms':>10} {'p50_ms':>10} {'p95_ms':>10} {'items':>7}")
+        for name, row in result["results"].items():
+            self.stdout.write(
+                f"{name:<10} {row['mean_ms']:>10} {row['p50_ms']:>10} {row['p95_ms']:>10} {row['items_per_query']:>7}"
+            )
+        self.stdout.write(f"索引: {', '.join(result['plan_indexes']) or '（なし）'}")
@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.bench import bench_renderers
+
+
+class Command(BaseCommand):
+    help = "検索 1 ページ分の JSON レンダリング CPU 時間を DRF 標準の JSONRenderer と FastJSONRenderer で比較する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=2000, help="計測回数")
+        parser.add_argument("--items", type=int, default=50, help="1 ページの件数")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+
+    def handle(self, *args, **options):
+        result = bench_renderers(pages=options["pages"], items=options["items"], seed=options["seed"])
+        if options["json"]:
+            self.stdout.write(json.dumps(result, ensure_ascii=False, indent=2))
+            return
+        self.stdout.write(f"{'renderer':<12} {'bytes':>8} {'mean_us':>10} {'p50_us':>10} {'p95_us':>10}")
+        for name, row in result["renderers"].items():
+            self.stdout.write(f"{name:<12} {row['bytes']:>8} {row['mean_us']:>10} {row['p50_us']:>10} {row['p95_us']:>10}")
+        self.stdout.write(f"speedup: x{result['speedup']}")
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bench import SIZES, generate_dataset, reset_dataset
+
+
+class Command(BaseCommand):
+    help = "ベンチマーク用の合成データ（places/features/reviews/photos）を決定的な seed で生成する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", default="10k", help="施設数（10k / 100k / 1m または整数）")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--reviews-per-place", type=float, default=2.0, help="施設あたりの平均レビュー数")
+        parser.add_argument("--photos-per-place", type=float, default=0.5, help="施設あたりの平均写真数")
+        parser.add_argument("--users", type=int, default=1000, help="レビュー投稿者として使うベンチ用ユーザー数")
+        parser.add_argument("--reset", action="store_true", help="既存の合成データを削除してから生成する")
+
+    def handle(self, *args, **options):
+        size = options["size"].lower()
+        try:
+            count = SIZES[size] if size in SIZES else int(size)
+        except ValueError:
+            raise CommandError("--size は 10k / 100k / 1m または整数で指定してください")
+
+        if options["reset"]:
+            self.stdout.write("既存の合成データを削除します")
+            reset_dataset()
+
+        counts = generate_dataset(
+            count,
+            seed=options["seed"],
+            reviews_per_place=options["reviews_per_place"],
+            photos_per_place=options["photos_per_place"],
+            users=options["users"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(" ".join(f"{k}={v}" for k, v in counts.items()))
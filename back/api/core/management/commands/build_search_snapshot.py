@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.search_index import conf, content_digest, current_digest, np, write_snapshot
+from core.search_index import index as search_index
+
+
+class Command(BaseCommand):
+    help = "検索用スナップショット（列ごとの .npy）を書き出し、ワーカーが mmap する current を差し替える"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="終了せずに一定間隔で差分更新と書き出しを繰り返す")
+        parser.add_argument("--interval", type=float, default=None, help="--loop の間隔（秒。既定: REFRESH_INTERVAL_S）")
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("NumPy がインストールされていません")
+        interval = options["interval"] or float(conf()["REFRESH_INTERVAL_S"])
+        published = current_digest()
+        while True:
+            started = time.monotonic()
+            snapshot = search_index.refresh()
+            # 内容が current と同じなら書き出さない（ワーカーの開き直しを避ける）。
+            # 透かしや件数では、カテゴリ名・search_rank_prior・特徴だけの変更を検知できない
+            digest = content_digest(snapshot)
+            if digest != published:
+                path = write_snapshot(snapshot, digest=digest)
+                published = digest
+                self.stdout.write(f"wrote {path} ({len(snapshot)} places, {time.monotonic() - started:.2f}s)")
+            if not options["loop"]:
+                return
+            connection.close()
+            time.sleep(interval)
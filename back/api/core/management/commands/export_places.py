@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from core.export import DATASETS, FORMATS, current_watermark, gzip_chunks, iter_export
+
+
+class Command(BaseCommand):
+    help = "施設/レビューを NDJSON または CSV でストリーム出力する（--since で差分出力）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("dataset", nargs="?", choices=DATASETS, default="places")
+        parser.add_argument("--format", choices=FORMATS, default="ndjson")
+        parser.add_argument("--since", default=None, help="この時刻以降に変わった行のみ出力（ISO 8601。EXPORT['OVERLAP_S'] 秒さかのぼる）")
+        parser.add_argument("--output", "-o", default="-", help="出力先ファイル（既定: 標準出力）")
+        parser.add_argument("--gzip", action="store_true", help="gzip 圧縮して出力する")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_datetime(options["since"])
+            if since is None:
+                raise CommandError("--since must be an ISO 8601 datetime")
+
+        until = current_watermark(options["dataset"])
+        chunks = iter_export(options["dataset"], options["format"], since, until)
+        if options["gzip"]:
+            chunks = gzip_chunks(chunks)
+
+        out = sys.stdout.buffer if options["output"] == "-" else open(options["output"], "wb")
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        # 次回の差分出力に使う透かしは標準エラーへ（標準出力はデータ専用）
+        self.stderr.write(f"watermark={until.isoformat() if until else ''}")
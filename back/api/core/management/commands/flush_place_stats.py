@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import metrics
+from core.stats_flusher import conf, flush_all
+
+
+class Command(BaseCommand):
+    help = "place_stats の再計算待ち（place_stats_dirty）をまとめて再計算する（PLACE_STATS['MODE']='write_behind' 用）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="終了せずに一定間隔で繰り返す")
+        parser.add_argument("--interval", type=float, default=None, help="--loop の間隔（秒。既定: FLUSH_INTERVAL_S）")
+        parser.add_argument("--batch-size", type=int, default=None, help="1 トランザクションで再計算する施設数（既定: BATCH_SIZE）")
+
+    def handle(self, *args, **options):
+        interval = options["interval"] or float(conf()["FLUSH_INTERVAL_S"])
+        while True:
+            started = time.monotonic()
+            flushed = flush_all(options["batch_size"])
+            if flushed:
+                self.stdout.write(f"flushed {flushed} places ({time.monotonic() - started:.2f}s)")
+            metrics.registry.maybe_flush()
+            if not options["loop"]:
+                return
+            # 処理にかかった分を差し引き、1 施設の再計算が 1 間隔に高々 1 回になるようにする
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+            if not connection.is_usable():
+                connection.close()
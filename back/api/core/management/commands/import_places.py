@@ -0,0 +1,59 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.place_import import import_places
+
+
+class Command(BaseCommand):
+    help = "CSV / NDJSON の施設データを COPY でステージングへ取り込み、places / place_features へ一括 upsert する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="入力ファイル（- で標準入力）")
+        parser.add_argument("--format", choices=["csv", "ndjson"], default=None, help="入力形式（既定: 拡張子から判定）")
+        parser.add_argument("--rejects", default=None, help="棄却行を NDJSON で書き出すファイル")
+        parser.add_argument(
+            "--defer-indexes",
+            action="store_true",
+            help="取込中は places の二次インデックスを外し、完了後に CONCURRENTLY で再作成する"
+            "（取込中の検索は索引なしになるため、メンテナンス時間帯向け）",
+        )
+        parser.add_argument("--no-stats", action="store_true", help="place_stats の再計算を行わない")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"]
+        if fmt is None:
+            if path.endswith(".csv"):
+                fmt = "csv"
+            elif path.endswith((".ndjson", ".jsonl")):
+                fmt = "ndjson"
+            else:
+                raise CommandError("--format を指定してください（csv / ndjson）")
+
+        rejects_file = open(options["rejects"], "w", encoding="utf-8") if options["rejects"] else None
+
+        def on_reject(line_no: int, reason: str):
+            if rejects_file:
+                rejects_file.write(json.dumps({"line": line_no, "reason": reason}, ensure_ascii=False) + "\n")
+
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+        try:
+            report = import_places(
+                stream,
+                fmt,
+                defer_indexes=options["defer_indexes"],
+                refresh_stats=not options["no_stats"],
+                on_reject=on_reject,
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if rejects_file:
+                rejects_file.close()
+
+        self.stdout.write(
+            "read={read} staged={staged} rejected={rejected} inserted={inserted} updated={updated} "
+            "skipped_locked={skipped_locked} features={features} elapsed={elapsed_s}s rows/s={rows_per_s}".format(**report)
+        )
@@ -0,0 +1,68 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import token_maintenance
+from core.token_maintenance import PERIODS, conf
+
+
+def _format_sizes(sizes: dict) -> str:
+    return ", ".join(
+        f"{table}: {row['bytes'] / 1024 / 1024:.1f}MB ~{row['rows_estimate']} rows"
+        + (f" ({row['partitions']} partitions)" if row["partitions"] else "")
+        for table, row in sizes.items()
+    )
+
+
+class Command(BaseCommand):
+    help = "JWT ブラックリストの期限切れトークンをバッチ削除する（パーティション構成なら期限切れパーティションを DROP）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="1 トランザクションで削除する件数（既定: TOKEN_PRUNE['BATCH_SIZE']）")
+        parser.add_argument("--sleep", type=float, default=None, help="バッチ間の待ち秒数（既定: TOKEN_PRUNE['SLEEP_S']）")
+        parser.add_argument("--max-batches", type=int, default=None, help="1 回の実行で処理するバッチ数の上限")
+        parser.add_argument("--loop", action="store_true", help="終了せずに一定間隔で繰り返す")
+        parser.add_argument("--interval", type=float, default=3600.0, help="--loop の間隔（秒）")
+        parser.add_argument(
+            "--convert-partitioned",
+            action="store_true",
+            help="テーブルを時間パーティション構成へ作り替えてから掃除する（一度だけ。実行中は認証が待たされる）",
+        )
+        parser.add_argument("--period", choices=sorted(PERIODS), default=None, help="パーティションの期間（既定: TOKEN_PRUNE['PARTITION_PERIOD']）")
+        parser.add_argument("--json", action="store_true", help="結果を JSON で出力する")
+
+    def handle(self, *args, **options):
+        c = conf()
+        if options["convert_partitioned"]:
+            period = options["period"] or c["PARTITION_PERIOD"]
+            if period not in PERIODS:
+                raise CommandError(f"period は {', '.join(PERIODS)} のいずれかです")
+            moved = token_maintenance.convert_to_partitioned(period, int(c["PARTITIONS_AHEAD"]))
+            self.stdout.write(f"converted to partitioned layout ({period}): kept {moved['outstanding']} outstanding, {moved['blacklisted']} blacklisted")
+
+        while True:
+            started = time.monotonic()
+            before = token_maintenance.table_sizes()
+            result = token_maintenance.run(
+                batch_size=options["batch_size"],
+                sleep_s=options["sleep"],
+                max_batches=options["max_batches"],
+            )
+            after = token_maintenance.table_sizes()
+            elapsed = time.monotonic() - started
+            if options["json"]:
+                self.stdout.write(json.dumps({**result, "before": before, "after": after, "elapsed_s": round(elapsed, 2)}, ensure_ascii=False))
+            else:
+                self.stdout.write(f"before: {_format_sizes(before)}")
+                for name in result["created_partitions"]:
+                    self.stdout.write(f"created partition {name}")
+                for name in result["dropped_partitions"]:
+                    self.stdout.write(f"dropped partition {name}")
+                self.stdout.write(f"deleted {result['deleted_rows']} rows in {elapsed:.2f}s")
+                self.stdout.write(f"after:  {_format_sizes(after)}")
+            if not options["loop"]:
+                return
+            connection.close()
+            time.sleep(options["interval"])
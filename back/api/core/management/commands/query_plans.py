@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+
+from core.query_plans import STORES, conf, format_plan, load_plan, prune, worst_shapes
+
+ORDERS = ("p95", "max", "avg", "total", "count")
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN サンプルをクエリの形ごとに集計し、遅い順に実行計画とともに表示する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=24.0, help="集計対象の期間（直近 N 時間）")
+        parser.add_argument("--limit", type=int, default=10)
+        parser.add_argument("--order", choices=ORDERS, default="p95")
+        parser.add_argument("--no-plans", action="store_true", help="実行計画を表示しない（一覧のみ）")
+        parser.add_argument("--store", choices=STORES, default=None, help="既定は QUERY_PLANS['STORE']")
+        parser.add_argument("--prune-days", type=float, default=None, help="指定日数より古いサンプルを削除して終了")
+
+    def handle(self, *args, **options):
+        store = options["store"] or conf()["STORE"]
+
+        if options["prune_days"] is not None:
+            removed = prune(timedelta(days=options["prune_days"]), store)
+            self.stdout.write(f"pruned {removed} samples")
+            return
+
+        since = datetime.now(timezone.utc) - timedelta(hours=options["hours"])
+        shapes = worst_shapes(since, store, order=options["order"], limit=options["limit"])
+        if not shapes:
+            self.stdout.write("no samples")
+            return
+
+        for rank, shape in enumerate(shapes, 1):
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    f"#{rank} {shape['fingerprint']}  n={shape['count']} (slow={shape['slow']})  "
+                    f"avg={shape['avg']:.1f}ms p95={shape['p95']:.1f}ms max={shape['max']:.1f}ms "
+                    f"total={shape['total']:.0f}ms"
+                )
+            )
+            if shape["routes"]:
+                self.stdout.write(f"  routes: {', '.join(shape['routes'])}")
+            self.stdout.write(f"  {shape['query'][:500]}")
+            if options["no_plans"]:
+                continue
+            plan = load_plan(shape["worst_sample_id"], store)
+            if plan:
+                self.stdout.write("  plan (slowest sample):")
+                for line in format_plan(plan, depth=2):
+                    self.stdout.write(line)
+            self.stdout.write("")
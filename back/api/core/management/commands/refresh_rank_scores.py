@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.ranking import refresh_rank_scores
+
+
+class Command(BaseCommand):
+    help = "ベイズ平均の全体平均を再計算し、検索 sort=score/reviews 用の place_rank を更新する（夜間バッチ想定）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--weight", type=float, default=None, help="事前分布の重み（既定: SEARCH_RANKING['PRIOR_WEIGHT']）")
+
+    def handle(self, *args, **options):
+        result = refresh_rank_scores(options["weight"])
+        self.stdout.write(f"mean={result['mean']:.3f} weight={result['weight']:g} updated={result['updated']}")
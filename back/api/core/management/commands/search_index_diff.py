@@ -0,0 +1,73 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bench import RADII, SEARCH_SORTS
+from core.search_index import load_full, np
+from core.views import search_places_sql
+
+# SQL（ST_Distance）とメモリ内（楕円体の局所近似）の距離の許容差
+DISTANCE_TOLERANCE_M = 1.0
+
+
+class Command(BaseCommand):
+    help = "メモリ内検索インデックスと SQL 検索の結果を無作為な条件で比較し、差分を表示する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--verbose", action="store_true", help="差分のあった条件をすべて表示する")
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError("NumPy がインストールされていません")
+        snapshot = load_full()
+        if not len(snapshot):
+            raise CommandError("places が空です")
+        self.stdout.write(f"snapshot: {len(snapshot)} places")
+
+        rng = random.Random(options["seed"])
+        cols = snapshot.columns
+        mismatches = boundary = 0
+        max_distance_diff = 0.0
+        for n in range(options["queries"]):
+            i = rng.randrange(len(snapshot))
+            args = {
+                "lat": round(float(cols["lat"][i]) + rng.uniform(-0.01, 0.01), 5),
+                "lng": round(float(cols["lng"][i]) + rng.uniform(-0.01, 0.01), 5),
+                "radius_m": float(rng.choice(RADII)),
+                "limit": options["limit"],
+                "offset": rng.choice([0, 0, 0, options["limit"]]),
+                "sort": rng.choice(SEARCH_SORTS),
+                "category": rng.choice([None, None, None, *[code for code, _ in snapshot.categories]]),
+                "features_list": rng.sample(snapshot.feature_codes, k=1) if snapshot.feature_codes and rng.random() < 0.3 else [],
+            }
+            memory = snapshot.search(**args)
+            sql = search_places_sql(**args)
+
+            sql_dist = {item["id"]: item["location"]["distance_m"] for item in sql}
+            for item in memory:
+                if item["id"] in sql_dist:
+                    max_distance_diff = max(max_distance_diff, abs(item["location"]["distance_m"] - sql_dist[item["id"]]))
+            if [item["id"] for item in memory] == [item["id"] for item in sql]:
+                continue
+
+            # 差分が半径の境界付近の施設だけなら距離計算の誤差として扱う
+            differing = {item["id"]: item for item in memory + sql}
+            only = set(item["id"] for item in memory) ^ set(item["id"] for item in sql)
+            if only and all(abs(differing[pid]["location"]["distance_m"] - args["radius_m"]) <= DISTANCE_TOLERANCE_M for pid in only):
+                boundary += 1
+                continue
+            mismatches += 1
+            if options["verbose"] or mismatches <= 5:
+                self.stdout.write(self.style.WARNING(f"#{n} {args}"))
+                self.stdout.write(f"  memory: {[item['id'][:8] for item in memory]}")
+                self.stdout.write(f"  sql:    {[item['id'][:8] for item in sql]}")
+
+        self.stdout.write(
+            f"queries={options['queries']} mismatches={mismatches} boundary_only={boundary} "
+            f"max_distance_diff_m={max_distance_diff:.3f}"
+        )
+        if mismatches:
+            raise CommandError(f"{mismatches} 件の条件で結果が一致しませんでした")
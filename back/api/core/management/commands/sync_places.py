@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.sync import run_batch, sync_settings
+
+
+class Command(BaseCommand):
+    help = "place_sync_jobs のキューを処理し、外部プロバイダから施設情報を同期する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="1 回に取得するジョブ数（既定: PLACE_SYNC['BATCH_SIZE']）")
+        parser.add_argument("--concurrency", type=int, default=None, help="HTTP 同時実行数（既定: PLACE_SYNC['CONCURRENCY']）")
+        parser.add_argument("--loop", action="store_true", help="キューが空になっても終了せず待機し続ける")
+        parser.add_argument("--interval", type=float, default=10.0, help="--loop 時、キューが空の場合の待機秒数")
+
+    def handle(self, *args, **options):
+        conf = sync_settings()
+        batch_size = options["batch_size"] or conf["BATCH_SIZE"]
+        concurrency = options["concurrency"] or conf["CONCURRENCY"]
+        while True:
+            started = time.monotonic()
+            counts = run_batch(batch_size=batch_size, concurrency=concurrency)
+            if counts["claimed"]:
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"claimed={counts['claimed']} updated={counts['updated']} "
+                    f"not_modified={counts['not_modified']} failed={counts['failed']} elapsed={elapsed:.2f}s"
+                )
+                continue
+            if not options["loop"]:
+                self.stdout.write("queue is empty")
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,289 @@
+"""Prometheus テキスト形式のメトリクス（外部ライブラリなし）。
+
+- 各プロセスはメモリ上のレジストリへ加算するだけ（ロック 1 回 + dict 更新）で、要求処理のオーバーヘッドは数µs。
+- METRICS['MULTIPROC_DIR'] を設定すると、各プロセスが最大 FLUSH_INTERVAL 秒に 1 回
+  `<dir>/metrics_<pid>.json` へ状態を書き出し、/metrics は全ファイルを合算して返す（prefork 対応）。
+  - counter / histogram: 終了済みプロセスの値も含めて合算（単調増加を保つ）
+  - gauge: 生存しているプロセスの値のみ合算
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# 秒単位のレイテンシ用バケット
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# メトリクス名 → (種別, 説明)
+METRICS = {
+    "http_requests_total": (COUNTER, "HTTP リクエスト数（URL名/メソッド/ステータス別）"),
+    "http_request_duration_seconds": (HISTOGRAM, "HTTP リクエストの処理時間（URL名別）"),
+    "http_request_db_seconds": (HISTOGRAM, "1 リクエスト内の DB 時間の合計（URL名別）"),
+    "db_queries_total": (COUNTER, "実行した SQL 数（URL名別）"),
+    "db_connections_open": (GAUGE, "開いている DB 接続数（全ワーカー合計）"),
+    "cache_requests_total": (COUNTER, "キャッシュ参照数（cache/result=hit|miss 別）"),
+    "image_processing_in_progress": (GAUGE, "処理中の画像（リサイズ/EXIF 処理）の数"),
+    "rate_limited_total": (COUNTER, "レート制限で拒否したリクエスト数（URL名別）"),
+    "password_hashing_in_progress": (GAUGE, "計算中のパスワードハッシュの数"),
+    "password_hashing_rejected_total": (COUNTER, "空き待ちが WAIT_S を超えて拒否したパスワードハッシュ計算の数"),
+    "place_stats_dirty_places": (GAUGE, "place_stats の再計算待ち（dirty）の施設数"),
+    "place_stats_lag_seconds": (GAUGE, "最も古い再計算待ちの経過秒数（レビュー書き込みから place_stats 反映までの遅れ）"),
+    "place_stats_flushed_total": (COUNTER, "フラッシャーが place_stats を再計算した施設数"),
+    "place_stats_flush_lag_seconds": (HISTOGRAM, "再計算時点での、最初の書き込みからの経過秒数（施設ごと）"),
+}
+
+
+def _conf() -> dict:
+    return getattr(settings, "METRICS", {})
+
+
+def _key(name: str, labels: dict | None) -> tuple:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+# スクレイプ時に値を計算するゲージ（DB の状態など。プロセス間で合算せず、計算した値をそのまま出す）
+_collectors: list = []
+
+
+def register_collector(func) -> None:
+    """func() は [(メトリクス名, ラベル dict, 値), ...] を返す。/metrics の生成ごとに呼ばれる。"""
+    if func not in _collectors:
+        _collectors.append(func)
+
+
+class Registry:
+    """プロセス内のメトリクス保持。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._last_flush = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.counters: dict[tuple, float] = {}
+        self.gauges: dict[tuple, float] = {}
+        # histogram: key → [バケット別件数..., +Inf件数, 合計]
+        self.histograms: dict[tuple, list[float]] = {}
+
+    def _check_fork(self):
+        # fork 後の子プロセスが親の値を二重計上しないよう初期化する
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._last_flush = 0.0
+            self._reset()
+
+    def inc(self, name: str, labels: dict | None = None, value: float = 1.0) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._check_fork()
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, labels: dict | None = None) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._check_fork()
+            self.gauges[key] = float(value)
+
+    def add_gauge(self, name: str, delta: float, labels: dict | None = None) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._check_fork()
+            self.gauges[key] = self.gauges.get(key, 0.0) + delta
+
+    def observe(self, name: str, value: float, labels: dict | None = None, buckets=DEFAULT_BUCKETS) -> None:
+        key = _key(name, labels)
+        idx = bisect.bisect_left(buckets, value)
+        with self._lock:
+            self._check_fork()
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0.0] * (len(buckets) + 2)
+            h[idx] += 1
+            h[-1] += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._check_fork()
+            return {
+                "pid": self._pid,
+                "counters": [[k[0], list(k[1]), v] for k, v in self.counters.items()],
+                "gauges": [[k[0], list(k[1]), v] for k, v in self.gauges.items()],
+                "histograms": [[k[0], list(k[1]), list(v)] for k, v in self.histograms.items()],
+            }
+
+    def maybe_flush(self, force: bool = False) -> None:
+        """マルチプロセス用ディレクトリへ状態を書き出す（FLUSH_INTERVAL 秒に 1 回まで）。"""
+        directory = _conf().get("MULTIPROC_DIR")
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < float(_conf().get("FLUSH_INTERVAL", 1.0)):
+            return
+        self._last_flush = now
+        data = self.snapshot()
+        path = Path(directory) / f"metrics_{data['pid']}.json"
+        tmp = path.with_suffix(".tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+registry = Registry()
+
+
+def inc(name: str, labels: dict | None = None, value: float = 1.0) -> None:
+    registry.inc(name, labels, value)
+
+
+def set_gauge(name: str, value: float, labels: dict | None = None) -> None:
+    registry.set_gauge(name, value, labels)
+
+
+def observe(name: str, value: float, labels: dict | None = None) -> None:
+    registry.observe(name, value, labels)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """キャッシュのヒット/ミスを記録する。"""
+    registry.inc("cache_requests_total", {"cache": cache, "result": "hit" if hit else "miss"})
+
+
+@contextmanager
+def track_in_progress(name: str, labels: dict | None = None):
+    """処理中件数のゲージを増減させる（例: 画像処理のキュー深さ）。"""
+    registry.add_gauge(name, 1, labels)
+    try:
+        yield
+    finally:
+        registry.add_gauge(name, -1, labels)
+
+
+def observe_request(route: str, method: str, status: int, total_s: float, db_s: float, queries: int) -> None:
+    """RequestMetricsMiddleware から 1 リクエストごとに呼ばれる。"""
+    labels = {"route": route}
+    registry.inc("http_requests_total", {"route": route, "method": method, "status": str(status)})
+    registry.observe("http_request_duration_seconds", total_s, labels)
+    registry.observe("http_request_db_seconds", db_s, labels)
+    if queries:
+        registry.inc("db_queries_total", labels, queries)
+    _update_db_gauge()
+    registry.maybe_flush()
+
+
+def _update_db_gauge() -> None:
+    from django.db import connections
+
+    registry.set_gauge("db_connections_open", sum(1 for c in connections.all(initialized_only=True) if c.connection is not None))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _collect_snapshots() -> list[dict]:
+    directory = _conf().get("MULTIPROC_DIR")
+    if not directory:
+        return [registry.snapshot()]
+    registry.maybe_flush(force=True)
+    snapshots = []
+    for path in Path(directory).glob("metrics_*.json"):
+        try:
+            snapshots.append(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _merge(snapshots: list[dict]) -> tuple[dict, dict, dict]:
+    counters: dict[tuple, float] = {}
+    gauges: dict[tuple, float] = {}
+    histograms: dict[tuple, list[float]] = {}
+    own_pid = os.getpid()
+    for snap in snapshots:
+        for name, labels, value in snap.get("counters", []):
+            key = (name, tuple(tuple(x) for x in labels))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, values in snap.get("histograms", []):
+            key = (name, tuple(tuple(x) for x in labels))
+            if key in histograms and len(histograms[key]) == len(values):
+                histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+            else:
+                histograms[key] = list(values)
+        pid = snap.get("pid")
+        if pid == own_pid or (pid and _pid_alive(pid)):
+            for name, labels, value in snap.get("gauges", []):
+                key = (name, tuple(tuple(x) for x in labels))
+                gauges[key] = gauges.get(key, 0.0) + value
+    return counters, gauges, histograms
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels, extra: tuple | None = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _fmt_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_text() -> str:
+    """全プロセス分を合算し、Prometheus テキスト形式（0.0.4）で返す。"""
+    _update_db_gauge()
+    counters, gauges, histograms = _merge(_collect_snapshots())
+    for collector in _collectors:
+        try:
+            for name, labels, value in collector():
+                gauges[_key(name, labels)] = float(value)
+        except Exception:
+            # 計算できない値は出さない（/metrics 自体は失敗させない）
+            continue
+
+    by_name: dict[str, list[str]] = {}
+    for (name, labels), value in sorted(counters.items()):
+        by_name.setdefault(name, []).append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+    for (name, labels), value in sorted(gauges.items()):
+        by_name.setdefault(name, []).append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+    for (name, labels), values in sorted(histograms.items()):
+        lines = by_name.setdefault(name, [])
+        cumulative = 0.0
+        for bound, count in zip(DEFAULT_BUCKETS, values):
+            cumulative += count
+            lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', repr(bound)))} {_fmt_value(cumulative)}")
+        cumulative += values[len(DEFAULT_BUCKETS)]
+        lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {_fmt_value(cumulative)}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {repr(float(values[-1]))}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {_fmt_value(cumulative)}")
+
+    out = []
+    for name in sorted(set(METRICS) | set(by_name)):
+        kind, help_text = METRICS.get(name, (GAUGE, name))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(by_name.get(name, []))
+    return "\n".join(out) + "\n"
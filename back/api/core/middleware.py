@@ -0,0 +1,272 @@
+import gzip
+import hashlib
+import json
+import logging
+import re
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # brotli は任意。無ければ gzip のみ
+    brotli = None
+
+from core import metrics
+from core.exceptions import _new_trace_id, _trace_id_var
+
+logger = logging.getLogger("core.request")
+
+
+class RequestStats:
+    """1 リクエスト分の計測値（クエリ数/DB時間/最遅SQL/レンダリング時間）。"""
+
+    __slots__ = (
+        "trace_id", "started", "query_count", "db_ms", "slowest_ms", "slowest_sql", "render_started", "render_ms", "plans",
+    )
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_sql: str | None = None
+        self.render_started: float | None = None
+        self.render_ms = 0.0
+        # EXPLAIN サンプリングの候補（core.query_plans.PlanCollector。無効時は None）
+        self.plans = None
+
+
+_stats_var: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def current_request_stats() -> RequestStats | None:
+    return _stats_var.get()
+
+
+_WS_RE = re.compile(r"\s+")
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*(?:%s\s*,\s*)+%s\s*\)")
+
+
+def sql_fingerprint(sql: str) -> tuple[str, str]:
+    """SQL を正規化（空白の圧縮・リテラル/IN リストの置換）し、(ハッシュ, 正規化SQL) を返す。"""
+    normalized = _WS_RE.sub(" ", sql).strip()
+    normalized = _LITERAL_RE.sub("?", normalized)
+    normalized = _IN_LIST_RE.sub("(...)", normalized)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12], normalized
+
+
+def _db_execute_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper 用フック。実行時間を現在のリクエストへ加算する。"""
+    stats = _stats_var.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = (time.perf_counter() - t0) * 1000.0
+        stats.query_count += 1
+        stats.db_ms += elapsed
+        if elapsed > stats.slowest_ms:
+            stats.slowest_ms = elapsed
+            stats.slowest_sql = sql
+        if stats.plans is not None:
+            stats.plans.offer(sql, params, many, elapsed)
+
+
+class RequestMetricsMiddleware:
+    """リクエスト単位でクエリ数・DB時間・最遅SQL・レンダリング時間を計測する。
+    - Server-Timing ヘッダ（db / render / app / total）と X-Trace-Id を付与する。
+    - core.request ロガーへ JSON 1 行の構造化ログを出す（REQUEST_METRICS['SLOW_MS'] 超は WARNING）。
+    - trace_id はエラー応答の trace_id と同じ値になる。
+    - URL名（config/urls.py の name）単位で core.metrics へ件数/レイテンシを記録する。
+    - QUERY_PLANS が有効なら、抽選/遅延した SELECT を応答後にバックグラウンドで EXPLAIN して保存する（core.query_plans）。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        conf = getattr(settings, "REQUEST_METRICS", {})
+        self.slow_ms = float(conf.get("SLOW_MS", 500))
+        self.log_all = bool(conf.get("LOG_ALL", True))
+        # core.query_plans は sql_fingerprint をこのモジュールから使うため遅延 import する
+        from core import query_plans
+
+        self.query_plans = query_plans
+
+    def __call__(self, request):
+        stats = RequestStats(_new_trace_id())
+        request.trace_id = stats.trace_id
+        stats.plans = self.query_plans.new_collector()
+        stats_token = _stats_var.set(stats)
+        trace_token = _trace_id_var.set(stats.trace_id)
+        try:
+            with connection.execute_wrapper(_db_execute_wrapper):
+                response = self.get_response(request)
+        finally:
+            _stats_var.reset(stats_token)
+            _trace_id_var.reset(trace_token)
+
+        total_ms = (time.perf_counter() - stats.started) * 1000.0
+        app_ms = max(0.0, total_ms - stats.db_ms - stats.render_ms)
+        response["Server-Timing"] = (
+            f'db;dur={stats.db_ms:.1f};desc="{stats.query_count} queries", '
+            f"render;dur={stats.render_ms:.1f}, app;dur={app_ms:.1f}, total;dur={total_ms:.1f}"
+        )
+        response["X-Trace-Id"] = stats.trace_id
+        match = getattr(request, "resolver_match", None)
+        route = match.url_name if match and match.url_name else "unmatched"
+        metrics.observe_request(
+            route=route,
+            method=request.method,
+            status=response.status_code,
+            total_s=total_ms / 1000.0,
+            db_s=stats.db_ms / 1000.0,
+            queries=stats.query_count,
+        )
+        self._log(request, response, stats, total_ms)
+        if stats.plans is not None and stats.plans.candidates:
+            # EXPLAIN ANALYZE は応答を待たせないようバックグラウンドで実行する
+            self.query_plans.submit(stats.plans, route, stats.trace_id)
+        return response
+
+    def process_template_response(self, request, response):
+        """DRF の Response はここを通った直後にレンダリングされるため、その所要時間を測る。"""
+        stats = _stats_var.get()
+        if stats is not None and hasattr(response, "add_post_render_callback"):
+            stats.render_started = time.perf_counter()
+
+            def _rendered(r, stats=stats):
+                stats.render_ms = (time.perf_counter() - stats.render_started) * 1000.0
+                return None
+
+            response.add_post_render_callback(_rendered)
+        return response
+
+    def _log(self, request, response, stats: RequestStats, total_ms: float) -> None:
+        slow = total_ms >= self.slow_ms
+        if not (slow or self.log_all):
+            return
+        match = getattr(request, "resolver_match", None)
+        record = {
+            "trace_id": stats.trace_id,
+            "method": request.method,
+            "path": request.path,
+            "route": match.url_name if match else None,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 2),
+            "db_ms": round(stats.db_ms, 2),
+            "render_ms": round(stats.render_ms, 2),
+            "queries": stats.query_count,
+        }
+        if stats.slowest_sql:
+            fingerprint, normalized = sql_fingerprint(stats.slowest_sql)
+            record["slowest_sql_ms"] = round(stats.slowest_ms, 2)
+            record["slowest_sql_fingerprint"] = fingerprint
+            record["slowest_sql"] = normalized[:200]
+        logger.log(logging.WARNING if slow else logging.INFO, json.dumps(record, ensure_ascii=False))
+
+
+class RateLimitHeadersMiddleware:
+    """core.ratelimit.GCRAThrottle の判定結果を RateLimit-Limit / Remaining / Reset ヘッダとして返す。
+    - 429 を含め、スロットルを通った応答すべてに付く（制限対象外のルートには付かない）。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        result = getattr(request, "rate_limit", None)
+        if result is not None:
+            response["RateLimit-Limit"] = str(result.limit)
+            response["RateLimit-Remaining"] = str(result.remaining)
+            response["RateLimit-Reset"] = str(result.reset)
+        return response
+
+
+_COMPRESSIBLE_TYPES = {"application/javascript", "application/xml", "application/vnd.oai.openapi"}
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    """Accept-Encoding を解析し、q=0 以外で受け付けるエンコーディングの集合を返す。"""
+    accepted = set()
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(token)
+    return accepted
+
+
+class CompressionMiddleware:
+    """応答を brotli / gzip で圧縮する（COMPRESSION 設定）。
+    - MIN_SIZE バイト未満、ストリーミング、既に Content-Encoding があるもの、JSON/テキスト以外は対象外。
+    - ALGORITHMS の順（サーバー側の優先順）でクライアントが受け付けるものを選ぶ。brotli は未導入なら使わない。
+    - 強い ETag は圧縮後に弱い ETag へ変える（django.middleware.gzip と同じ）。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        conf = getattr(settings, "COMPRESSION", {})
+        self.min_size = int(conf.get("MIN_SIZE", 1024))
+        self.gzip_level = int(conf.get("GZIP_LEVEL", 6))
+        self.brotli_quality = int(conf.get("BROTLI_QUALITY", 4))
+        self.algorithms = [a for a in conf.get("ALGORITHMS", ("br", "gzip")) if a == "gzip" or (a == "br" and brotli)]
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            not self.algorithms
+            or response.streaming
+            or response.has_header("Content-Encoding")
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or not self._compressible(response.get("Content-Type", ""))
+        ):
+            return response
+
+        # 圧縮するかどうかはサイズと Accept-Encoding で変わるため、対象の型には常に Vary を付ける
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if len(response.content) < self.min_size:
+            return response
+
+        accepted = _accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        encoding = next((a for a in self.algorithms if a in accepted or "*" in accepted), None)
+        if encoding is None:
+            return response
+
+        if encoding == "br":
+            compressed = brotli.compress(response.content, quality=self.brotli_quality)
+        else:
+            compressed = gzip.compress(response.content, compresslevel=self.gzip_level, mtime=0)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
+
+    @staticmethod
+    def _compressible(content_type: str) -> bool:
+        media_type = content_type.split(";", 1)[0].strip().lower()
+        return media_type.startswith("text/") or media_type.endswith("json") or media_type in _COMPRESSIBLE_TYPES
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- place_source_meta（取得元メタ：原文JSON・etag・取得時刻）
+CREATE TABLE IF NOT EXISTS place_source_meta (
+  id                uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
+  place_id          uuid NOT NULL REFERENCES places(id) ON DELETE CASCADE,
+  provider          text NOT NULL,
+  provider_place_id text,
+  raw_json          jsonb,
+  fetched_at        timestamptz NOT NULL DEFAULT NOW(),
+  etag              text
+);
+CREATE INDEX IF NOT EXISTS idx_psm_place ON place_source_meta (place_id, fetched_at DESC);
+CREATE INDEX IF NOT EXISTS idx_psm_provider_place ON place_source_meta (provider, provider_place_id, fetched_at DESC);
+
+-- place_sync_jobs（取込・更新のキュー/履歴）
+CREATE TABLE IF NOT EXISTS place_sync_jobs (
+  id                uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
+  place_id          uuid REFERENCES places(id) ON DELETE SET NULL,
+  provider          text NOT NULL,
+  provider_place_id text,
+  status            sync_status NOT NULL DEFAULT 'queued',
+  scheduled_at      timestamptz NOT NULL DEFAULT NOW(),
+  started_at        timestamptz,
+  finished_at       timestamptz,
+  error_message     text
+);
+CREATE INDEX IF NOT EXISTS idx_sync_jobs_status ON place_sync_jobs (status, scheduled_at DESC);
+-- ワーカーの取得（status='queued' を古い順に SKIP LOCKED）用の部分インデックス
+CREATE INDEX IF NOT EXISTS idx_sync_jobs_queued ON place_sync_jobs (scheduled_at) WHERE status = 'queued';
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0008_alter_reviewscore_review"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql=""),
+    ]
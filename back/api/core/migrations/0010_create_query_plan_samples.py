@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- query_plan_samples（EXPLAIN (ANALYZE, BUFFERS) のサンプル。core.query_plans が書き込む）
+CREATE TABLE IF NOT EXISTS query_plan_samples (
+  id            bigserial PRIMARY KEY,
+  fingerprint   varchar(12) NOT NULL,
+  query         text NOT NULL,
+  route         text,
+  trace_id      text,
+  reason        text NOT NULL,
+  duration_ms   double precision NOT NULL,
+  planning_ms   double precision,
+  execution_ms  double precision,
+  plan          jsonb,
+  created_at    timestamptz NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_qps_created ON query_plan_samples (created_at);
+CREATE INDEX IF NOT EXISTS idx_qps_fingerprint ON query_plan_samples (fingerprint, created_at DESC);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0009_create_sync_tables"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql="DROP TABLE IF EXISTS query_plan_samples;"),
+    ]
@@ -0,0 +1,102 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- 検索の sort=score / sort=reviews 用の事前計算スコア（core.ranking）
+-- places には updated_at 更新トリガーがあるため、順位用の値は別テーブルに持つ（施設と 1:1）
+
+-- グリッドセル番号（0.05 度四方。core.ranking.GRID_CELL_DEG と一致させること）
+CREATE OR REPLACE FUNCTION place_grid_cell(g geography) RETURNS integer
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT floor((ST_Y(g::geometry) + 90) / 0.05)::int * 10000 + floor((ST_X(g::geometry) + 180) / 0.05)::int
+$$;
+
+-- ベイズ平均の事前分布（全体平均 mean と重み weight。1 行のみ）
+CREATE TABLE IF NOT EXISTS search_rank_prior (
+  id         boolean PRIMARY KEY DEFAULT true CHECK (id),
+  mean       double precision NOT NULL,
+  weight     double precision NOT NULL,
+  updated_at timestamptz NOT NULL DEFAULT NOW()
+);
+INSERT INTO search_rank_prior (id, mean, weight) VALUES (true, 3.5, 5) ON CONFLICT (id) DO NOTHING;
+
+-- place_rank（施設ごとのセル番号・ベイズ平均スコア・レビュー件数）
+CREATE TABLE IF NOT EXISTS place_rank (
+  place_id     uuid PRIMARY KEY REFERENCES places(id) ON DELETE CASCADE,
+  grid_cell    integer NOT NULL,
+  rank_score   double precision NOT NULL,
+  rank_reviews integer NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_place_rank_cell_score ON place_rank (grid_cell, rank_score DESC, place_id);
+CREATE INDEX IF NOT EXISTS idx_place_rank_cell_reviews ON place_rank (grid_cell, rank_reviews DESC, place_id);
+
+-- 既存施設の初期値
+INSERT INTO place_rank (place_id, grid_cell, rank_score, rank_reviews)
+SELECT p.id,
+       place_grid_cell(p.geog),
+       (sp.weight * sp.mean + COALESCE(ps.avg_overall, 0) * COALESCE(ps.review_count, 0))
+         / (sp.weight + COALESCE(ps.review_count, 0)),
+       COALESCE(ps.review_count, 0)
+FROM places p
+CROSS JOIN search_rank_prior sp
+LEFT JOIN place_stats ps ON ps.place_id = p.id
+ON CONFLICT (place_id) DO NOTHING;
+
+-- places の追加・位置変更に追従（文単位トリガー＋遷移テーブル。import/sync の一括 upsert でも 1 回）
+CREATE OR REPLACE FUNCTION sync_place_rank_cells() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO place_rank (place_id, grid_cell, rank_score, rank_reviews)
+  SELECT n.id, place_grid_cell(n.geog), (SELECT mean FROM search_rank_prior), 0
+  FROM changed_places n
+  ON CONFLICT (place_id) DO UPDATE SET grid_cell = EXCLUDED.grid_cell
+  WHERE place_rank.grid_cell IS DISTINCT FROM EXCLUDED.grid_cell;
+  RETURN NULL;
+END $$;
+DROP TRIGGER IF EXISTS trg_places_rank_insert ON places;
+CREATE TRIGGER trg_places_rank_insert AFTER INSERT ON places
+  REFERENCING NEW TABLE AS changed_places FOR EACH STATEMENT EXECUTE FUNCTION sync_place_rank_cells();
+DROP TRIGGER IF EXISTS trg_places_rank_update ON places;
+CREATE TRIGGER trg_places_rank_update AFTER UPDATE ON places
+  REFERENCING NEW TABLE AS changed_places FOR EACH STATEMENT EXECUTE FUNCTION sync_place_rank_cells();
+
+-- place_stats の更新に追従（refresh_place_stats / 一括再計算のどちらの経路でも反映される）
+CREATE OR REPLACE FUNCTION sync_place_rank_scores() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  UPDATE place_rank pr
+  SET rank_score = (sp.weight * sp.mean + COALESCE(s.avg_overall, 0) * s.review_count) / (sp.weight + s.review_count),
+      rank_reviews = s.review_count
+  FROM changed_stats s, search_rank_prior sp
+  WHERE pr.place_id = s.place_id;
+  RETURN NULL;
+END $$;
+DROP TRIGGER IF EXISTS trg_place_stats_rank_insert ON place_stats;
+CREATE TRIGGER trg_place_stats_rank_insert AFTER INSERT ON place_stats
+  REFERENCING NEW TABLE AS changed_stats FOR EACH STATEMENT EXECUTE FUNCTION sync_place_rank_scores();
+DROP TRIGGER IF EXISTS trg_place_stats_rank_update ON place_stats;
+CREATE TRIGGER trg_place_stats_rank_update AFTER UPDATE ON place_stats
+  REFERENCING NEW TABLE AS changed_stats FOR EACH STATEMENT EXECUTE FUNCTION sync_place_rank_scores();
+"""
+
+REVERSE_SQL = r"""
+DROP TRIGGER IF EXISTS trg_place_stats_rank_update ON place_stats;
+DROP TRIGGER IF EXISTS trg_place_stats_rank_insert ON place_stats;
+DROP TRIGGER IF EXISTS trg_places_rank_update ON places;
+DROP TRIGGER IF EXISTS trg_places_rank_insert ON places;
+DROP FUNCTION IF EXISTS sync_place_rank_scores();
+DROP FUNCTION IF EXISTS sync_place_rank_cells();
+DROP TABLE IF EXISTS place_rank;
+DROP TABLE IF EXISTS search_rank_prior;
+DROP FUNCTION IF EXISTS place_grid_cell(geography);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0010_create_query_plan_samples"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql=REVERSE_SQL),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- place_stats の更新時刻（メモリ内検索インデックスの差分取り込み用の透かし）
+ALTER TABLE place_stats ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT NOW();
+DO $$ BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_trigger
+    WHERE tgname = 'trg_place_stats_updated_at'
+  ) THEN
+    CREATE TRIGGER trg_place_stats_updated_at BEFORE UPDATE ON place_stats FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+  END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS idx_place_stats_updated_at ON place_stats (updated_at);
+CREATE INDEX IF NOT EXISTS idx_places_updated_at ON places (updated_at);
+"""
+
+REVERSE_SQL = r"""
+DROP INDEX IF EXISTS idx_places_updated_at;
+DROP INDEX IF EXISTS idx_place_stats_updated_at;
+DROP TRIGGER IF EXISTS trg_place_stats_updated_at ON place_stats;
+ALTER TABLE place_stats DROP COLUMN IF EXISTS updated_at;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0011_create_place_rank"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql=REVERSE_SQL),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- idempotency_keys（Idempotency-Key ごとの最初の応答。core.idempotency が読み書きする）
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  user_id        integer NOT NULL REFERENCES auth_user(id) ON DELETE CASCADE,
+  idem_key       varchar(255) NOT NULL,
+  route          text NOT NULL,
+  request_hash   char(64) NOT NULL,
+  status_code    smallint NOT NULL,
+  response_body  jsonb NOT NULL,
+  created_at     timestamptz NOT NULL DEFAULT NOW(),
+  expires_at     timestamptz NOT NULL,
+  PRIMARY KEY (user_id, idem_key)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0012_place_stats_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql="DROP TABLE IF EXISTS idempotency_keys;"),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- user_auth_versions（アクセストークンのクレーム（is_active / is_staff / is_superuser）の世代。core.authentication が参照）
+-- 行が無いユーザーは世代 0。auth_user の該当列が変わるとトリガーで +1 する
+CREATE TABLE IF NOT EXISTS user_auth_versions (
+  user_id     integer PRIMARY KEY REFERENCES auth_user(id) ON DELETE CASCADE,
+  version     integer NOT NULL DEFAULT 0,
+  updated_at  timestamptz NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION bump_user_auth_version() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO user_auth_versions (user_id, version) VALUES (NEW.id, 1)
+  ON CONFLICT (user_id) DO UPDATE
+  SET version = user_auth_versions.version + 1,
+      updated_at = NOW();
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DO $$ BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_trigger
+    WHERE tgname = 'trg_auth_user_auth_version'
+  ) THEN
+    CREATE TRIGGER trg_auth_user_auth_version
+      AFTER UPDATE OF is_active, is_staff, is_superuser ON auth_user
+      FOR EACH ROW
+      WHEN (OLD.is_active IS DISTINCT FROM NEW.is_active
+            OR OLD.is_staff IS DISTINCT FROM NEW.is_staff
+            OR OLD.is_superuser IS DISTINCT FROM NEW.is_superuser)
+      EXECUTE FUNCTION bump_user_auth_version();
+  END IF;
+END $$;
+"""
+
+REVERSE_SQL = r"""
+DROP TRIGGER IF EXISTS trg_auth_user_auth_version ON auth_user;
+DROP FUNCTION IF EXISTS bump_user_auth_version();
+DROP TABLE IF EXISTS user_auth_versions;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0013_create_idempotency_keys"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql=REVERSE_SQL),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY はトランザクション内で実行できない
+    atomic = False
+
+    dependencies = [
+        ("core", "0014_create_user_auth_versions"),
+        ("token_blacklist", "0012_alter_outstandingtoken_user"),
+    ]
+
+    operations = [
+        # 期限切れトークンのバッチ削除（manage.py prune_tokens）用
+        migrations.RunSQL(
+            sql="CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_outstandingtoken_expires_at ON token_blacklist_outstandingtoken (expires_at);",
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS idx_outstandingtoken_expires_at;",
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- place_stats_dirty（place_stats の再計算待ちの施設。重複なし。core.stats_flusher が取り出して再計算する）
+CREATE TABLE IF NOT EXISTS place_stats_dirty (
+  place_id        uuid PRIMARY KEY REFERENCES places(id) ON DELETE CASCADE,
+  first_dirty_at  timestamptz NOT NULL DEFAULT NOW(),
+  last_dirty_at   timestamptz NOT NULL DEFAULT NOW(),
+  writes          int NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_place_stats_dirty_first ON place_stats_dirty (first_dirty_at);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0015_outstandingtoken_expires_index"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql="DROP TABLE IF EXISTS place_stats_dirty;"),
+    ]
@@ -0,0 +1,156 @@
+from django.db import migrations, transaction
+
+
+SQL = r"""
+-- 営業時間の正規化（opening_hours_json → 週内の分の区間。core.opening_hours と一致させること）
+-- 週内の分: 月曜 0:00 = 0 〜 日曜 24:00 = 10080。週をまたぐ区間（日曜 22:00〜月曜 2:00 など）は 2 つに分ける。
+-- 対応する形式:
+--   API 形式:    {"mon": [["09:00","18:00"]], "tue": [], ...}（閉店 <= 開店は翌日まで。"24:00" 可）
+--   Google 形式: {"periods": [{"open": {"day": 0, "hour": 9, "minute": 0}, "close": {...}}]}（day は日曜 = 0。
+--                旧 Places API の {"day": 0, "time": "0900"} も可。close が無い period は 24 時間営業）
+-- 解釈できない値・営業時間の情報が無い場合は NULL（不明）、情報があって営業時間が無い場合は空（常に休み）。
+
+-- Google 形式の 1 点（open / close）を週内の分にする
+CREATE OR REPLACE FUNCTION opening_hours_point(pt jsonb) RETURNS integer
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+  SELECT (((pt->>'day')::int + 6) % 7) * 1440
+       + CASE WHEN pt ? 'time'
+              THEN substr(pt->>'time', 1, 2)::int * 60 + substr(pt->>'time', 3, 2)::int
+              ELSE COALESCE((pt->>'hour')::int, 0) * 60 + COALESCE((pt->>'minute')::int, 0)
+         END
+$$;
+
+CREATE OR REPLACE FUNCTION opening_hours_minutes(h jsonb) RETURNS int4multirange
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+  days text[] := ARRAY['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'];
+  result int4multirange := '{}';
+  found boolean := false;
+  d int;
+  p jsonb;
+  iv jsonb;
+  s int;
+  e int;
+BEGIN
+  IF h IS NULL OR jsonb_typeof(h) <> 'object' THEN
+    RETURN NULL;
+  END IF;
+  IF jsonb_typeof(h->'periods') = 'array' THEN
+    FOR p IN SELECT value FROM jsonb_array_elements(h->'periods') LOOP
+      found := true;
+      IF jsonb_typeof(p->'close') IS DISTINCT FROM 'object' THEN
+        RETURN int4multirange(int4range(0, 10080));
+      END IF;
+      s := opening_hours_point(p->'open');
+      e := opening_hours_point(p->'close');
+      IF e <= s THEN
+        e := e + 10080;
+      END IF;
+      result := result + int4multirange(int4range(s, LEAST(e, 10080)));
+      IF e > 10080 THEN
+        result := result + int4multirange(int4range(0, e - 10080));
+      END IF;
+    END LOOP;
+  ELSE
+    FOR d IN 1..7 LOOP
+      CONTINUE WHEN jsonb_typeof(h->days[d]) IS DISTINCT FROM 'array';
+      found := true;
+      FOR iv IN SELECT value FROM jsonb_array_elements(h->days[d]) LOOP
+        s := (d - 1) * 1440 + split_part(iv->>0, ':', 1)::int * 60 + split_part(iv->>0, ':', 2)::int;
+        e := (d - 1) * 1440 + split_part(iv->>1, ':', 1)::int * 60 + split_part(iv->>1, ':', 2)::int;
+        IF e <= s THEN
+          e := e + 1440;
+        END IF;
+        result := result + int4multirange(int4range(s, LEAST(e, 10080)));
+        IF e > 10080 THEN
+          result := result + int4multirange(int4range(0, e - 10080));
+        END IF;
+      END LOOP;
+    END LOOP;
+  END IF;
+  IF NOT found THEN
+    RETURN NULL;
+  END IF;
+  RETURN result;
+EXCEPTION WHEN others THEN
+  RETURN NULL;
+END $$;
+
+-- 書き込み経路（sync / import / 管理画面）によらず DB 側で正規化する。
+-- 生成列（STORED）にすると既存行の計算のために places 全体が ACCESS EXCLUSIVE で書き換えられるため、
+-- 通常の列（追加はメタデータのみ）をトリガで埋め、既存行は backfill_opening_minutes がバッチで埋める。
+ALTER TABLE places ADD COLUMN IF NOT EXISTS opening_minutes int4multirange;
+
+CREATE OR REPLACE FUNCTION set_places_opening_minutes() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.opening_minutes := opening_hours_minutes(NEW.opening_hours_json);
+  RETURN NEW;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_places_opening_minutes ON places;
+CREATE TRIGGER trg_places_opening_minutes BEFORE INSERT OR UPDATE OF opening_hours_json ON places
+  FOR EACH ROW EXECUTE FUNCTION set_places_opening_minutes();
+"""
+
+# open_at 検索用（半径条件と営業中の判定を 1 回の索引走査で行う）。書き込みを止めないよう CONCURRENTLY で作る
+INDEX_SQL = "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_places_geog_opening ON places USING GIST (geog, opening_minutes)"
+
+REVERSE_SQL = r"""
+DROP INDEX IF EXISTS idx_places_geog_opening;
+DROP TRIGGER IF EXISTS trg_places_opening_minutes ON places;
+DROP FUNCTION IF EXISTS set_places_opening_minutes();
+ALTER TABLE places DROP COLUMN IF EXISTS opening_minutes;
+DROP FUNCTION IF EXISTS opening_hours_minutes(jsonb);
+DROP FUNCTION IF EXISTS opening_hours_point(jsonb);
+"""
+
+# 既存行の埋め込みで 1 トランザクションに更新する行数
+BACKFILL_BATCH = 5000
+
+
+def backfill_opening_minutes(apps, schema_editor):
+    """既存行を id 順に BACKFILL_BATCH 件ずつ埋める（1 バッチ 1 トランザクション）。
+    差分で読む側（検索インデックス・エクスポート）に全件の変更として見せないよう、バッチ中は
+    updated_at のトリガを止める（ALTER TABLE のロックはそのバッチの間だけ）。
+    """
+    connection = schema_editor.connection
+    last_id = None
+    while True:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cur:
+            cur.execute("ALTER TABLE places DISABLE TRIGGER trg_places_updated_at")
+            cur.execute(
+                """
+                WITH batch AS (
+                    SELECT id FROM places
+                    WHERE %(last_id)s::uuid IS NULL OR id > %(last_id)s::uuid
+                    ORDER BY id
+                    LIMIT %(limit)s
+                )
+                UPDATE places p
+                SET opening_minutes = opening_hours_minutes(p.opening_hours_json)
+                FROM batch
+                WHERE p.id = batch.id
+                RETURNING p.id
+                """,
+                {"last_id": last_id, "limit": BACKFILL_BATCH},
+            )
+            ids = [str(pid) for (pid,) in cur.fetchall()]
+            cur.execute("ALTER TABLE places ENABLE TRIGGER trg_places_updated_at")
+        if len(ids) < BACKFILL_BATCH:
+            return
+        last_id = max(ids)
+
+
+class Migration(migrations.Migration):
+    # バッチごとのコミットと CREATE INDEX CONCURRENTLY のため、マイグレーション全体のトランザクションは張らない
+    atomic = False
+
+    dependencies = [
+        ("core", "0016_create_place_stats_dirty"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql=REVERSE_SQL),
+        migrations.RunPython(backfill_opening_minutes, migrations.RunPython.noop),
+        migrations.RunSQL(sql=INDEX_SQL, reverse_sql=migrations.RunSQL.noop),
+    ]
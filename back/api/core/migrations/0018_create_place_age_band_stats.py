@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- place_age_band_stats（施設×年齢帯ごとの public レビューの件数と評価。age_band 検索用）
+-- refresh_place_stats / refresh_place_stats_bulk が place_stats と同じトランザクションで更新する。
+-- 評価は合計（overall_sum）で持ち、平均は生成列（件数の増減を差分で反映しても丸め誤差が溜まらない）。
+CREATE TABLE IF NOT EXISTS place_age_band_stats (
+  place_id      uuid NOT NULL REFERENCES places(id) ON DELETE CASCADE,
+  age_band_id   uuid NOT NULL REFERENCES age_bands(id) ON DELETE CASCADE,
+  review_count  int NOT NULL DEFAULT 0,
+  overall_sum   int NOT NULL DEFAULT 0,
+  avg_overall   numeric(3,2) GENERATED ALWAYS AS (
+    CASE WHEN review_count > 0 THEN round(overall_sum::numeric / review_count, 2) END
+  ) STORED,
+  updated_at    timestamptz NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (place_id, age_band_id)
+);
+CREATE INDEX IF NOT EXISTS idx_place_age_band_stats_band ON place_age_band_stats (age_band_id, place_id) WHERE review_count > 0;
+
+-- 既存レビューからの初期値
+INSERT INTO place_age_band_stats (place_id, age_band_id, review_count, overall_sum)
+SELECT r.place_id, r.age_band_id, COUNT(*), SUM(r.overall)
+FROM reviews r
+WHERE r.status = 'public' AND r.age_band_id IS NOT NULL
+GROUP BY r.place_id, r.age_band_id
+ON CONFLICT (place_id, age_band_id) DO NOTHING;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0017_places_opening_minutes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql="DROP TABLE IF EXISTS place_age_band_stats;"),
+    ]
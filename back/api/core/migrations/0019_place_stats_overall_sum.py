@@ -0,0 +1,76 @@
+from django.db import migrations, transaction
+
+
+SQL = r"""
+-- place_stats.overall_sum（public レビューの overall の合計）
+-- モデレーション（core.moderation）が件数と合計の差分だけで avg_overall を正確に更新できるようにする
+ALTER TABLE place_stats ADD COLUMN IF NOT EXISTS overall_sum bigint NOT NULL DEFAULT 0;
+"""
+
+REVERSE_SQL = r"""
+ALTER TABLE place_stats DROP COLUMN IF EXISTS overall_sum;
+"""
+
+# 利用者を指定した一括モデレーション用。書き込みを止めないよう CONCURRENTLY で作る
+INDEX_SQL = "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reviews_user_status ON reviews (user_id, status)"
+INDEX_REVERSE_SQL = "DROP INDEX CONCURRENTLY IF EXISTS idx_reviews_user_status"
+
+# 既存行の埋め込みで 1 トランザクションに更新する行数
+BACKFILL_BATCH = 5000
+
+
+def backfill_overall_sum(apps, schema_editor):
+    """既存の place_stats を place_id 順に BACKFILL_BATCH 件ずつ埋める（1 バッチ 1 トランザクション）。
+    差分で読む側（エクスポート・施設詳細の検証子）に全件の変更として見せないよう、バッチ中は
+    updated_at のトリガを止める。overall_sum は順位に使わないため place_rank の追従トリガも止める。
+    """
+    connection = schema_editor.connection
+    last_id = None
+    while True:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cur:
+            cur.execute("ALTER TABLE place_stats DISABLE TRIGGER trg_place_stats_updated_at")
+            cur.execute("ALTER TABLE place_stats DISABLE TRIGGER trg_place_stats_rank_update")
+            cur.execute(
+                """
+                SELECT place_id FROM place_stats
+                WHERE %(last_id)s::uuid IS NULL OR place_id > %(last_id)s::uuid
+                ORDER BY place_id
+                LIMIT %(limit)s
+                """,
+                {"last_id": last_id, "limit": BACKFILL_BATCH},
+            )
+            ids = [str(pid) for (pid,) in cur.fetchall()]
+            cur.execute(
+                """
+                UPDATE place_stats ps
+                SET overall_sum = agg.overall_sum
+                FROM (
+                  SELECT r.place_id, SUM(r.overall) AS overall_sum
+                  FROM reviews r
+                  WHERE r.place_id = ANY(%(ids)s::uuid[]) AND r.status = 'public'
+                  GROUP BY r.place_id
+                ) AS agg
+                WHERE agg.place_id = ps.place_id AND ps.overall_sum <> agg.overall_sum
+                """,
+                {"ids": ids},
+            )
+            cur.execute("ALTER TABLE place_stats ENABLE TRIGGER trg_place_stats_rank_update")
+            cur.execute("ALTER TABLE place_stats ENABLE TRIGGER trg_place_stats_updated_at")
+        if len(ids) < BACKFILL_BATCH:
+            return
+        last_id = max(ids)
+
+
+class Migration(migrations.Migration):
+    # バッチごとのコミットと CREATE INDEX CONCURRENTLY のため、マイグレーション全体のトランザクションは張らない
+    atomic = False
+
+    dependencies = [
+        ("core", "0018_create_place_age_band_stats"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql=REVERSE_SQL),
+        migrations.RunPython(backfill_overall_sum, migrations.RunPython.noop),
+        migrations.RunSQL(sql=INDEX_SQL, reverse_sql=INDEX_REVERSE_SQL),
+    ]
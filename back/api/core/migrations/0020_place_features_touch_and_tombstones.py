@@ -0,0 +1,66 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- place_features の追加・変更・削除で places.updated_at を進める（文単位。places の BEFORE UPDATE トリガが NOW() を入れる）
+-- places.updated_at を透かしにする読み手（検索インデックスの差分更新・増分エクスポート・施設詳細の検証子）が
+-- 特徴だけの変更も拾えるようにする。
+CREATE OR REPLACE FUNCTION touch_places_from_features() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    UPDATE places SET updated_at = NOW() WHERE id IN (SELECT place_id FROM old_rows);
+  ELSE
+    UPDATE places SET updated_at = NOW() WHERE id IN (SELECT place_id FROM new_rows);
+  END IF;
+  RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_place_features_touch_ins ON place_features;
+DROP TRIGGER IF EXISTS trg_place_features_touch_upd ON place_features;
+DROP TRIGGER IF EXISTS trg_place_features_touch_del ON place_features;
+CREATE TRIGGER trg_place_features_touch_ins AFTER INSERT ON place_features
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION touch_places_from_features();
+CREATE TRIGGER trg_place_features_touch_upd AFTER UPDATE ON place_features
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION touch_places_from_features();
+CREATE TRIGGER trg_place_features_touch_del AFTER DELETE ON place_features
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION touch_places_from_features();
+
+-- 削除された施設の記録（差分で読む側が削除を検知するため。件数の比較では削除と追加が同時にあると見逃す）
+CREATE TABLE IF NOT EXISTS place_tombstones (
+  place_id   uuid PRIMARY KEY,
+  deleted_at timestamptz NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS idx_place_tombstones_deleted_at ON place_tombstones (deleted_at);
+
+CREATE OR REPLACE FUNCTION record_place_tombstones() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  INSERT INTO place_tombstones (place_id)
+  SELECT id FROM old_rows
+  ON CONFLICT (place_id) DO UPDATE SET deleted_at = NOW();
+  RETURN NULL;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_places_tombstone ON places;
+CREATE TRIGGER trg_places_tombstone AFTER DELETE ON places
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION record_place_tombstones();
+"""
+
+REVERSE_SQL = r"""
+DROP TRIGGER IF EXISTS trg_places_tombstone ON places;
+DROP FUNCTION IF EXISTS record_place_tombstones();
+DROP TABLE IF EXISTS place_tombstones;
+DROP TRIGGER IF EXISTS trg_place_features_touch_ins ON place_features;
+DROP TRIGGER IF EXISTS trg_place_features_touch_upd ON place_features;
+DROP TRIGGER IF EXISTS trg_place_features_touch_del ON place_features;
+DROP FUNCTION IF EXISTS touch_places_from_features();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0019_place_stats_overall_sum"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql=REVERSE_SQL),
+    ]
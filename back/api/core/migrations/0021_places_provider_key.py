@@ -0,0 +1,52 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- 取得元プロバイダごとの施設の識別子（core.sync の upsert のキー）。google_place_id は Google 専用のため、
+-- 他のプロバイダの施設は (provider, provider_place_id) で同一性を判定する。
+ALTER TYPE data_source ADD VALUE IF NOT EXISTS 'external';
+
+ALTER TABLE places ADD COLUMN IF NOT EXISTS provider text;
+ALTER TABLE places ADD COLUMN IF NOT EXISTS provider_place_id text;
+
+-- google_place_id だけを書く経路（import_places / 管理画面 / ベンチデータ）でもキーが揃うよう DB 側で補う
+CREATE OR REPLACE FUNCTION set_places_provider_key() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF NEW.provider_place_id IS NULL AND NEW.google_place_id IS NOT NULL THEN
+    NEW.provider := 'google';
+    NEW.provider_place_id := NEW.google_place_id;
+  END IF;
+  RETURN NEW;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_places_provider_key ON places;
+CREATE TRIGGER trg_places_provider_key BEFORE INSERT OR UPDATE OF google_place_id, provider_place_id ON places
+  FOR EACH ROW EXECUTE FUNCTION set_places_provider_key();
+
+-- 既存の Google 施設を埋める（updated_at は進めない: 差分で読む側に全件の変更として見せないため）
+ALTER TABLE places DISABLE TRIGGER trg_places_updated_at;
+UPDATE places SET provider = 'google', provider_place_id = google_place_id
+WHERE google_place_id IS NOT NULL AND provider_place_id IS NULL;
+ALTER TABLE places ENABLE TRIGGER trg_places_updated_at;
+
+-- upsert の ON CONFLICT (provider, provider_place_id) 用（NULL 同士は重複しないため手動登録の施設は対象外）
+CREATE UNIQUE INDEX IF NOT EXISTS uq_places_provider_place ON places (provider, provider_place_id);
+"""
+
+REVERSE_SQL = r"""
+DROP INDEX IF EXISTS uq_places_provider_place;
+DROP TRIGGER IF EXISTS trg_places_provider_key ON places;
+DROP FUNCTION IF EXISTS set_places_provider_key();
+ALTER TABLE places DROP COLUMN IF EXISTS provider_place_id;
+ALTER TABLE places DROP COLUMN IF EXISTS provider;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0020_place_features_touch_and_tombstones"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql=REVERSE_SQL),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- 保存した応答本文を書いたとおりの文字列で持つ（jsonb はキー順・空白を正規化するため、再送の本文が最初の応答と変わる）
+ALTER TABLE idempotency_keys ALTER COLUMN response_body TYPE json USING response_body::json;
+"""
+
+REVERSE_SQL = r"""
+ALTER TABLE idempotency_keys ALTER COLUMN response_body TYPE jsonb USING response_body::jsonb;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0021_places_provider_key"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql=REVERSE_SQL),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+SQL = r"""
+-- user_auth_versions の行をすべてのユーザーに作る（core.authentication は行の無いユーザーを DB の User で認証する）
+-- ユーザーを削除すると行も消える（ON DELETE CASCADE）ため、削除済みユーザーのトークンはクレームだけでは通らない
+CREATE OR REPLACE FUNCTION create_user_auth_version() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO user_auth_versions (user_id, version) VALUES (NEW.id, 0)
+  ON CONFLICT (user_id) DO NOTHING;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_auth_user_auth_version_insert ON auth_user;
+CREATE TRIGGER trg_auth_user_auth_version_insert
+  AFTER INSERT ON auth_user
+  FOR EACH ROW EXECUTE FUNCTION create_user_auth_version();
+
+INSERT INTO user_auth_versions (user_id, version)
+SELECT id, 0 FROM auth_user
+ON CONFLICT (user_id) DO NOTHING;
+"""
+
+REVERSE_SQL = r"""
+DROP TRIGGER IF EXISTS trg_auth_user_auth_version_insert ON auth_user;
+DROP FUNCTION IF EXISTS create_user_auth_version();
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0022_idempotency_body_json"),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL, reverse_sql=REVERSE_SQL),
+    ]
@@ -75,6 +75,8 @@ class Place(models.Model):
     lng = models.FloatField()  # 生成列（DB側で算出）
     google_place_id = models.TextField(blank=True, null=True)
     data_source = models.TextField(default="google")
+    provider = models.TextField(blank=True, null=True)
+    provider_place_id = models.TextField(blank=True, null=True)
     manual_lock = models.BooleanField(default=False)
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
@@ -0,0 +1,186 @@
+"""レビューの一括モデレーション（status の遷移と集計への差分反映）。
+
+- 対象（レビュー ID / 投稿者 / 施設の AND）のうち、status が遷移先と異なるレビューを batch_size 件ずつ
+  行ロックして取り出し、対象施設の place_stats 行をロックしてから（lock_place_stats。再計算と直列にする）、
+  1 文で遷移させる。同じ文の中で、public に出入りしたレビューの件数と overall の合計の差分を
+  place_stats（review_count / overall_sum / avg_overall）と place_age_band_stats に加える
+  （place_age_band_stats の件数が 0 になった行は消す）。
+  施設ごとの refresh_place_stats（reviews の再集計）は行わない。
+- public になったレビューは place_stats.last_reviewed_at を進める。public でなくなった場合は、残った
+  public レビューの最新の created_at に戻す（(place_id, created_at) 索引で引く）。写真の件数はレビューの
+  status によらないため変わらない。
+- place_stats の行が無い施設（write-behind で未反映など）は差分を加えられないため、
+  バッチの後に refresh_place_stats_bulk で再計算する。
+- 各バッチは 1 トランザクション。途中で失敗しても、それまでのバッチは遷移と集計が揃った状態で残る。
+"""
+from django.db import connection, transaction
+
+from core.review_views import lock_place_stats, refresh_place_stats_bulk
+from core.schema import has_table
+
+STATUSES = ("public", "pending", "hidden")
+
+
+def _pick_sql(selectors: list[str]) -> str:
+    """1 バッチ分の対象レビューを行ロックして返す（id と施設）。"""
+    return f"""
+        SELECT r.id, r.place_id
+        FROM reviews r
+        WHERE {" AND ".join(selectors)} AND r.status <> %(to_status)s
+        ORDER BY r.id
+        LIMIT %(batch_size)s
+        FOR UPDATE
+    """
+
+
+def _batch_sql(with_age_bands: bool) -> str:
+    """取り出したレビュー（%(picked)s）の遷移と差分反映を行う 1 文。"""
+    age_band_sql = ""
+    if with_age_bands:
+        age_band_sql = """,
+        band_delta AS (
+            SELECT place_id, age_band_id, COUNT(*) * %(sign)s AS dc, SUM(overall) * %(sign)s AS ds
+            FROM moved
+            WHERE age_band_id IS NOT NULL
+            GROUP BY place_id, age_band_id
+        ),
+        band_updated AS (
+            UPDATE place_age_band_stats ab
+            SET review_count = ab.review_count + d.dc,
+                overall_sum = ab.overall_sum + d.ds,
+                updated_at = NOW()
+            FROM band_delta d
+            WHERE ab.place_id = d.place_id AND ab.age_band_id = d.age_band_id
+              AND ab.review_count + d.dc > 0
+        ),
+        -- 件数が 0 になった組み合わせは refresh_age_band_stats と同じく行を消す
+        band_removed AS (
+            DELETE FROM place_age_band_stats ab
+            USING band_delta d
+            WHERE ab.place_id = d.place_id AND ab.age_band_id = d.age_band_id
+              AND ab.review_count + d.dc <= 0
+        ),
+        band_inserted AS (
+            INSERT INTO place_age_band_stats (place_id, age_band_id, review_count, overall_sum)
+            SELECT d.place_id, d.age_band_id, d.dc, d.ds
+            FROM band_delta d
+            WHERE d.dc > 0
+              AND NOT EXISTS (
+                SELECT 1 FROM place_age_band_stats ab WHERE ab.place_id = d.place_id AND ab.age_band_id = d.age_band_id
+              )
+            ON CONFLICT (place_id, age_band_id) DO UPDATE
+            SET review_count = place_age_band_stats.review_count + EXCLUDED.review_count,
+                overall_sum = place_age_band_stats.overall_sum + EXCLUDED.overall_sum,
+                updated_at = NOW()
+        )"""
+    return f"""
+        WITH picked AS (
+            SELECT r.id, r.status AS old_status
+            FROM reviews r
+            WHERE r.id = ANY(%(picked)s::uuid[])
+        ),
+        changed AS (
+            UPDATE reviews r
+            SET status = %(to_status)s, updated_at = NOW()
+            FROM picked
+            WHERE r.id = picked.id
+            RETURNING r.id, r.place_id, r.age_band_id, r.overall, r.created_at, picked.old_status
+        ),
+        -- public に出入りしたレビュー（pending <-> hidden は集計に影響しない）
+        moved AS (
+            SELECT * FROM changed
+            WHERE (old_status = 'public') <> (%(to_status)s = 'public')
+        ),
+        place_delta AS (
+            SELECT place_id, COUNT(*) * %(sign)s AS dc, SUM(overall) * %(sign)s AS ds, MAX(created_at) AS newest
+            FROM moved
+            GROUP BY place_id
+        ),
+        stats_updated AS (
+            UPDATE place_stats ps
+            SET review_count = ps.review_count + d.dc,
+                overall_sum = ps.overall_sum + d.ds,
+                avg_overall = CASE
+                    WHEN ps.review_count + d.dc > 0
+                    THEN round((ps.overall_sum + d.ds)::numeric / (ps.review_count + d.dc), 2)
+                END,
+                last_reviewed_at = CASE
+                    WHEN d.dc > 0 THEN GREATEST(ps.last_reviewed_at, d.newest)
+                    -- 同じ文の中では reviews の更新前の値が見えるため、外したレビューを除いて最新を引く
+                    ELSE COALESCE((
+                        SELECT MAX(r.created_at) FROM reviews r
+                        WHERE r.place_id = d.place_id AND r.status = 'public'
+                          AND NOT EXISTS (SELECT 1 FROM moved m WHERE m.id = r.id)
+                    ), ps.last_reviewed_at)
+                END
+            FROM place_delta d
+            WHERE ps.place_id = d.place_id
+            RETURNING ps.place_id
+        ){age_band_sql}
+        SELECT (SELECT COUNT(*) FROM changed),
+               (SELECT COUNT(*) FROM moved),
+               (SELECT COUNT(*) FROM stats_updated),
+               ARRAY(
+                 SELECT d.place_id FROM place_delta d
+                 WHERE NOT EXISTS (SELECT 1 FROM place_stats ps WHERE ps.place_id = d.place_id)
+               )
+    """
+
+
+def moderate_reviews(
+    to_status: str,
+    review_ids: list[str] | None = None,
+    user_id: int | None = None,
+    place_id: str | None = None,
+    from_statuses: list[str] | None = None,
+    batch_size: int = 1000,
+) -> dict:
+    """対象レビューの status を to_status にし、集計へ差分を反映する。遷移件数などを返す。"""
+    if to_status not in STATUSES:
+        raise ValueError(f"unknown status: {to_status!r}")
+    selectors = []
+    params: dict = {
+        "to_status": to_status,
+        "batch_size": max(1, int(batch_size)),
+        "sign": 1 if to_status == "public" else -1,
+    }
+    if review_ids:
+        selectors.append("r.id = ANY(%(review_ids)s::uuid[])")
+        params["review_ids"] = [str(rid) for rid in review_ids]
+    if user_id is not None:
+        selectors.append("r.user_id = %(user_id)s")
+        params["user_id"] = int(user_id)
+    if place_id:
+        selectors.append("r.place_id = %(place_id)s::uuid")
+        params["place_id"] = str(place_id)
+    if not selectors:
+        raise ValueError("review_ids / user_id / place_id のいずれかが必要です")
+    if from_statuses:
+        selectors.append("r.status::text = ANY(%(from_statuses)s::text[])")
+        params["from_statuses"] = list(from_statuses)
+
+    pick_sql = _pick_sql(selectors)
+    sql = _batch_sql(with_age_bands=has_table("place_age_band_stats"))
+    result = {"status": to_status, "updated": 0, "aggregated": 0, "places": 0, "recomputed": 0, "batches": 0}
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cur:
+                cur.execute(pick_sql, params)
+                picked = cur.fetchall()
+            if not picked:
+                break
+            lock_place_stats(sorted({str(pid) for _, pid in picked}))
+            with connection.cursor() as cur:
+                cur.execute(sql, {**params, "picked": [str(rid) for rid, _ in picked]})
+                changed, moved, places, missing = cur.fetchone()
+            if missing:
+                result["recomputed"] += refresh_place_stats_bulk([str(pid) for pid in missing])
+        if not changed:
+            break
+        result["batches"] += 1
+        result["updated"] += changed
+        result["aggregated"] += moved
+        result["places"] += places
+        if changed < params["batch_size"]:
+            break
+    return result
@@ -0,0 +1,36 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.exceptions import error_response
+from core.moderation import moderate_reviews
+from core.serializers import ReviewModerationSerializer
+
+
+class ReviewModerationView(APIView):
+    """（管理）レビューの status を一括で遷移させる（例: スパム投稿者のレビューをすべて hidden にする）。
+    入力(JSON): status(public | pending | hidden, 必須), review_ids / user_id / place_id（AND。1 つ以上必須）,
+    from_status(任意・遷移元の status を限定)
+    返却: `{ status, updated, aggregated, places, recomputed, batches }`。集計（place_stats / 年齢帯別）には
+    public に出入りした分の差分だけを反映する（core.moderation）。
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = ReviewModerationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return error_response(
+                code="VALIDATION_ERROR",
+                message="入力内容に誤りがあります",
+                details=serializer.errors,
+            )
+        data = serializer.validated_data
+        result = moderate_reviews(
+            to_status=data["status"],
+            review_ids=data.get("review_ids"),
+            user_id=data.get("user_id"),
+            place_id=data.get("place_id"),
+            from_statuses=data.get("from_status"),
+        )
+        return Response(result)
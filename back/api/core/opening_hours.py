@@ -0,0 +1,45 @@
+"""営業時間の検索条件（open_at）。
+
+- places.opening_minutes は opening_hours_json から DB 側のトリガで計算する「週内の分」の区間（int4multirange、
+  マイグレーション 0017 の opening_hours_minutes()）。月曜 0:00 = 0 〜 日曜 24:00 = 10080。
+- open_at は施設の現地時刻（OPENING_HOURS['TIME_ZONE']、既定は Asia/Tokyo）に直して週内の分にし、
+  `opening_minutes @> 分` で判定する（places の GiST 索引 (geog, opening_minutes) で評価される）。
+- 営業時間が不明（NULL）の施設は open_at 指定時の結果に含めない。
+"""
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+
+MINUTES_PER_DAY = 1440
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def conf() -> dict:
+    return {"TIME_ZONE": "Asia/Tokyo", **getattr(settings, "OPENING_HOURS", {})}
+
+
+def local_zone() -> ZoneInfo:
+    return ZoneInfo(conf()["TIME_ZONE"])
+
+
+def minute_of_week(dt: datetime) -> int:
+    """日時を施設の現地時刻の週内の分（月曜 0:00 = 0）にする。タイムゾーンの無い日時は現地時刻とみなす。"""
+    if timezone.is_aware(dt):
+        dt = dt.astimezone(local_zone())
+    return dt.weekday() * MINUTES_PER_DAY + dt.hour * 60 + dt.minute
+
+
+def parse_open_at(value: str) -> int:
+    """open_at（'now' または ISO 8601 の日時）を週内の分にする。不正な値は ValueError。"""
+    value = value.strip()
+    if value.lower() == "now":
+        return minute_of_week(timezone.now())
+    # Python 3.11 未満の fromisoformat は末尾の Z を受け付けない
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    # クエリ文字列でエンコードされずに送られた "+09:00" は " 09:00" になる
+    elif len(value) > 16 and value[-6] == " ":
+        value = f"{value[:-6]}+{value[-5:]}"
+    return minute_of_week(datetime.fromisoformat(value))
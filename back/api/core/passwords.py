@@ -0,0 +1,167 @@
+"""パスワードハッシュの CPU 使用量の上限と、ハッシュ方式の設定。
+
+- ログイン/サインアップのハッシュ計算（PBKDF2 / Argon2）は hashing_slot() の中で行う。
+  同時に計算できるのは PASSWORD_HASHING['MAX_CONCURRENCY'] 件までで、空きを WAIT_S 秒待っても
+  取れなければ HashingBusy を送出する（ビューは 503 を返す）。ログインが集中しても、
+  検索など他の処理に回す CPU を残せる。
+  - SCOPE='process': プロセス内の上限（threading.BoundedSemaphore）
+  - SCOPE='host': 同一ホストの全ワーカー合計の上限（LOCK_PATH のファイルのバイト単位の fcntl ロック）
+  - hashlib の PBKDF2 と argon2-cffi はいずれも計算中に GIL を解放するため、上限内であれば
+    リクエストのスレッドでそのまま計算してよい（別スレッドへ渡す必要はない）。
+- ハッシュ方式は PASSWORD_HASHING['ALGORITHM']（'pbkdf2' / 'argon2'。argon2 は argon2-cffi が必要）。
+  パラメータは下の Tuned*PasswordHasher が設定から読む。方式やパラメータを変えると、
+  次回ログイン時に Django の check_password が新しい設定で再ハッシュして保存する。
+"""
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows など。SCOPE='host' は使えない
+    fcntl = None
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+from django.core.exceptions import ImproperlyConfigured
+
+from core import metrics
+
+
+def conf() -> dict:
+    defaults = {
+        "ALGORITHM": "pbkdf2",
+        "PBKDF2_ITERATIONS": None,
+        "ARGON2": {},
+        "MAX_CONCURRENCY": 2,
+        "SCOPE": "process",
+        "LOCK_PATH": None,
+        "WAIT_S": 3.0,
+    }
+    return {**defaults, **getattr(settings, "PASSWORD_HASHING", {})}
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """反復回数を PASSWORD_HASHING['PBKDF2_ITERATIONS'] から読む PBKDF2（未設定なら Django の既定値）。"""
+
+    @property
+    def iterations(self):
+        return int(conf()["PBKDF2_ITERATIONS"] or PBKDF2PasswordHasher.iterations)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """time_cost / memory_cost(KiB) / parallelism を PASSWORD_HASHING['ARGON2'] から読む Argon2id。"""
+
+    @property
+    def time_cost(self):
+        return int(conf()["ARGON2"].get("TIME_COST", Argon2PasswordHasher.time_cost))
+
+    @property
+    def memory_cost(self):
+        return int(conf()["ARGON2"].get("MEMORY_COST", Argon2PasswordHasher.memory_cost))
+
+    @property
+    def parallelism(self):
+        return int(conf()["ARGON2"].get("PARALLELISM", Argon2PasswordHasher.parallelism))
+
+
+class HashingBusy(Exception):
+    """ハッシュ計算の空きを待ちきれなかった。"""
+
+
+class _HostSlots:
+    """ファイルの先頭 N バイトを 1 バイトずつ fcntl でロックし、ホスト全体の同時実行数を N に抑える。
+    fcntl のロックはプロセス単位なので、同じプロセス内で使用中のバイトは自分で覚えておく。
+    """
+
+    def __init__(self, path: str, size: int):
+        if fcntl is None:
+            raise ImproperlyConfigured("PASSWORD_HASHING['SCOPE']='host' には fcntl が必要です")
+        self.path = path
+        self.size = size
+        self._lock = threading.Lock()
+        self._held: set[int] = set()
+        self._pid = None
+        self._fd = None
+
+    def try_acquire(self) -> int | None:
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork 後は親から引き継いだ fd を使わない（ロックは子に引き継がれない）
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                self._pid = os.getpid()
+                self._held.clear()
+            for i in range(self.size):
+                if i in self._held:
+                    continue
+                try:
+                    fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, i)
+                except OSError:
+                    continue
+                self._held.add(i)
+                return i
+            return None
+
+    def release(self, i: int) -> None:
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, i)
+            self._held.discard(i)
+
+
+class HashingLimiter:
+    def __init__(self, max_concurrency: int, wait_s: float, scope: str = "process", lock_path: str | None = None):
+        self.wait_s = wait_s
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._host = None
+        if scope == "host":
+            path = lock_path or os.path.join(tempfile.gettempdir(), "oyako-password-hashing.lock")
+            self._host = _HostSlots(path, max_concurrency)
+        elif scope != "process":
+            raise ImproperlyConfigured(f"PASSWORD_HASHING['SCOPE'] は 'process' か 'host' です: {scope!r}")
+
+    @contextmanager
+    def slot(self):
+        deadline = time.monotonic() + self.wait_s
+        if not self._semaphore.acquire(timeout=self.wait_s):
+            metrics.inc("password_hashing_rejected_total")
+            raise HashingBusy()
+        try:
+            held = None
+            if self._host is not None:
+                held = self._host.try_acquire()
+                while held is None:
+                    if time.monotonic() >= deadline:
+                        metrics.inc("password_hashing_rejected_total")
+                        raise HashingBusy()
+                    time.sleep(0.01)
+                    held = self._host.try_acquire()
+            try:
+                with metrics.track_in_progress("password_hashing_in_progress"):
+                    yield
+            finally:
+                if held is not None:
+                    self._host.release(held)
+        finally:
+            self._semaphore.release()
+
+
+_limiter: HashingLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def hashing_slot():
+    """ハッシュ計算 1 件分の枠を確保するコンテキストマネージャ。"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                c = conf()
+                _limiter = HashingLimiter(
+                    max_concurrency=max(1, int(c["MAX_CONCURRENCY"])),
+                    wait_s=float(c["WAIT_S"]),
+                    scope=c["SCOPE"],
+                    lock_path=c["LOCK_PATH"],
+                )
+    return _limiter.slot()
@@ -0,0 +1,452 @@
+"""施設データの一括取込（CSV / NDJSON → COPY → 集合演算による upsert）。
+
+処理の流れ:
+1. 入力をストリームで読み、行単位の検証（name/lat/lng/JSON）を Python 側で行う。
+2. UNLOGGED のステージングテーブルへ COPY FROM STDIN で流し込む（行ごとの INSERT はしない）。
+3. SQL でカテゴリ未定義・座標範囲外・google_place_id 重複などを一括で棄却する。
+4. places / place_features へ 1 文ずつ upsert する（manual_lock = true の施設は上書きしない）。
+   google_place_id の無い行は (name, 位置が NATURAL_KEY_RADIUS_M 以内) を自然キーとして、
+   google_place_id の無い既存施設と照合する（再取込で重複を作らない）。
+5. 取込対象の place_stats を 1 回の集合演算で再計算し、最後に ANALYZE する。
+"""
+import csv
+import io
+import json
+import time
+import uuid
+from typing import IO, Iterable, Iterator
+
+from django.db import connection, transaction
+
+from core.review_views import refresh_place_stats_bulk
+from core.schema import has_table
+
+# ステージングへ COPY する列（順序は COPY の列指定と一致させる）
+STAGING_COLUMNS = (
+    "line_no",
+    "google_place_id",
+    "name",
+    "kana",
+    "category_code",
+    "description",
+    "address",
+    "phone",
+    "website_url",
+    "price_range",
+    "opening_hours",
+    "lat",
+    "lng",
+    "data_source",
+    "features",
+)
+
+# place_features.value（smallint）の範囲
+SMALLINT_MIN, SMALLINT_MAX = -32768, 32767
+
+# google_place_id の無い行の自然キー（同名で、この距離以内の施設は同一とみなす）
+NATURAL_KEY_RADIUS_M = 10.0
+
+# --defer-indexes 指定時に取込中だけ外す二次インデックス（google_place_id の一意制約は upsert に必要なので対象外）
+# 削除・再作成は取込トランザクションの外で CONCURRENTLY に行う（places を長時間 ACCESS EXCLUSIVE でロックしない）。
+# ただし取込中は検索が索引なしで動くため、メンテナンス時間帯での利用を前提とする。
+DEFERRABLE_INDEXES = {
+    "idx_places_category": "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_places_category ON places (category_id)",
+    "idx_places_geog": "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_places_geog ON places USING GIST (geog)",
+    "idx_places_search": "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_places_search ON places USING GIN (search_vector)",
+}
+
+
+class RowError(ValueError):
+    """入力1行の検証エラー。"""
+
+
+def _text(value) -> str | None:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _parse_features(value) -> list[dict] | None:
+    """features を [{code, value, detail}] に正規化する。
+    - CSV: "nursing_room|diaper_table:2"（コード[:値] を | 区切り）
+    - NDJSON: ["nursing_room", ...] / [{"code": ..., "value": ..., "detail": ...}] / {"nursing_room": 1}
+    """
+    if value is None or value == "":
+        return None
+    items: list[dict] = []
+    if isinstance(value, str):
+        for token in value.split("|"):
+            token = token.strip()
+            if not token:
+                continue
+            code, _, raw = token.partition(":")
+            # 値の整数変換と RowError への変換は下の共通処理で行う
+            items.append({"code": code.strip(), "value": raw.strip() if raw else 1, "detail": None})
+    elif isinstance(value, dict):
+        items = [{"code": str(code), "value": v, "detail": None} for code, v in value.items()]
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, str):
+                items.append({"code": item, "value": 1, "detail": None})
+            elif isinstance(item, dict) and item.get("code"):
+                items.append({"code": str(item["code"]), "value": item.get("value", 1), "detail": item.get("detail")})
+            else:
+                raise RowError("invalid features item")
+    else:
+        raise RowError("invalid features")
+    # 同一コードは最後の指定を採用（place_features の upsert 衝突を避ける）
+    deduped = {}
+    for item in items:
+        try:
+            item["value"] = None if item["value"] is None else int(item["value"])
+        except (TypeError, ValueError):
+            raise RowError(f"invalid feature value: {item['code']}")
+        # place_features.value は smallint。範囲外は取込の 1 文全体を失敗させるため、ここで行単位に棄却する
+        if item["value"] is not None and not SMALLINT_MIN <= item["value"] <= SMALLINT_MAX:
+            raise RowError(f"feature value out of range: {item['code']}")
+        deduped[item["code"]] = item
+    return list(deduped.values())
+
+
+def normalize_record(record: dict, line_no: int) -> list:
+    """入力1件をステージング行（STAGING_COLUMNS 順）に変換する。"""
+    name = _text(record.get("name"))
+    if not name:
+        raise RowError("name is required")
+    try:
+        lat = float(record.get("lat"))
+        lng = float(record.get("lng"))
+    except (TypeError, ValueError):
+        raise RowError("lat/lng must be numbers")
+
+    opening_hours = record.get("opening_hours", record.get("opening_hours_json"))
+    if isinstance(opening_hours, str):
+        opening_hours = opening_hours.strip() or None
+        if opening_hours is not None:
+            try:
+                opening_hours = json.loads(opening_hours)
+            except ValueError:
+                raise RowError("opening_hours must be JSON")
+
+    features = _parse_features(record.get("features"))
+    google_place_id = _text(record.get("google_place_id"))
+    data_source = _text(record.get("data_source")) or ("google" if google_place_id else "manual")
+    return [
+        line_no,
+        google_place_id,
+        name,
+        _text(record.get("kana")),
+        _text(record.get("category") or record.get("category_code")),
+        _text(record.get("description")),
+        _text(record.get("address")),
+        _text(record.get("phone")),
+        _text(record.get("website_url")),
+        _text(record.get("price_range")),
+        json.dumps(opening_hours, ensure_ascii=False) if opening_hours is not None else None,
+        lat,
+        lng,
+        data_source,
+        json.dumps(features, ensure_ascii=False) if features is not None else None,
+    ]
+
+
+def iter_records(stream: IO[str], fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """入力を (行番号, レコード, エラー) で逐次返す。"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for line_no, record in enumerate(reader, start=2):
+            yield line_no, record, None
+        return
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, None, "invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "record must be an object"
+            continue
+        yield line_no, record, None
+
+
+class CopyStream(io.RawIOBase):
+    """行イテレータを COPY FROM STDIN 用のファイルライクに変換する（全件をメモリに載せない）。"""
+
+    def __init__(self, rows: Iterable[list]):
+        self._rows = iter(rows)
+        self._buffer = b""
+        self._out = io.StringIO()
+        self._writer = csv.writer(self._out, lineterminator="\n")
+
+    def readable(self) -> bool:
+        return True
+
+    def _next_chunk(self) -> bytes:
+        # 数百行ずつまとめて CSV 化する
+        for _ in range(500):
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                break
+            self._writer.writerow(["\\N" if v is None else v for v in row])
+        data = self._out.getvalue().encode("utf-8")
+        self._out.seek(0)
+        self._out.truncate(0)
+        return data
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def import_places(
+    stream: IO[str],
+    fmt: str,
+    defer_indexes: bool = False,
+    refresh_stats: bool = True,
+    on_reject=None,
+) -> dict:
+    """施設を一括取込し、件数・所要時間のレポートを返す。
+    - on_reject(line_no, reason) が指定されていれば棄却行ごとに呼ぶ。
+    - defer_indexes=True は DROP/CREATE INDEX CONCURRENTLY を使うため、トランザクションの外から呼ぶこと。
+    """
+    started = time.monotonic()
+    report = {"read": 0, "staged": 0, "rejected": 0, "inserted": 0, "updated": 0, "skipped_locked": 0, "features": 0}
+    staging = f"import_places_{uuid.uuid4().hex[:12]}"
+
+    def reject(line_no: int, reason: str):
+        report["rejected"] += 1
+        if on_reject:
+            on_reject(line_no, reason)
+
+    def staged_rows():
+        for line_no, record, error in iter_records(stream, fmt):
+            report["read"] += 1
+            if error:
+                reject(line_no, error)
+                continue
+            try:
+                row = normalize_record(record, line_no)
+            except RowError as exc:
+                reject(line_no, str(exc))
+                continue
+            report["staged"] += 1
+            yield row
+
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            CREATE UNLOGGED TABLE {staging} (
+              line_no         int NOT NULL,
+              google_place_id text,
+              name            text NOT NULL,
+              kana            text,
+              category_code   text,
+              description     text,
+              address         text,
+              phone           text,
+              website_url     text,
+              price_range     text,
+              opening_hours   text,
+              lat             double precision NOT NULL,
+              lng             double precision NOT NULL,
+              data_source     text,
+              features        text,
+              place_id        uuid NOT NULL DEFAULT uuid_generate_v4(),
+              matched         boolean NOT NULL DEFAULT false,
+              locked          boolean NOT NULL DEFAULT false,
+              rejected_reason text
+            ) WITH (autovacuum_enabled = false)
+            """
+        )
+        try:
+            # 1) COPY でステージングへ流し込む
+            cur.copy_expert(
+                f"COPY {staging} ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                CopyStream(staged_rows()),
+            )
+            cur.execute(f"ANALYZE {staging}")
+
+            # 2) SQL 側の検証（集合演算で一括判定）
+            cur.execute(
+                f"""
+                UPDATE {staging} s SET rejected_reason = CASE
+                    WHEN s.lat NOT BETWEEN -90 AND 90 OR s.lng NOT BETWEEN -180 AND 180 THEN 'lat/lng out of range'
+                    WHEN s.data_source NOT IN ('google', 'manual') THEN 'invalid data_source'
+                    WHEN NOT EXISTS (SELECT 1 FROM categories c WHERE c.code = s.category_code) THEN 'unknown category'
+                END
+                """
+            )
+            cur.execute(
+                f"""
+                UPDATE {staging} s SET rejected_reason = 'duplicate google_place_id (later line wins)'
+                FROM {staging} later
+                WHERE s.rejected_reason IS NULL AND later.rejected_reason IS NULL
+                  AND s.google_place_id IS NOT NULL
+                  AND later.google_place_id = s.google_place_id
+                  AND later.line_no > s.line_no
+                """
+            )
+            cur.execute(
+                f"""
+                UPDATE {staging} s SET rejected_reason = 'duplicate place (same name and location, later line wins)'
+                FROM {staging} later
+                WHERE s.rejected_reason IS NULL AND later.rejected_reason IS NULL
+                  AND s.google_place_id IS NULL AND later.google_place_id IS NULL
+                  AND later.name = s.name
+                  AND later.line_no > s.line_no
+                  AND ST_DWithin(ST_SetSRID(ST_MakePoint(s.lng, s.lat), 4326)::geography,
+                                 ST_SetSRID(ST_MakePoint(later.lng, later.lat), 4326)::geography, %s)
+                """,
+                [NATURAL_KEY_RADIUS_M],
+            )
+            cur.execute(f"SELECT line_no, rejected_reason FROM {staging} WHERE rejected_reason IS NOT NULL ORDER BY line_no")
+            for line_no, reason in cur.fetchall():
+                report["staged"] -= 1
+                reject(line_no, reason)
+
+            # google_place_id の無い行は自然キーで既存施設と照合する（索引を外す前に行う）
+            cur.execute(
+                f"""
+                UPDATE {staging} s SET place_id = m.id, locked = m.manual_lock, matched = true
+                FROM (
+                    SELECT DISTINCT ON (s2.line_no) s2.line_no, p.id, p.manual_lock
+                    FROM {staging} s2
+                    JOIN places p
+                      ON p.google_place_id IS NULL AND p.name = s2.name
+                     AND ST_DWithin(p.geog, ST_SetSRID(ST_MakePoint(s2.lng, s2.lat), 4326)::geography, %s)
+                    WHERE s2.rejected_reason IS NULL AND s2.google_place_id IS NULL
+                    ORDER BY s2.line_no, p.created_at, p.id
+                ) AS m
+                WHERE s.line_no = m.line_no
+                """,
+                [NATURAL_KEY_RADIUS_M],
+            )
+
+            if defer_indexes:
+                # トランザクションの外で外す（外している間の検索は遅くなるが、ブロックはされない）
+                for name in DEFERRABLE_INDEXES:
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+            with transaction.atomic():
+                # 3) places へ一括 upsert（manual_lock の施設は更新しない）
+                cur.execute(
+                    f"""
+                    WITH up AS (
+                        INSERT INTO places (id, name, kana, category_id, description, address, phone, website_url,
+                                            price_range, opening_hours_json, geog, google_place_id, data_source)
+                        SELECT s.place_id, s.name, s.kana, c.id, s.description, s.address, s.phone, s.website_url,
+                               s.price_range, s.opening_hours::jsonb,
+                               ST_SetSRID(ST_MakePoint(s.lng, s.lat), 4326)::geography,
+                               s.google_place_id, s.data_source::data_source
+                        FROM {staging} s
+                        JOIN categories c ON c.code = s.category_code
+                        WHERE s.rejected_reason IS NULL AND NOT s.matched
+                        ON CONFLICT (google_place_id) DO UPDATE
+                        SET name = EXCLUDED.name,
+                            kana = EXCLUDED.kana,
+                            category_id = EXCLUDED.category_id,
+                            description = EXCLUDED.description,
+                            address = EXCLUDED.address,
+                            phone = EXCLUDED.phone,
+                            website_url = EXCLUDED.website_url,
+                            price_range = EXCLUDED.price_range,
+                            opening_hours_json = EXCLUDED.opening_hours_json,
+                            geog = EXCLUDED.geog,
+                            data_source = EXCLUDED.data_source
+                        WHERE places.manual_lock = false
+                        RETURNING (xmax = 0) AS inserted
+                    )
+                    SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM up
+                    """
+                )
+                report["inserted"], report["updated"] = cur.fetchone()
+
+                # 自然キーで照合できた既存施設（google_place_id なし）を更新
+                cur.execute(
+                    f"""
+                    UPDATE places p
+                    SET name = s.name,
+                        kana = s.kana,
+                        category_id = c.id,
+                        description = s.description,
+                        address = s.address,
+                        phone = s.phone,
+                        website_url = s.website_url,
+                        price_range = s.price_range,
+                        opening_hours_json = s.opening_hours::jsonb,
+                        geog = ST_SetSRID(ST_MakePoint(s.lng, s.lat), 4326)::geography,
+                        data_source = s.data_source::data_source
+                    FROM {staging} s
+                    JOIN categories c ON c.code = s.category_code
+                    WHERE p.id = s.place_id AND s.matched AND s.rejected_reason IS NULL AND NOT s.locked
+                    """
+                )
+                report["updated"] += cur.rowcount
+
+                # 既存施設の id と manual_lock をステージングへ反映
+                cur.execute(
+                    f"""
+                    UPDATE {staging} s SET place_id = p.id, locked = p.manual_lock
+                    FROM places p
+                    WHERE s.rejected_reason IS NULL AND s.google_place_id IS NOT NULL
+                      AND p.google_place_id = s.google_place_id
+                    """
+                )
+                cur.execute(f"SELECT COUNT(*) FROM {staging} WHERE rejected_reason IS NULL AND locked")
+                report["skipped_locked"] = cur.fetchone()[0]
+
+                # 4) place_features を一括置換（features 列を指定した行のみ。未知のコードは無視）
+                cur.execute(
+                    f"""
+                    DELETE FROM place_features pf
+                    USING {staging} s
+                    WHERE pf.place_id = s.place_id
+                      AND s.rejected_reason IS NULL AND NOT s.locked AND s.features IS NOT NULL
+                    """
+                )
+                cur.execute(
+                    f"""
+                    INSERT INTO place_features (place_id, feature_id, value, detail)
+                    SELECT s.place_id, f.id, x.value, x.detail
+                    FROM {staging} s
+                    CROSS JOIN LATERAL jsonb_to_recordset(s.features::jsonb) AS x(code text, value smallint, detail text)
+                    JOIN features f ON f.code = x.code
+                    WHERE s.rejected_reason IS NULL AND NOT s.locked AND s.features IS NOT NULL
+                    ON CONFLICT (place_id, feature_id) DO UPDATE
+                    SET value = EXCLUDED.value, detail = EXCLUDED.detail
+                    """
+                )
+                report["features"] = cur.rowcount
+
+                # 5) place_stats を 1 回で再計算
+                if refresh_stats and has_table("place_stats"):
+                    cur.execute(f"SELECT place_id FROM {staging} WHERE rejected_reason IS NULL AND NOT locked")
+                    refresh_place_stats_bulk([str(pid) for (pid,) in cur.fetchall()])
+        finally:
+            cur.execute(f"DROP TABLE IF EXISTS {staging}")
+            if defer_indexes:
+                # 取込に失敗した場合も索引は必ず戻す
+                for create_sql in DEFERRABLE_INDEXES.values():
+                    cur.execute(create_sql)
+
+    # 統計情報の更新は取込完了後に 1 回だけ行う
+    with connection.cursor() as cur:
+        cur.execute("ANALYZE places")
+        cur.execute("ANALYZE place_features")
+
+    elapsed = time.monotonic() - started
+    report["elapsed_s"] = round(elapsed, 3)
+    report["rows_per_s"] = round(report["read"] / elapsed, 1) if elapsed > 0 else None
+    return report
@@ -0,0 +1,393 @@
+"""遅いクエリの捕捉と EXPLAIN (ANALYZE, BUFFERS) のサンプリング。
+
+- QUERY_PLANS['ENABLED'] が True のときだけ動く（既定は無効）。
+- 対象: SAMPLE_RATE の割合で抽選されたリクエスト内の全 SELECT ＋ SLOW_MS 以上かかった SELECT。
+- 候補はリクエスト中に集めるだけで、EXPLAIN はプロセスごとのバックグラウンドスレッドで実行する
+  （submit でキューに入れるだけで応答は待たせない。キューが QUEUE_SIZE 件で満杯なら捨てる）。
+  - SELECT のみ対象、ロールバック前提のトランザクション内で statement_timeout 付きで実行する。
+  - 同じ形（正規化SQL のハッシュ）はプロセス内で SHAPE_COOLDOWN_S 秒に 1 回まで。
+- 保存先: STORE='table'（query_plan_samples）または 'file'（FILE_PATH へ NDJSON 追記）。
+- 一覧は `python manage.py query_plans` で確認する。
+"""
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from core.middleware import sql_fingerprint
+from core.schema import has_table
+
+logger = logging.getLogger("core.query_plans")
+
+STORES = ("table", "file")
+
+_SELECT_RE = re.compile(r"^\s*(?:\(\s*)*(select|with)\b", re.IGNORECASE)
+_WRITE_RE = re.compile(r"\b(insert|update|delete|merge)\b|\bfor\s+(update|share|no\s+key\s+update|key\s+share)\b", re.IGNORECASE)
+# 副作用のある関数（セッション単位の advisory lock はロールバックしても解放されない、シーケンスは戻らない等）
+_SIDE_EFFECT_RE = re.compile(
+    r"\b(pg_\w*advisory\w*|nextval|setval|set_config|pg_notify|pg_sleep\w*|pg_cancel_backend|pg_terminate_backend"
+    r"|pg_reload_conf|pg_rotate_logfile|pg_switch_wal|pg_stat_reset\w*|lo_\w+|dblink\w*)\s*\(",
+    re.IGNORECASE,
+)
+_FROM_RE = re.compile(r"\bfrom\b", re.IGNORECASE)
+
+
+def conf() -> dict:
+    defaults = {
+        "ENABLED": False,
+        "SAMPLE_RATE": 0.0,
+        "SLOW_MS": 200.0,
+        "STORE": "table",
+        "FILE_PATH": None,
+        "MAX_PER_REQUEST": 3,
+        "SHAPE_COOLDOWN_S": 60.0,
+        "TIMEOUT_MS": 5000,
+        "QUEUE_SIZE": 100,
+    }
+    defaults.update(getattr(settings, "QUERY_PLANS", {}))
+    return defaults
+
+
+def explainable(sql: str) -> bool:
+    """EXPLAIN ANALYZE しても副作用がない文か。
+    書き込み・行ロック・副作用のある関数を含むもの、テーブルを読まないもの（`SELECT pg_try_advisory_lock(...)` のような
+    関数呼び出しだけの文）は除外する。
+    """
+    return (
+        bool(_SELECT_RE.match(sql))
+        and bool(_FROM_RE.search(sql))
+        and not _WRITE_RE.search(sql)
+        and not _SIDE_EFFECT_RE.search(sql)
+    )
+
+
+class PlanCollector:
+    """1 リクエスト分の EXPLAIN 候補を集める（RequestStats.plans に載る）。"""
+
+    __slots__ = ("sampled", "slow_ms", "limit", "candidates")
+
+    def __init__(self, sampled: bool, slow_ms: float, limit: int):
+        self.sampled = sampled
+        self.slow_ms = slow_ms
+        self.limit = limit
+        # fingerprint → (sql, params, elapsed_ms, reason)。同じ形は最も遅いものだけ残す
+        self.candidates: dict[str, tuple] = {}
+
+    def offer(self, sql: str, params, many: bool, elapsed_ms: float) -> None:
+        slow = elapsed_ms >= self.slow_ms
+        if many or not (self.sampled or slow) or not explainable(sql):
+            return
+        fingerprint, _ = sql_fingerprint(sql)
+        current = self.candidates.get(fingerprint)
+        if current is not None:
+            if elapsed_ms > current[2]:
+                self.candidates[fingerprint] = (sql, params, elapsed_ms, "slow" if slow else "sampled")
+            return
+        if len(self.candidates) >= self.limit:
+            return
+        self.candidates[fingerprint] = (sql, params, elapsed_ms, "slow" if slow else "sampled")
+
+
+def new_collector() -> PlanCollector | None:
+    """設定が有効ならリクエスト用の PlanCollector を返す（無効なら None）。"""
+    c = conf()
+    if not c["ENABLED"]:
+        return None
+    sampled = random.random() < float(c["SAMPLE_RATE"])
+    return PlanCollector(sampled, float(c["SLOW_MS"]), int(c["MAX_PER_REQUEST"]))
+
+
+_cooldown_lock = threading.Lock()
+_last_captured: dict[str, float] = {}
+
+
+def _claim_shape(fingerprint: str, cooldown_s: float) -> bool:
+    now = time.monotonic()
+    with _cooldown_lock:
+        last = _last_captured.get(fingerprint)
+        if last is not None and now - last < cooldown_s:
+            return False
+        _last_captured[fingerprint] = now
+        if len(_last_captured) > 10000:
+            _last_captured.clear()
+        return True
+
+
+def explain(sql: str, params, timeout_ms: int) -> dict:
+    """EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) を実行し、先頭要素（Plan/Planning Time/Execution Time）を返す。
+    ANALYZE は実際に実行されるため、必ずロールバックする。
+    """
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = %s", [int(timeout_ms)])
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+            row = cur.fetchone()
+        transaction.set_rollback(True)
+    result = row[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]
+
+
+def capture(collector: PlanCollector, route: str | None, trace_id: str) -> int:
+    """集めた候補を EXPLAIN して保存する。保存件数を返す（失敗はログのみで応答には影響させない）。"""
+    c = conf()
+    saved = 0
+    for fingerprint, (sql, params, elapsed_ms, reason) in collector.candidates.items():
+        if not _claim_shape(fingerprint, float(c["SHAPE_COOLDOWN_S"])):
+            continue
+        try:
+            result = explain(sql, params, int(c["TIMEOUT_MS"]))
+        except DatabaseError as exc:
+            logger.warning("EXPLAIN failed fingerprint=%s trace_id=%s: %s", fingerprint, trace_id, exc)
+            continue
+        _, normalized = sql_fingerprint(sql)
+        sample = {
+            "fingerprint": fingerprint,
+            "query": normalized,
+            "route": route,
+            "trace_id": trace_id,
+            "reason": reason,
+            "duration_ms": round(elapsed_ms, 3),
+            "planning_ms": result.get("Planning Time"),
+            "execution_ms": result.get("Execution Time"),
+            "plan": result.get("Plan"),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            save_sample(sample, c["STORE"])
+            saved += 1
+        except (DatabaseError, OSError) as exc:
+            logger.warning("failed to store query plan fingerprint=%s: %s", fingerprint, exc)
+    return saved
+
+
+_worker_lock = threading.Lock()
+_worker: threading.Thread | None = None
+_worker_pid: int | None = None
+_queue: queue.Queue | None = None
+
+
+def _ensure_worker() -> queue.Queue:
+    """EXPLAIN 用のスレッドを起動してキューを返す（fork 後の子プロセスでは起動し直す）。"""
+    global _worker, _worker_pid, _queue
+    if _worker is not None and _worker_pid == os.getpid() and _worker.is_alive():
+        return _queue
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid() or not _worker.is_alive():
+            _queue = queue.Queue(maxsize=max(1, int(conf()["QUEUE_SIZE"])))
+            _worker_pid = os.getpid()
+            _worker = threading.Thread(target=_run, args=(_queue,), name="query-plans", daemon=True)
+            _worker.start()
+    return _queue
+
+
+def _run(jobs: queue.Queue) -> None:
+    while True:
+        collector, route, trace_id = jobs.get()
+        try:
+            capture(collector, route, trace_id)
+        except Exception:
+            logger.exception("query plan capture failed trace_id=%s", trace_id)
+        finally:
+            # スレッドの接続は使い回す（CONN_MAX_AGE 超過・異常時のみ閉じる）
+            connection.close_if_unusable_or_obsolete()
+
+
+def submit(collector: PlanCollector, route: str | None, trace_id: str) -> bool:
+    """集めた候補をバックグラウンドの EXPLAIN に渡す。キューが満杯なら捨てて False を返す。"""
+    try:
+        _ensure_worker().put_nowait((collector, route, trace_id))
+    except queue.Full:
+        logger.warning("query plan queue is full; dropped trace_id=%s", trace_id)
+        return False
+    return True
+
+
+def _file_path() -> Path:
+    path = conf()["FILE_PATH"]
+    return Path(path) if path else Path(settings.BASE_DIR) / "var" / "query_plans.ndjson"
+
+
+_file_lock = threading.Lock()
+
+
+def save_sample(sample: dict, store: str) -> None:
+    if store == "file":
+        path = _file_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps(sample, ensure_ascii=False) + "\n"
+        with _file_lock, path.open("a", encoding="utf-8") as f:
+            f.write(line)
+        return
+
+    if not has_table("query_plan_samples"):
+        logger.warning("query_plan_samples does not exist; run migrate or set QUERY_PLANS['STORE']='file'")
+        return
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO query_plan_samples
+                (fingerprint, query, route, trace_id, reason, duration_ms, planning_ms, execution_ms, plan)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb)
+            """,
+            [
+                sample["fingerprint"],
+                sample["query"],
+                sample["route"],
+                sample["trace_id"],
+                sample["reason"],
+                sample["duration_ms"],
+                sample["planning_ms"],
+                sample["execution_ms"],
+                json.dumps(sample["plan"]),
+            ],
+        )
+
+
+def load_samples(since: datetime, store: str) -> list[dict]:
+    """集計用に since 以降のサンプルを返す（plan は含めず sample_id で後から引く）。"""
+    if store == "file":
+        path = _file_path()
+        if not path.exists():
+            return []
+        rows = []
+        with path.open(encoding="utf-8") as f:
+            for n, line in enumerate(f):
+                try:
+                    sample = json.loads(line)
+                except ValueError:
+                    continue
+                created = datetime.fromisoformat(sample["created_at"])
+                if created < since:
+                    continue
+                sample["sample_id"] = n
+                rows.append(sample)
+        return rows
+
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT id, fingerprint, query, route, reason, duration_ms, execution_ms, created_at
+            FROM query_plan_samples
+            WHERE created_at >= %s
+            """,
+            [since],
+        )
+        cols = ["sample_id", "fingerprint", "query", "route", "reason", "duration_ms", "execution_ms", "created_at"]
+        return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+
+def load_plan(sample_id, store: str) -> dict | None:
+    if store == "file":
+        with _file_path().open(encoding="utf-8") as f:
+            for n, line in enumerate(f):
+                if n == sample_id:
+                    return json.loads(line).get("plan")
+        return None
+    with connection.cursor() as cur:
+        cur.execute("SELECT plan FROM query_plan_samples WHERE id = %s", [sample_id])
+        row = cur.fetchone()
+    if not row:
+        return None
+    return json.loads(row[0]) if isinstance(row[0], str) else row[0]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def worst_shapes(since: datetime, store: str, order: str = "p95", limit: int = 10) -> list[dict]:
+    """正規化SQL の形ごとに件数/平均/p95/最大/合計を集計し、order の降順で返す。"""
+    groups: dict[str, list[dict]] = {}
+    for sample in load_samples(since, store):
+        groups.setdefault(sample["fingerprint"], []).append(sample)
+
+    shapes = []
+    for fingerprint, samples in groups.items():
+        durations = [float(s["duration_ms"]) for s in samples]
+        worst = max(samples, key=lambda s: float(s["duration_ms"]))
+        shapes.append(
+            {
+                "fingerprint": fingerprint,
+                "query": worst["query"],
+                "routes": sorted({s["route"] for s in samples if s["route"]}),
+                "count": len(samples),
+                "slow": sum(1 for s in samples if s["reason"] == "slow"),
+                "avg": sum(durations) / len(durations),
+                "p95": _percentile(durations, 0.95),
+                "max": max(durations),
+                "total": sum(durations),
+                "worst_sample_id": worst["sample_id"],
+            }
+        )
+    shapes.sort(key=lambda s: s[order], reverse=True)
+    return shapes[:limit]
+
+
+def prune(older_than: timedelta, store: str) -> int:
+    """保存期間を過ぎたサンプルを削除し、削除件数を返す。"""
+    cutoff = datetime.now(timezone.utc) - older_than
+    if store == "file":
+        path = _file_path()
+        if not path.exists():
+            return 0
+        kept, removed = [], 0
+        with _file_lock:
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        created = datetime.fromisoformat(json.loads(line)["created_at"])
+                    except (ValueError, KeyError):
+                        removed += 1
+                        continue
+                    if created < cutoff:
+                        removed += 1
+                    else:
+                        kept.append(line)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text("".join(kept), encoding="utf-8")
+            tmp.replace(path)
+        return removed
+    with connection.cursor() as cur:
+        cur.execute("DELETE FROM query_plan_samples WHERE created_at < %s", [cutoff])
+        return cur.rowcount
+
+
+def format_plan(node: dict, depth: int = 0) -> list[str]:
+    """EXPLAIN の JSON を 1 ノード 1 行のテキストへ整形する。"""
+    label = node.get("Node Type", "?")
+    if node.get("Relation Name"):
+        label += f" on {node['Relation Name']}"
+    if node.get("Index Name"):
+        label += f" using {node['Index Name']}"
+    parts = [
+        f"rows={node.get('Actual Rows')}/{node.get('Plan Rows')}",
+        f"loops={node.get('Actual Loops')}",
+        f"time={node.get('Actual Total Time')}ms",
+    ]
+    hit, read = node.get("Shared Hit Blocks"), node.get("Shared Read Blocks")
+    if hit is not None or read is not None:
+        parts.append(f"buffers hit={hit or 0} read={read or 0}")
+    if node.get("Sort Method"):
+        parts.append(f"sort={node['Sort Method']}")
+    lines = ["  " * depth + f"-> {label} ({', '.join(parts)})"]
+    for key in ("Index Cond", "Filter", "Hash Cond", "Join Filter"):
+        if node.get(key):
+            lines.append("  " * (depth + 2) + f"{key}: {node[key]}")
+    if node.get("Rows Removed by Filter"):
+        lines.append("  " * (depth + 2) + f"Rows Removed by Filter: {node['Rows Removed by Filter']}")
+    for child in node.get("Plans", []) or []:
+        lines.extend(format_plan(child, depth + 1))
+    return lines
@@ -0,0 +1,141 @@
+"""検索の sort=score / sort=reviews 用の事前計算スコア（place_rank）。
+
+- rank_score: ベイズ平均 (weight * mean + avg_overall * review_count) / (weight + review_count)
+  - mean / weight は search_rank_prior（1 行）。件数の少ない施設は全体平均へ寄せられる。
+  - place_stats の insert/update トリガーで自動更新される。mean の再計算は refresh_rank_scores コマンドで行う。
+- grid_cell: 0.05 度四方のセル番号（SQL 関数 place_grid_cell と同じ式）。
+  (grid_cell, rank_score DESC) の索引により、セルごとに上位 N 件だけを索引順に読めばよい。
+
+半径が大きい場合の挙動:
+- 読むセル数はおおよそ (2r / 5.5km + 1)^2（東京付近、r=30km で 120 前後）で、各セルから最大 offset+limit 件を読む。
+- 半径内に入らない行や q/features で除外される行が多いセルでは、索引を深く読むことになる。
+  それでも半径内の全件を集計・ソートする方式より読み取り量は小さく、件数に比例しない。
+- offset が大きいページほど各セルで読む件数が増える（深いページは遅くなる）。
+
+sort=relevance（距離・評価・件数・テキスト一致の加重和）は 2 段階で求める:
+1. KNN（p.geog <-> 地点）で半径内・フィルタ通過の近い順に CANDIDATES 件を候補にする
+2. 候補だけを対象に SQL でスコアを計算して並べ替える
+候補数で上限が決まるため、半径や該当件数に関係なくコストは一定。
+"""
+import math
+
+from django.conf import settings
+from django.db import connection
+
+from core.schema import has_table
+
+# SQL 関数 place_grid_cell（migrations/0011）と一致させること
+GRID_CELL_DEG = 0.05
+
+# sort 名 → place_rank の列
+RANK_COLUMNS = {
+    "score": "rank_score",
+    "reviews": "rank_reviews",
+}
+
+_EARTH_RADIUS_M = 6371008.8
+# 球面距離と geography（回転楕円体）距離の差を吸収する余裕
+_DISTANCE_MARGIN = 1.01
+
+
+def grid_cell(lat: float, lng: float) -> int:
+    return math.floor((lat + 90) / GRID_CELL_DEG) * 10000 + math.floor((lng + 180) / GRID_CELL_DEG)
+
+
+def _haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * _EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def covering_cells(lat: float, lng: float, radius_m: float) -> list[int]:
+    """中心から半径 radius_m の円と重なるセル番号の一覧（円と交わらない四隅のセルは除く）。"""
+    dlat = radius_m / 111_320.0
+    dlng = radius_m / (111_320.0 * max(math.cos(math.radians(lat)), 1e-6))
+    lat_lo = max(0, math.floor((lat - dlat + 90) / GRID_CELL_DEG))
+    lat_hi = min(int(180 / GRID_CELL_DEG) - 1, math.floor((lat + dlat + 90) / GRID_CELL_DEG))
+    lng_lo = math.floor((lng - dlng + 180) / GRID_CELL_DEG)
+    lng_hi = math.floor((lng + dlng + 180) / GRID_CELL_DEG)
+
+    cells = []
+    for i in range(lat_lo, lat_hi + 1):
+        cell_lat_min = i * GRID_CELL_DEG - 90
+        near_lat = min(max(lat, cell_lat_min), cell_lat_min + GRID_CELL_DEG)
+        for j in range(lng_lo, lng_hi + 1):
+            cell_lng_min = j * GRID_CELL_DEG - 180
+            near_lng = min(max(lng, cell_lng_min), cell_lng_min + GRID_CELL_DEG)
+            if _haversine_m(lat, lng, near_lat, near_lng) <= radius_m * _DISTANCE_MARGIN:
+                cells.append(i * 10000 + j)
+    return cells
+
+
+# sort=relevance の既定値（SEARCH_RANKING['RELEVANCE'] で上書き）
+RELEVANCE_DEFAULTS = {
+    # 各要素は 0〜1 に正規化してから重み付けする
+    "WEIGHTS": {"distance": 0.45, "rating": 0.30, "reviews": 0.10, "text": 0.15},
+    # 距離の減衰: この距離で 0.5、2 倍で 0.25
+    "DISTANCE_HALF_LIFE_M": 1500.0,
+    # レビュー件数: ln(1+n) / ln(1+SATURATION)（SATURATION 件以上は 1）
+    "REVIEWS_SATURATION": 50,
+    # 1 段目（KNN）で取得する候補数。offset+limit がこれを超えるページは返さない
+    "CANDIDATES": 400,
+}
+
+
+def relevance_settings() -> dict:
+    conf = dict(RELEVANCE_DEFAULTS)
+    overrides = getattr(settings, "SEARCH_RANKING", {}).get("RELEVANCE", {})
+    conf.update({k: v for k, v in overrides.items() if k != "WEIGHTS"})
+    conf["WEIGHTS"] = {**RELEVANCE_DEFAULTS["WEIGHTS"], **overrides.get("WEIGHTS", {})}
+    return conf
+
+
+def available() -> bool:
+    return has_table("place_rank")
+
+
+def refresh_rank_scores(weight: float | None = None) -> dict:
+    """全体平均（public レビューの加重平均）を再計算し、全施設の place_rank を更新する。
+    - 値が変わらない行は更新しない。
+    - place_rank が無い施設（トリガー導入前のデータ等）も補完する。
+    """
+    if weight is None:
+        weight = float(getattr(settings, "SEARCH_RANKING", {}).get("PRIOR_WEIGHT", 5))
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE search_rank_prior
+            SET mean = COALESCE((
+                    SELECT SUM(avg_overall * review_count) / NULLIF(SUM(review_count), 0)
+                    FROM place_stats
+                    WHERE avg_overall IS NOT NULL
+                ), mean),
+                weight = %s,
+                updated_at = NOW()
+            RETURNING mean, weight
+            """,
+            [weight],
+        )
+        mean, weight = cur.fetchone()
+        cur.execute(
+            """
+            INSERT INTO place_rank (place_id, grid_cell, rank_score, rank_reviews)
+            SELECT p.id,
+                   place_grid_cell(p.geog),
+                   (%(weight)s * %(mean)s + COALESCE(ps.avg_overall, 0) * COALESCE(ps.review_count, 0))
+                     / (%(weight)s + COALESCE(ps.review_count, 0)),
+                   COALESCE(ps.review_count, 0)
+            FROM places p
+            LEFT JOIN place_stats ps ON ps.place_id = p.id
+            ON CONFLICT (place_id) DO UPDATE
+            SET grid_cell = EXCLUDED.grid_cell,
+                rank_score = EXCLUDED.rank_score,
+                rank_reviews = EXCLUDED.rank_reviews
+            WHERE (place_rank.grid_cell, place_rank.rank_score, place_rank.rank_reviews)
+                  IS DISTINCT FROM (EXCLUDED.grid_cell, EXCLUDED.rank_score, EXCLUDED.rank_reviews)
+            """,
+            {"mean": float(mean), "weight": float(weight)},
+        )
+        changed = cur.rowcount
+    return {"mean": float(mean), "weight": float(weight), "updated": changed}
@@ -0,0 +1,274 @@
+"""API のレート制限（GCRA: Generic Cell Rate Algorithm）。
+
+- 判定は DRF のスロットル（GCRAThrottle）として認証の後に行い、拒否時は Throttled → 429 RATE_LIMITED
+  （Retry-After 付き）になる。判定結果は RateLimitHeadersMiddleware が RateLimit-* ヘッダとして返す。
+- ポリシーは RATE_LIMIT['ROUTES']（URL名単位）、無ければ RATE_LIMIT['DEFAULT']。
+  認証済みはユーザーID、未認証はクライアント IP（DRF の NUM_PROXIES に従う）ごとにバケットを持つ。
+- GCRA はバケットごとに「理論上の到着時刻（TAT）」1 つだけを保存する。
+  - rate=N/期間 → 間隔 T=期間/N、許容量 burst 個（既定 N）。TAT+T-burst*T が現在より先なら拒否
+  - RateLimit-Limit=burst, RateLimit-Remaining=今すぐ送れる残り件数, RateLimit-Reset=満杯に戻るまでの秒数
+- ストア（RATE_LIMIT['STORE']）
+  - 'memory': プロセス内の dict（ワーカーごとに独立。開発・単一プロセス向け）
+  - 'shared': 同一ホストの全ワーカーで共有する mmap ファイル（固定長スロットのハッシュ表 + fcntl のバイト範囲ロック）
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows など。'shared' ストアは使えない
+    fcntl = None
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.throttling import BaseThrottle
+
+from core import metrics
+
+_PERIODS = {"s": 1.0, "m": 60.0, "h": 3600.0, "d": 86400.0}
+
+
+@dataclass(frozen=True)
+class Rate:
+    interval: float  # 1 件あたりの間隔 T（秒）
+    burst: int
+
+    @property
+    def tolerance(self) -> float:
+        return self.interval * self.burst
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: int
+    retry_after: float
+
+
+def parse_rate(rate: str, burst: int | None = None) -> Rate:
+    """'60/min' 形式（DRF と同じく単位は先頭 1 文字: s/m/h/d）を Rate にする。"""
+    num, _, period = rate.partition("/")
+    count = int(num)
+    try:
+        seconds = _PERIODS[period.strip()[0]]
+    except (IndexError, KeyError):
+        raise ImproperlyConfigured(f"RATE_LIMIT: 不正なレート指定です: {rate!r}")
+    if count <= 0:
+        raise ImproperlyConfigured(f"RATE_LIMIT: 件数は 1 以上を指定してください: {rate!r}")
+    return Rate(interval=seconds / count, burst=int(burst or count))
+
+
+def gcra(tat: float | None, now: float, rate: Rate) -> tuple[float | None, RateLimitResult]:
+    """GCRA の 1 判定。(保存する新しい TAT（拒否時は None = 更新しない）, 判定結果) を返す。"""
+    tat = now if tat is None or tat < now else tat
+    new_tat = tat + rate.interval
+    allow_at = new_tat - rate.tolerance
+    if now < allow_at:
+        return None, RateLimitResult(False, rate.burst, 0, math.ceil(tat - now), allow_at - now)
+    # 浮動小数の誤差で 1 件少なく見えないよう僅かに足してから切り捨てる
+    remaining = int((now + rate.tolerance - new_tat) / rate.interval + 1e-9)
+    return new_tat, RateLimitResult(True, rate.burst, remaining, math.ceil(new_tat - now), 0.0)
+
+
+class MemoryStore:
+    """プロセス内ストア。MAX_KEYS を超えたら期限切れ（TAT が過去）のバケットから捨てる。"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self._lock = threading.Lock()
+        self._tats: dict[str, float] = {}
+        self.max_keys = max_keys
+
+    def update(self, key: str, now: float, func: Callable[[float | None], tuple[float | None, RateLimitResult]]) -> RateLimitResult:
+        with self._lock:
+            new_tat, result = func(self._tats.get(key))
+            if new_tat is not None:
+                self._tats[key] = new_tat
+                if len(self._tats) > self.max_keys:
+                    self._evict(now)
+            return result
+
+    def _evict(self, now: float) -> None:
+        expired = [k for k, tat in self._tats.items() if tat <= now]
+        for k in expired:
+            del self._tats[k]
+        # すべて有効なら古く入ったものから 1 割捨てる（その利用者は制限が緩む側に倒れる）
+        overflow = len(self._tats) - self.max_keys
+        if overflow > 0:
+            for k in list(self._tats)[: overflow + self.max_keys // 10]:
+                del self._tats[k]
+
+
+class SharedStore:
+    """同一ホストのワーカー間で共有するストア（mmap したファイル上の固定長ハッシュ表）。
+
+    - スロットは 16 バイト（キーのハッシュ u64 + TAT f64）。キーごとに PROBES 個の連続スロットを探す。
+    - 探索範囲のバイト列を fcntl.lockf で排他ロックする（別プロセス間）。fcntl のロックはプロセス単位なので
+      同一プロセスのスレッド間は threading.Lock で守る。
+    - 空きが無い場合は期限切れ、無ければ TAT が最も古いスロットを上書きする（制限が緩む側に倒れる）。
+    """
+
+    SLOT = struct.Struct("<Qd")
+    PROBES = 8
+
+    def __init__(self, path: str, slots: int = 65536):
+        if fcntl is None:
+            raise ImproperlyConfigured("RATE_LIMIT['STORE']='shared' には fcntl が必要です")
+        self.path = path
+        self.slots = max(int(slots), self.PROBES * 2)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._mm = None
+
+    def _open(self) -> None:
+        # fork 後は親の mmap / fd を引き継がず開き直す
+        size = self.slots * self.SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._mm = mmap.mmap(fd, size)
+        self._pid = os.getpid()
+
+    def _hash(self, key: str) -> int:
+        h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+        return h or 1  # 0 は空きスロットを表す
+
+    def update(self, key: str, now: float, func: Callable[[float | None], tuple[float | None, RateLimitResult]]) -> RateLimitResult:
+        h = self._hash(key)
+        first = h % (self.slots - self.PROBES + 1)
+        start = first * self.SLOT.size
+        length = self.PROBES * self.SLOT.size
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            mm = self._mm
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, start)
+            try:
+                target = None
+                victim, victim_tat = None, math.inf
+                for i in range(self.PROBES):
+                    offset = start + i * self.SLOT.size
+                    slot_hash, slot_tat = self.SLOT.unpack_from(mm, offset)
+                    if slot_hash == h:
+                        target = offset
+                        break
+                    if slot_hash == 0 or slot_tat <= now:
+                        victim, victim_tat = offset, -math.inf
+                    elif slot_tat < victim_tat:
+                        victim, victim_tat = offset, slot_tat
+                tat = self.SLOT.unpack_from(mm, target)[1] if target is not None else None
+                new_tat, result = func(tat)
+                if new_tat is not None:
+                    self.SLOT.pack_into(mm, target if target is not None else victim, h, new_tat)
+                return result
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+
+def _conf() -> dict:
+    return getattr(settings, "RATE_LIMIT", {})
+
+
+class Limiter:
+    """RATE_LIMIT 設定から組み立てたポリシーとストア。"""
+
+    def __init__(self, conf: dict):
+        self.enabled = bool(conf.get("ENABLED", True))
+        self.default = self._compile(conf.get("DEFAULT"))
+        self.routes = {name: self._compile(policy) for name, policy in (conf.get("ROUTES") or {}).items()}
+        store = conf.get("STORE", "memory")
+        if store == "shared":
+            path = conf.get("SHARED_PATH") or os.path.join(tempfile.gettempdir(), "oyako-ratelimit.bin")
+            self.store = SharedStore(path, int(conf.get("SHARED_SLOTS", 65536)))
+        elif store == "memory":
+            self.store = MemoryStore(int(conf.get("MAX_KEYS", 100_000)))
+        else:
+            raise ImproperlyConfigured(f"RATE_LIMIT['STORE'] は 'memory' か 'shared' です: {store!r}")
+
+    @staticmethod
+    def _compile(policy: dict | None) -> dict[str, Rate | None] | None:
+        """{'anon': '60/min', 'user': '180/min', 'burst': 20} → {'anon': Rate, 'user': Rate}。
+        user を省略すると anon と同じ。None のルートは制限しない。
+        """
+        if policy is None:
+            return None
+        burst = policy.get("burst")
+        anon = parse_rate(policy["anon"], burst) if policy.get("anon") else None
+        user = parse_rate(policy["user"], burst) if policy.get("user") else anon
+        return {"anon": anon, "user": user}
+
+    def policy_for(self, route: str | None) -> tuple[str, dict | None]:
+        if route in self.routes:
+            return route, self.routes[route]
+        return "default", self.default
+
+    def check(self, scope: str, rate: Rate, ident: str, now: float | None = None) -> RateLimitResult:
+        now = time.time() if now is None else now
+        return self.store.update(f"{scope}|{ident}", now, lambda tat: gcra(tat, now, rate))
+
+
+_limiter: Limiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> Limiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = Limiter(_conf())
+    return _limiter
+
+
+def reset_limiter() -> None:
+    """設定を読み直す（override_settings で RATE_LIMIT を差し替えたとき用）。"""
+    global _limiter
+    _limiter = None
+
+
+class GCRAThrottle(BaseThrottle):
+    """DRF のスロットル。判定結果を HttpRequest.rate_limit に残し、ヘッダはミドルウェアが付ける。"""
+
+    def allow_request(self, request, view) -> bool:
+        self._wait = None
+        limiter = get_limiter()
+        if not limiter.enabled:
+            return True
+        match = getattr(request, "resolver_match", None)
+        route = match.url_name if match and match.url_name else None
+        scope, policy = limiter.policy_for(route)
+        if policy is None:
+            return True
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            rate, ident = policy["user"], f"u{user.pk}"
+        else:
+            rate, ident = policy["anon"], f"ip{self.get_ident(request)}"
+        if rate is None:
+            return True
+
+        result = limiter.check(scope, rate, ident)
+        request._request.rate_limit = result
+        if not result.allowed:
+            self._wait = result.retry_after
+            metrics.inc("rate_limited_total", {"route": route or "unmatched"})
+        return result.allowed
+
+    def wait(self) -> float | None:
+        return self._wait
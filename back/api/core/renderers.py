@@ -0,0 +1,83 @@
+"""高速な JSON レンダラ（orjson）。
+
+- datetime / date / time / UUID は orjson がネイティブに直列化する（UTC は "Z" 表記。DRF と同じ）。
+  - 秒の小数部は DRF のようにミリ秒へ丸めず、マイクロ秒まで出力する。
+- Decimal / set / 遅延翻訳文字列などは default で DRF の JSONEncoder と同じ表現に変換する。
+- orjson が無い環境では DRF の JSONRenderer と同じ動作にフォールバックする。
+"""
+import datetime
+import decimal
+import uuid
+
+from django.utils.functional import Promise
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - requirements.txt に含まれるが、無くても動くようにする
+    orjson = None
+
+
+def _default(obj):
+    """orjson が直接扱えない型の変換（rest_framework.utils.encoders.JSONEncoder に合わせる）。"""
+    if isinstance(obj, Promise):
+        return str(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    if hasattr(obj, "__getitem__") and hasattr(obj, "keys"):
+        return dict(obj)
+    if hasattr(obj, "__iter__"):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps(data) -> bytes:
+        return orjson.dumps(data, default=_default, option=_OPTIONS)
+
+else:  # pragma: no cover
+    _fallback = JSONRenderer()
+
+    def dumps(data) -> bytes:
+        return _fallback.render(data)
+
+
+class FastJSONRenderer(BaseRenderer):
+    """REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] の先頭に置く JSON レンダラ。"""
+
+    media_type = "application/json"
+    format = "json"
+    charset = None  # 出力は常に UTF-8 のバイト列
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return dumps(data)
+
+
+class FirstRendererNegotiation(DefaultContentNegotiation):
+    """Accept ヘッダの解析をせず、常に先頭のレンダラを使う（検索・詳細などのホットパス用）。
+    パーサーの選択は DRF の既定どおり Content-Type で行う（合わない本文は 415 になる）。
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderer = renderers[0]
+        return renderer, renderer.media_type
+
+
+class FastJSONMixin:
+    """ホットパスの APIView に付ける。ブラウザブル API とコンテンツネゴシエーションを通さない。"""
+
+    renderer_classes = [FastJSONRenderer]
+    content_negotiation_class = FirstRendererNegotiation
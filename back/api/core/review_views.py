@@ -2,29 +2,49 @@ import base64
 import json
 import uuid
 
+from django.conf import settings
 from django.db import connection, transaction
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from core.exceptions import error_response
+from core.idempotency import idempotent
 from core.models import Place, Review, ReviewAxis, ReviewScore, Photo
+from core.renderers import FastJSONMixin
+from core.schema import has_table
 from core.serializers import ReviewCreateSerializer
 
 
+def lock_place_stats(place_ids: list[str]) -> None:
+    """place_stats の行ロックを place_id 順に取る（トランザクション終了まで保持）。
+    - 再計算（refresh_place_stats / refresh_place_stats_bulk）とモデレーションの差分更新はどちらも集計の前に
+      これを取る。同じ施設の更新は直列になり、ロック後の文（READ COMMITTED では新しいスナップショット）は
+      先にコミットした側の結果を含む（古い再計算が差分更新を上書きしない）。
+    - 行の無い施設はロックされない（差分更新は行のある施設だけが対象）。
+    """
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT 1 FROM place_stats WHERE place_id = ANY(%s::uuid[]) ORDER BY place_id FOR UPDATE",
+            [[str(pid) for pid in place_ids]],
+        )
+
+
 def refresh_place_stats(place_id: str):
     sql = """
-        INSERT INTO place_stats (place_id, avg_overall, review_count, photo_count, last_reviewed_at)
+        INSERT INTO place_stats (place_id, avg_overall, review_count, overall_sum, photo_count, last_reviewed_at)
         SELECT
             %(place_id)s,
             stats.avg_overall,
             stats.review_count,
+            stats.overall_sum,
             stats.photo_count,
             stats.last_reviewed_at
         FROM (
             SELECT
                 AVG(r.overall)::numeric(3,2) AS avg_overall,
                 COUNT(*) AS review_count,
+                COALESCE(SUM(r.overall), 0) AS overall_sum,
                 COALESCE(MAX(r.created_at), NOW()) AS last_reviewed_at,
                 (
                     SELECT COUNT(*)
@@ -37,16 +57,157 @@ def refresh_place_stats(place_id: str):
         ON CONFLICT (place_id) DO UPDATE
         SET avg_overall = EXCLUDED.avg_overall,
             review_count = EXCLUDED.review_count,
+            overall_sum = EXCLUDED.overall_sum,
+            photo_count = EXCLUDED.photo_count,
+            last_reviewed_at = EXCLUDED.last_reviewed_at
+    """
+    with transaction.atomic():
+        lock_place_stats([str(place_id)])
+        with connection.cursor() as cur:
+            cur.execute(sql, {"place_id": str(place_id)})
+        refresh_age_band_stats([str(place_id)])
+
+
+def refresh_place_stats_bulk(place_ids: list[str]) -> int:
+    """複数施設の place_stats を 1 文（集合演算）で再計算する。
+    - refresh_place_stats と同じ定義（public レビューの平均/件数、施設・レビュー写真の件数）を用いる。
+    - place_age_band_stats（年齢帯ごとの集計）も同じ対象で再計算する。
+    - 集計の前に対象の place_stats 行をロックする（lock_place_stats）。
+    - 戻り値は upsert した行数。
+    """
+    if not place_ids:
+        return 0
+    sql = """
+        WITH target AS (
+            SELECT DISTINCT unnest(%(place_ids)s::uuid[]) AS place_id
+        ),
+        review_agg AS (
+            SELECT r.place_id,
+                   AVG(r.overall)::numeric(3,2) AS avg_overall,
+                   COUNT(*) AS review_count,
+                   SUM(r.overall) AS overall_sum,
+                   MAX(r.created_at) AS last_reviewed_at
+            FROM reviews r
+            JOIN target t ON t.place_id = r.place_id
+            WHERE r.status = 'public'
+            GROUP BY r.place_id
+        ),
+        photo_agg AS (
+            -- 施設写真とレビュー写真の和集合（UNION で同一写真の重複を除く）
+            SELECT x.place_id, COUNT(*) AS photo_count
+            FROM (
+                SELECT ph.place_id, ph.id
+                FROM photos ph
+                JOIN target t ON t.place_id = ph.place_id
+                UNION
+                SELECT r.place_id, ph.id
+                FROM photos ph
+                JOIN reviews r ON r.id = ph.review_id
+                JOIN target t ON t.place_id = r.place_id
+            ) AS x
+            GROUP BY x.place_id
+        )
+        INSERT INTO place_stats (place_id, avg_overall, review_count, overall_sum, photo_count, last_reviewed_at)
+        SELECT t.place_id,
+               ra.avg_overall,
+               COALESCE(ra.review_count, 0),
+               COALESCE(ra.overall_sum, 0),
+               COALESCE(pa.photo_count, 0),
+               COALESCE(ra.last_reviewed_at, NOW())
+        FROM target t
+        LEFT JOIN review_agg ra ON ra.place_id = t.place_id
+        LEFT JOIN photo_agg pa ON pa.place_id = t.place_id
+        ON CONFLICT (place_id) DO UPDATE
+        SET avg_overall = EXCLUDED.avg_overall,
+            review_count = EXCLUDED.review_count,
+            overall_sum = EXCLUDED.overall_sum,
             photo_count = EXCLUDED.photo_count,
             last_reviewed_at = EXCLUDED.last_reviewed_at
     """
+    with transaction.atomic():
+        lock_place_stats(place_ids)
+        with connection.cursor() as cur:
+            cur.execute(sql, {"place_ids": [str(pid) for pid in place_ids]})
+            count = cur.rowcount
+        refresh_age_band_stats(place_ids)
+    return count
+
+
+def refresh_age_band_stats(place_ids: list[str]) -> None:
+    """指定施設の place_age_band_stats を 1 文（集合演算）で再計算する。
+    - public かつ age_band_id のあるレビューを (施設, 年齢帯) で集計し、無くなった組み合わせの行は消す。
+    - 値が変わらない行は更新しない。
+    """
+    if not place_ids or not has_table("place_age_band_stats"):
+        return
+    sql = """
+        WITH target AS (
+            SELECT DISTINCT unnest(%(place_ids)s::uuid[]) AS place_id
+        ),
+        agg AS (
+            SELECT r.place_id, r.age_band_id, COUNT(*) AS review_count, SUM(r.overall) AS overall_sum
+            FROM reviews r
+            JOIN target t ON t.place_id = r.place_id
+            WHERE r.status = 'public' AND r.age_band_id IS NOT NULL
+            GROUP BY r.place_id, r.age_band_id
+        ),
+        removed AS (
+            DELETE FROM place_age_band_stats ab
+            USING target t
+            WHERE ab.place_id = t.place_id
+              AND NOT EXISTS (SELECT 1 FROM agg a WHERE a.place_id = ab.place_id AND a.age_band_id = ab.age_band_id)
+        )
+        INSERT INTO place_age_band_stats (place_id, age_band_id, review_count, overall_sum, updated_at)
+        SELECT a.place_id, a.age_band_id, a.review_count, a.overall_sum, NOW()
+        FROM agg a
+        ON CONFLICT (place_id, age_band_id) DO UPDATE
+        SET review_count = EXCLUDED.review_count,
+            overall_sum = EXCLUDED.overall_sum,
+            updated_at = EXCLUDED.updated_at
+        WHERE (place_age_band_stats.review_count, place_age_band_stats.overall_sum)
+              IS DISTINCT FROM (EXCLUDED.review_count, EXCLUDED.overall_sum)
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, {"place_ids": [str(pid) for pid in place_ids]})
+
+
+def place_stats_mode() -> str:
+    return getattr(settings, "PLACE_STATS", {}).get("MODE", "sync")
+
+
+def mark_place_stats_dirty(place_ids: list[str]) -> None:
+    """place_stats_dirty に再計算待ちとして登録する（登録済みなら最終書き込み時刻と件数だけ更新）。"""
     with connection.cursor() as cur:
-        cur.execute(sql, {"place_id": str(place_id)})
+        cur.execute(
+            """
+            INSERT INTO place_stats_dirty (place_id)
+            SELECT DISTINCT unnest(%s::uuid[])
+            ON CONFLICT (place_id) DO UPDATE
+            SET last_dirty_at = NOW(),
+                writes = place_stats_dirty.writes + 1
+            """,
+            [[str(pid) for pid in place_ids]],
+        )
+
+
+def schedule_place_stats_refresh(place_id) -> None:
+    """レビュー書き込みに伴う place_stats の更新（PLACE_STATS['MODE']）。
+    - 'sync': その場で再計算する（書き込みと同じトランザクション）。
+    - 'write_behind': place_stats_dirty へ登録するだけで、再計算は manage.py flush_place_stats がまとめて行う。
+      登録は書き込みと同じトランザクションで行う（登録に失敗すればレビューもロールバックされ、集計が古いまま残らない）。
+      新しい行はコミットまでフラッシャーから見えず、既存の行はコミットまで行ロックで SKIP LOCKED に飛ばされるため、
+      フラッシャーが取り出した後の書き込みは必ず次回の再計算に含まれる。
+    """
+    if place_stats_mode() != "write_behind" or not has_table("place_stats_dirty"):
+        refresh_place_stats(place_id)
+        return
+    mark_place_stats_dirty([str(place_id)])
 
 
 class ReviewCreateView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent("reviews-create")
     def post(self, request):
         serializer = ReviewCreateSerializer(data=request.data)
         if not serializer.is_valid():
@@ -119,7 +280,7 @@ class ReviewCreateView(APIView):
                     photo.review = review
                     photo.place = place
                 Photo.objects.bulk_update(photos, ["review", "place"])
-            refresh_place_stats(place_id)
+            schedule_place_stats_refresh(place_id)
 
         return Response({"review_id": str(review.id)}, status=201)
 
@@ -174,7 +335,7 @@ def _serialize_review(request, review: Review) -> dict:
     }
 
 
-class ReviewListView(APIView):
+class ReviewListView(FastJSONMixin, APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, place_id: str):
@@ -0,0 +1,54 @@
+import threading
+
+from django.db import connection
+
+# 環境によって存在しない可能性がある任意テーブル（Raw SQL/別マイグレーションで作成されるもの）
+OPTIONAL_TABLES = (
+    "place_stats",
+    "photos",
+    "place_source_meta",
+    "review_scores",
+    "query_plan_samples",
+    "place_rank",
+    "idempotency_keys",
+    "user_auth_versions",
+    "place_stats_dirty",
+    "place_age_band_stats",
+    "place_tombstones",
+)
+
+_lock = threading.Lock()
+_capabilities: dict[str, bool] | None = None
+
+
+def _detect() -> dict[str, bool]:
+    """DBのテーブル一覧を1回だけ取得し、任意テーブルの有無を判定する。"""
+    existing = set(connection.introspection.table_names(include_views=True))
+    return {name: name in existing for name in OPTIONAL_TABLES}
+
+
+def get_capabilities() -> dict[str, bool]:
+    """任意テーブルの有無をプロセス単位でキャッシュして返す。
+    - 初回呼び出し時にのみ DB を参照する（以降はメモリ上の値を返す）。
+    - 失敗するクエリ＋例外で分岐する方式と異なり、トランザクションを中断させない。
+    """
+    global _capabilities
+    if _capabilities is None:
+        with _lock:
+            if _capabilities is None:
+                _capabilities = _detect()
+    return _capabilities
+
+
+def has_table(name: str) -> bool:
+    """指定テーブルが存在するか（OPTIONAL_TABLES 以外は常に True とみなす）。"""
+    if name not in OPTIONAL_TABLES:
+        return True
+    return get_capabilities().get(name, False)
+
+
+def reset_capabilities(**kwargs) -> None:
+    """キャッシュを破棄する（migrate 後に post_migrate シグナルから呼ばれる）。"""
+    global _capabilities
+    with _lock:
+        _capabilities = None
@@ -0,0 +1,599 @@
+"""検索用のメモリ内スナップショット（任意機能。NumPy が必要）。
+
+- SEARCH_INDEX['ENABLED'] が True かつ NumPy が import できる場合のみ有効。
+- places / categories / place_features（施設×特徴の真偽行列）/ place_stats を列ごとの NumPy 配列に読み込み、
+  grid セル（core.ranking と同じ 0.05 度）で並べた索引で半径検索する。
+- PlacesSearchView と同じ並び順・同じ items 形式を返す。q（全文検索）指定時は tsvector と同じ判定が
+  できないため None を返し、呼び出し側は SQL にフォールバックする。open_at（営業時間）・age_band 指定時と読み込み完了前も同様。
+- 更新はプロセスごとのバックグラウンドスレッドで行う。
+  - REFRESH_INTERVAL_S ごとに places.updated_at / place_stats.updated_at の透かし以降の行だけを取り込む
+    （コミット遅れを吸収するため OVERLAP_S 分さかのぼる）。place_features の変更は DB のトリガで
+    places.updated_at を進めるため、同じ透かしで拾える（マイグレーション 0020）。
+  - 削除は place_tombstones（places の削除トリガで記録）の透かし以降の行で取り除く。
+  - それでも件数が合わない場合と FULL_RELOAD_S ごとに全件を読み直す。
+  - スナップショットは不変オブジェクトで、差し替えは参照の代入のみ（読み手はロック不要）。
+- SEARCH_INDEX['MODE']='mmap' では、build_search_snapshot コマンド（更新プロセス 1 つ）が列ごとの .npy を
+  SNAPSHOT_DIR に書き出して `current` シンボリックリンクを差し替え、各ワーカーはそれを読み取り専用で mmap する。
+  書き出すのは内容のハッシュ（content_digest）が current と異なる場合のみ。
+  ページキャッシュを全ワーカーで共有するため、ワーカー数が増えてもプロセスごとの RSS はほぼ増えない。
+- 距離は WGS84 楕円体の局所近似で計算する（30km 以内で PostGIS の ST_Distance との差は 1m 未満）。
+  半径の境界ちょうどの施設は SQL と結果が異なり得る。差分は `manage.py search_index_diff` で確認する。
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core.ranking import covering_cells, grid_cell, relevance_settings
+from core.ranking import available as ranking_available
+from core.schema import has_table
+
+try:
+    import numpy as np
+except ImportError:  # NumPy は任意。無ければ常に SQL で検索する
+    np = None
+
+logger = logging.getLogger("core.search_index")
+
+# WGS84
+_WGS84_A = 6378137.0
+_WGS84_E2 = 6.69437999014e-3
+
+# 読み込み時に名前付きカーソルで 1 回に取得する行数
+ITERSIZE = 5000
+
+# スナップショットのファイル形式のバージョン（列の追加・変更時に上げる）
+SNAPSHOT_FORMAT = 2
+# 数値列（mmap 対象）。names は names_offsets / names_data の 2 配列で持つ
+ARRAY_COLUMNS = ("ids", "categories", "lat", "lng", "cells", "avg", "reviews", "created_us", "features")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def conf() -> dict:
+    defaults = {
+        "ENABLED": False,
+        "MODE": "memory",
+        "SNAPSHOT_DIR": None,
+        "CHECK_INTERVAL_S": 5.0,
+        "KEEP_SNAPSHOTS": 2,
+        "REFRESH_INTERVAL_S": 60.0,
+        "FULL_RELOAD_S": 3600.0,
+        "OVERLAP_S": 300.0,
+    }
+    defaults.update(getattr(settings, "SEARCH_INDEX", {}))
+    return defaults
+
+
+def enabled() -> bool:
+    return np is not None and bool(conf()["ENABLED"])
+
+
+def local_distance_m(lat0: float, lng0: float, lat, lng):
+    """(lat0, lng0) から各点までの距離（m）。中間緯度の子午線/卯酉線曲率半径による楕円体の局所近似。"""
+    phi = np.radians((lat + lat0) / 2.0)
+    sin_phi = np.sin(phi)
+    w = 1.0 - _WGS84_E2 * sin_phi * sin_phi
+    meridional = _WGS84_A * (1.0 - _WGS84_E2) / (w * np.sqrt(w))
+    prime_vertical = _WGS84_A / np.sqrt(w)
+    dy = meridional * np.radians(lat - lat0)
+    dx = prime_vertical * np.cos(phi) * np.radians(lng - lng0)
+    return np.hypot(dx, dy)
+
+
+def _place_sql(changed_only: bool) -> str:
+    if has_table("place_stats"):
+        stats_cols = "ps.avg_overall, COALESCE(ps.review_count, 0)"
+        stats_join = "LEFT JOIN place_stats ps ON ps.place_id = p.id"
+    else:
+        stats_cols = "NULL::numeric, 0"
+        stats_join = ""
+    changed = ""
+    if changed_only:
+        stats_changed = (
+            "UNION SELECT place_id FROM place_stats WHERE updated_at >= %(stats_since)s" if has_table("place_stats") else ""
+        )
+        changed = f"""
+            JOIN (
+                SELECT id FROM places WHERE updated_at >= %(places_since)s
+                {stats_changed}
+            ) AS changed ON changed.id = p.id
+        """
+    return f"""
+        SELECT replace(p.id::text, '-', ''), p.name, c.code, c.label, p.lat, p.lng,
+               {stats_cols}, p.created_at,
+               COALESCE((
+                 SELECT array_agg(f.code)
+                 FROM place_features pf
+                 JOIN features f ON f.id = pf.feature_id
+                 WHERE pf.place_id = p.id AND COALESCE(pf.value,1) > 0
+               ), ARRAY[]::text[])
+        FROM places p
+        JOIN categories c ON c.id = p.category_id
+        {stats_join}
+        {changed}
+    """
+
+
+class StringColumn:
+    """可変長文字列の列（UTF-8 のバイト列 data と、各行の開始位置 offsets[n+1]）。mmap でも読める形。"""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_strings(cls, values: list[str]) -> "StringColumn":
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return bytes(self.data[self.offsets[row] : self.offsets[row + 1]]).decode("utf-8")
+
+    def take(self, rows) -> "StringColumn":
+        starts = self.offsets[rows]
+        lengths = self.offsets[np.asarray(rows) + 1] - starts
+        offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return StringColumn(offsets, self.data[positions])
+
+    def concat(self, other: "StringColumn") -> "StringColumn":
+        offsets = np.concatenate((self.offsets, other.offsets[1:] + self.offsets[-1]))
+        return StringColumn(offsets, np.concatenate((self.data, other.data)))
+
+
+def _take(values, rows):
+    return values.take(rows) if isinstance(values, StringColumn) else values[rows]
+
+
+def _concat(a, b):
+    return a.concat(b) if isinstance(a, StringColumn) else np.concatenate((a, b))
+
+
+class Snapshot:
+    """1 時点の検索用配列（不変）。行は grid セル順に並び、cell_ranges で各セルの範囲を引く。
+    - features は施設×特徴のビット列（np.packbits、1 行 ceil(特徴数/8) バイト）
+    - sorted_rows=True の場合は並べ替え済み（mmap したファイル）としてそのまま使う
+    """
+
+    def __init__(self, columns: dict, categories: list[tuple[str, str]], feature_codes: list[str],
+                 prior: tuple[float, float] | None, watermarks: tuple, loaded_at: float, full_loaded_at: float,
+                 sorted_rows: bool = False, cell_ranges: dict | None = None):
+        if sorted_rows:
+            self.columns = columns
+        else:
+            order = np.lexsort((columns["ids"], columns["cells"]))
+            self.columns = {name: _take(values, order) for name, values in columns.items()}
+        self.categories = categories
+        self.category_index = {code: i for i, (code, _) in enumerate(categories)}
+        self.feature_codes = feature_codes
+        self.feature_index = {code: i for i, code in enumerate(feature_codes)}
+        self.prior = prior
+        self.watermarks = watermarks
+        self.loaded_at = loaded_at
+        self.full_loaded_at = full_loaded_at
+
+        if cell_ranges is None:
+            cells = self.columns["cells"]
+            boundaries = np.flatnonzero(np.diff(cells)) + 1
+            starts = np.concatenate(([0], boundaries)) if len(cells) else np.array([], dtype=np.int64)
+            ends = np.concatenate((boundaries, [len(cells)])) if len(cells) else np.array([], dtype=np.int64)
+            cell_ranges = {int(cells[s]): (int(s), int(e)) for s, e in zip(starts, ends)}
+        self.cell_ranges = cell_ranges
+
+    def __len__(self) -> int:
+        return len(self.columns["ids"])
+
+    def _rating(self, idx):
+        """並び替えに使う評価値（SQL と同じく place_rank があればベイズ平均、無ければ平均★）。"""
+        avg = self.columns["avg"][idx]
+        if self.prior is None:
+            return None, avg
+        mean, weight = self.prior
+        n = self.columns["reviews"][idx].astype(np.float64)
+        return (weight * mean + np.nan_to_num(avg, nan=0.0) * n) / (weight + n), avg
+
+    def search(self, lat: float, lng: float, radius_m: float, limit: int, offset: int, sort: str,
+               q: str | None = None, category: str | None = None, features_list: list[str] | None = None,
+               open_minute: int | None = None, age_band: str | None = None,
+               age_band_filter: bool = False) -> list[dict] | None:
+        # 全文検索・営業時間・年齢帯の集計は SQL 側で評価する
+        if q or open_minute is not None or age_band:
+            return None
+        cols = self.columns
+        ranges = [self.cell_ranges[c] for c in covering_cells(lat, lng, radius_m) if c in self.cell_ranges]
+        if not ranges:
+            return []
+        idx = np.concatenate([np.arange(s, e) for s, e in ranges])
+        dist = local_distance_m(lat, lng, cols["lat"][idx], cols["lng"][idx])
+        mask = dist <= radius_m
+        if category:
+            ci = self.category_index.get(category)
+            if ci is None:
+                return []
+            mask &= cols["categories"][idx] == ci
+        for code in features_list or []:
+            fi = self.feature_index.get(code)
+            if fi is None:
+                return []
+            mask &= ((cols["features"][idx, fi >> 3] >> (7 - (fi & 7))) & 1).astype(bool)
+        idx, dist = idx[mask], dist[mask]
+        ids = cols["ids"][idx]
+
+        if sort == "score":
+            bayes, avg = self._rating(idx)
+            key = bayes if bayes is not None else np.nan_to_num(avg, nan=0.0)
+            order = np.lexsort((ids, dist, -key))
+        elif sort == "reviews":
+            order = np.lexsort((ids, dist, -cols["reviews"][idx]))
+        elif sort == "new":
+            order = np.lexsort((ids, dist, -cols["created_us"][idx]))
+        elif sort == "relevance":
+            rel = relevance_settings()
+            weights = rel["WEIGHTS"]
+            candidates = np.lexsort((ids, dist))[: int(rel["CANDIDATES"])]
+            bayes, avg = self._rating(idx[candidates])
+            rating = bayes if bayes is not None else np.nan_to_num(avg, nan=3.5)
+            reviews = cols["reviews"][idx[candidates]].astype(np.float64)
+            score = (
+                weights["distance"] * np.power(0.5, dist[candidates] / float(rel["DISTANCE_HALF_LIFE_M"]))
+                + weights["rating"] * (rating - 1) / 4.0
+                + weights["reviews"] * np.minimum(np.log1p(reviews) / np.log1p(float(rel["REVIEWS_SATURATION"])), 1.0)
+            )
+            order = candidates[np.lexsort((ids[candidates], dist[candidates], -score))]
+        else:
+            order = np.lexsort((ids, dist))
+
+        page = order[offset : offset + limit]
+        items = []
+        for i in page:
+            row = idx[i]
+            avg = cols["avg"][row]
+            code, label = self.categories[cols["categories"][row]]
+            items.append(
+                {
+                    "id": _format_uuid(cols["ids"][row]),
+                    "name": cols["names"][row],
+                    "category": {"code": code, "label": label},
+                    "location": {"lat": float(cols["lat"][row]), "lng": float(cols["lng"][row]), "distance_m": float(dist[i])},
+                    "features_summary": [
+                        self.feature_codes[f]
+                        for f in np.flatnonzero(np.unpackbits(cols["features"][row], count=len(self.feature_codes)))
+                    ],
+                    "rating": {"overall": None if np.isnan(avg) else float(avg), "count": int(cols["reviews"][row])},
+                    "thumbnail_url": None,
+                    "created_at": _EPOCH + timedelta(microseconds=int(cols["created_us"][row])),
+                }
+            )
+        return items
+
+
+def _format_uuid(hex_id: bytes) -> str:
+    h = hex_id.decode("ascii")
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _load_lookups() -> tuple[list[tuple[str, str]], list[str], tuple[float, float] | None]:
+    with connection.cursor() as cur:
+        cur.execute("SELECT code, label FROM categories ORDER BY code")
+        categories = [(code, label) for code, label in cur.fetchall()]
+        # features_summary は SQL 側と同じく code 順（DB の照合順序）で返す
+        cur.execute("SELECT code FROM features ORDER BY code")
+        feature_codes = [code for (code,) in cur.fetchall()]
+        prior = None
+        if ranking_available():
+            cur.execute("SELECT mean, weight FROM search_rank_prior")
+            row = cur.fetchone()
+            prior = (float(row[0]), float(row[1])) if row else None
+    return categories, feature_codes, prior
+
+
+def _load_watermarks() -> tuple:
+    with connection.cursor() as cur:
+        cur.execute("SELECT MAX(updated_at) FROM places")
+        places_wm = cur.fetchone()[0]
+        stats_wm = None
+        if has_table("place_stats"):
+            cur.execute("SELECT MAX(updated_at) FROM place_stats")
+            stats_wm = cur.fetchone()[0]
+        tombstones_wm = None
+        if has_table("place_tombstones"):
+            cur.execute("SELECT MAX(deleted_at) FROM place_tombstones")
+            tombstones_wm = cur.fetchone()[0]
+    return places_wm, stats_wm, tombstones_wm
+
+
+def _load_deleted_ids(since) -> list[bytes]:
+    """since（None なら全件）以降に削除された施設の id（ids 列と同じ 32 桁の16進）。"""
+    if not has_table("place_tombstones"):
+        return []
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT replace(place_id::text, '-', '')
+            FROM place_tombstones
+            WHERE %(since)s::timestamptz IS NULL OR deleted_at >= %(since)s
+            """,
+            {"since": since},
+        )
+        return [pid.encode("ascii") for (pid,) in cur.fetchall()]
+
+
+def _fetch_columns(sql: str, params: dict, categories: list, feature_codes: list[str]) -> dict:
+    """行を取得して列ごとの配列にする（名前付きカーソルで ITERSIZE 件ずつ）。"""
+    category_index = {code: i for i, (code, _) in enumerate(categories)}
+    feature_index = {code: i for i, code in enumerate(feature_codes)}
+    ids, names, cats, lats, lngs, avgs, reviews, created, feature_rows = [], [], [], [], [], [], [], [], []
+    with transaction.atomic(), connection.chunked_cursor() as cur:
+        cur.cursor.itersize = ITERSIZE
+        cur.execute(sql, params)
+        for pid, name, code, _label, lat, lng, avg, count, created_at, codes in cur:
+            if code not in category_index or any(c not in feature_index for c in codes):
+                raise LookupError("category/feature master changed during load")
+            ids.append(pid.encode("ascii"))
+            names.append(name)
+            cats.append(category_index[code])
+            lats.append(lat)
+            lngs.append(lng)
+            avgs.append(float(avg) if avg is not None else np.nan)
+            reviews.append(int(count))
+            created.append(created_at)
+            feature_rows.append([feature_index[c] for c in codes])
+
+    n = len(ids)
+    features = np.zeros((n, len(feature_codes)), dtype=bool)
+    for row, cols in enumerate(feature_rows):
+        features[row, cols] = True
+    return {
+        "ids": np.asarray(ids, dtype="S32"),
+        "names": StringColumn.from_strings(names),
+        "categories": np.asarray(cats, dtype=np.int16),
+        "lat": np.asarray(lats, dtype=np.float64),
+        "lng": np.asarray(lngs, dtype=np.float64),
+        "cells": np.asarray([grid_cell(a, b) for a, b in zip(lats, lngs)], dtype=np.int64),
+        "avg": np.asarray(avgs, dtype=np.float64),
+        "reviews": np.asarray(reviews, dtype=np.int64),
+        "created_us": np.asarray([(c - _EPOCH) // timedelta(microseconds=1) for c in created], dtype=np.int64),
+        "features": np.packbits(features, axis=1).reshape(n, (len(feature_codes) + 7) // 8),
+    }
+
+
+def load_full() -> Snapshot:
+    categories, feature_codes, prior = _load_lookups()
+    watermarks = _load_watermarks()
+    columns = _fetch_columns(_place_sql(changed_only=False), {}, categories, feature_codes)
+    now = time.monotonic()
+    return Snapshot(columns, categories, feature_codes, prior, watermarks, now, now)
+
+
+def load_incremental(base: Snapshot, overlap_s: float) -> Snapshot | None:
+    """base 以降に変わった行だけを取り込んだ新しい Snapshot を返す（全件の読み直しが必要なら None）。"""
+    categories, feature_codes, prior = _load_lookups()
+    if categories != base.categories or feature_codes != base.feature_codes:
+        return None
+    watermarks = _load_watermarks()
+    places_wm, stats_wm, tombstones_wm = base.watermarks
+    overlap = timedelta(seconds=overlap_s)
+    params = {
+        "places_since": (places_wm - overlap) if places_wm else None,
+        "stats_since": (stats_wm - overlap) if stats_wm else None,
+    }
+    if params["places_since"] is None or (has_table("place_stats") and params["stats_since"] is None):
+        return None
+    try:
+        delta = _fetch_columns(_place_sql(changed_only=True), params, categories, feature_codes)
+    except LookupError:
+        return None
+
+    deleted = _load_deleted_ids((tombstones_wm - overlap) if tombstones_wm else None)
+    keep = ~np.isin(base.columns["ids"], delta["ids"])
+    if deleted:
+        keep &= ~np.isin(base.columns["ids"], np.asarray(deleted, dtype="S32"))
+    kept_rows = np.flatnonzero(keep)
+    columns = {name: _concat(_take(values, kept_rows), delta[name]) for name, values in base.columns.items()}
+
+    with connection.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM places")
+        if cur.fetchone()[0] != len(columns["ids"]):
+            return None
+    return Snapshot(columns, categories, feature_codes, prior, watermarks, time.monotonic(), base.full_loaded_at)
+
+
+def _snapshot_root() -> Path:
+    directory = conf()["SNAPSHOT_DIR"]
+    return Path(directory) if directory else Path(settings.BASE_DIR) / "var" / "search_snapshot"
+
+
+def content_digest(snapshot: Snapshot) -> str:
+    """スナップショットの内容（列・カテゴリ名・特徴コード・事前分布）のハッシュ。書き出しの要否の判定に使う。
+    透かしや件数が同じでもカテゴリ名・search_rank_prior・特徴だけの変更を拾える。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([snapshot.categories, snapshot.feature_codes, snapshot.prior], ensure_ascii=False).encode("utf-8"))
+    cols = snapshot.columns
+    for name in ARRAY_COLUMNS:
+        h.update(np.ascontiguousarray(cols[name]).tobytes())
+    h.update(np.ascontiguousarray(cols["names"].offsets).tobytes())
+    h.update(np.ascontiguousarray(cols["names"].data).tobytes())
+    return h.hexdigest()
+
+
+def write_snapshot(snapshot: Snapshot, root: Path | None = None, digest: str | None = None) -> Path:
+    """スナップショットを root/<版> に書き出し、root/current を原子的に差し替える。古い版は KEEP_SNAPSHOTS を残して削除。
+    削除済みの版を mmap 中のワーカーは、次の差し替え検知まで古いファイルを読み続けられる（unlink 後も有効）。
+    """
+    root = root or _snapshot_root()
+    root.mkdir(parents=True, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    tmp_dir = root / f".{version}.tmp"
+    tmp_dir.mkdir()
+    cols = snapshot.columns
+    for name in ARRAY_COLUMNS:
+        np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(cols[name]))
+    np.save(tmp_dir / "names_offsets.npy", np.ascontiguousarray(cols["names"].offsets))
+    np.save(tmp_dir / "names_data.npy", np.ascontiguousarray(cols["names"].data))
+    ranges = sorted(snapshot.cell_ranges.items())
+    np.save(tmp_dir / "cell_ranges.npy", np.asarray([(c, s, e) for c, (s, e) in ranges], dtype=np.int64).reshape(-1, 3))
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "count": len(snapshot),
+        "categories": snapshot.categories,
+        "feature_codes": snapshot.feature_codes,
+        "prior": snapshot.prior,
+        "watermarks": [wm.isoformat() if wm else None for wm in snapshot.watermarks],
+        "digest": digest or content_digest(snapshot),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    final_dir = root / version
+    os.replace(tmp_dir, final_dir)
+
+    link_tmp = root / ".current.tmp"
+    if link_tmp.is_symlink() or link_tmp.exists():
+        link_tmp.unlink()
+    os.symlink(version, link_tmp)
+    os.replace(link_tmp, root / "current")
+
+    versions = sorted(p for p in root.iterdir() if p.is_dir() and not p.name.startswith(".") and not p.is_symlink())
+    for old in versions[: -int(conf()["KEEP_SNAPSHOTS"])]:
+        shutil.rmtree(old, ignore_errors=True)
+    return final_dir
+
+
+def current_digest(root: Path | None = None) -> str | None:
+    """current の指す版の内容ハッシュ（無ければ None）。"""
+    try:
+        meta = json.loads(((root or _snapshot_root()) / "current" / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return meta.get("digest")
+
+
+def open_snapshot(path: Path) -> Snapshot:
+    """書き出されたスナップショットを読み取り専用で mmap して開く（コピーしない）。"""
+    meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"unsupported snapshot format: {meta.get('format')}")
+    columns = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in ARRAY_COLUMNS}
+    columns["names"] = StringColumn(
+        np.load(path / "names_offsets.npy", mmap_mode="r"), np.load(path / "names_data.npy", mmap_mode="r")
+    )
+    ranges = np.load(path / "cell_ranges.npy")
+    cell_ranges = {int(c): (int(s), int(e)) for c, s, e in ranges}
+    watermarks = tuple(datetime.fromisoformat(v) if v else None for v in meta["watermarks"])
+    now = time.monotonic()
+    return Snapshot(
+        columns,
+        [tuple(c) for c in meta["categories"]],
+        meta["feature_codes"],
+        tuple(meta["prior"]) if meta["prior"] else None,
+        watermarks,
+        now,
+        now,
+        sorted_rows=True,
+        cell_ranges=cell_ranges,
+    )
+
+
+class SearchIndex:
+    """プロセス内の Snapshot の保持と、バックグラウンド更新スレッドの管理。
+    MODE='mmap' ではスレッドを起動せず、SNAPSHOT_DIR/current の差し替えを CHECK_INTERVAL_S ごとに確認して開き直す。
+    """
+
+    def __init__(self):
+        self.snapshot: Snapshot | None = None
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._pid = None
+        self._mapped_version: str | None = None
+        self._checked_at = 0.0
+
+    def check_mapped(self) -> None:
+        """mmap モード: current の指す版が変わっていれば開き直す。"""
+        now = time.monotonic()
+        if now - self._checked_at < float(conf()["CHECK_INTERVAL_S"]):
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = now
+            current = _snapshot_root() / "current"
+            try:
+                version = os.readlink(current)
+            except OSError:
+                return
+            if version == self._mapped_version:
+                return
+            try:
+                self.snapshot = open_snapshot(current.parent / version)
+                self._mapped_version = version
+            except (OSError, ValueError):
+                logger.exception("failed to open search snapshot %s", version)
+        finally:
+            self._lock.release()
+
+    def ensure_started(self) -> None:
+        # fork 後の子プロセスではスレッドが引き継がれないため、pid が変わったら起動し直す
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self.snapshot = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="search-index", daemon=True)
+            self._thread.start()
+
+    def refresh(self, full: bool = False) -> Snapshot:
+        c = conf()
+        base = self.snapshot
+        snapshot = None
+        if base is not None and not full and time.monotonic() - base.full_loaded_at < float(c["FULL_RELOAD_S"]):
+            snapshot = load_incremental(base, float(c["OVERLAP_S"]))
+        if snapshot is None:
+            snapshot = load_full()
+        self.snapshot = snapshot
+        return snapshot
+
+    def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                snapshot = self.refresh()
+                logger.info("search index refreshed: %d places in %.2fs", len(snapshot), time.monotonic() - started)
+            except Exception:
+                logger.exception("search index refresh failed")
+            finally:
+                # スレッド専用の DB 接続は毎回閉じる
+                connection.close()
+            time.sleep(float(conf()["REFRESH_INTERVAL_S"]))
+
+
+index = SearchIndex()
+
+
+def search(**kwargs) -> list[dict] | None:
+    """メモリ内で検索する。対応できない条件や読み込み前は None（呼び出し側で SQL を使う）。"""
+    if conf()["MODE"] == "mmap":
+        index.check_mapped()
+    else:
+        index.ensure_started()
+    snapshot = index.snapshot
+    if snapshot is None:
+        return None
+    return snapshot.search(**kwargs)
@@ -130,3 +130,44 @@ class UploadPhotoSerializer(serializers.Serializer):
         if purpose == Photo.PURPOSE_REVIEW and not place_id:
             raise serializers.ValidationError({"place_id": "レビュー写真には place_id が必要です"})
         return attrs
+
+
+class PlacesBatchSerializer(serializers.Serializer):
+    """POST /api/places/batch の入力。"""
+
+    MAX_IDS = 100
+    FIELD_CHOICES = ("name", "category", "location", "features_summary", "rating", "thumbnail_url", "created_at")
+
+    ids = serializers.ListField(child=serializers.UUIDField(), min_length=1, max_length=MAX_IDS)
+    lat = serializers.FloatField(min_value=-90.0, max_value=90.0, required=False, allow_null=True)
+    lng = serializers.FloatField(min_value=-180.0, max_value=180.0, required=False, allow_null=True)
+    fields = serializers.ListField(
+        child=serializers.ChoiceField(choices=FIELD_CHOICES), required=False, allow_empty=False
+    )
+
+    def validate(self, attrs):
+        if (attrs.get("lat") is None) != (attrs.get("lng") is None):
+            raise serializers.ValidationError({"lat": "lat と lng は両方指定してください"})
+        return attrs
+
+
+class ReviewModerationSerializer(serializers.Serializer):
+    """POST /api/admin/reviews/moderate の入力。対象は review_ids / user_id / place_id の AND（1 つ以上必須）。"""
+
+    MAX_IDS = 1000
+    STATUS_CHOICES = ("public", "pending", "hidden")
+
+    status = serializers.ChoiceField(choices=STATUS_CHOICES)
+    review_ids = serializers.ListField(
+        child=serializers.UUIDField(), required=False, allow_empty=False, max_length=MAX_IDS
+    )
+    user_id = serializers.IntegerField(required=False, min_value=1)
+    place_id = serializers.UUIDField(required=False)
+    from_status = serializers.ListField(
+        child=serializers.ChoiceField(choices=STATUS_CHOICES), required=False, allow_empty=False
+    )
+
+    def validate(self, attrs):
+        if not any(attrs.get(k) for k in ("review_ids", "user_id", "place_id")):
+            raise serializers.ValidationError({"review_ids": "review_ids / user_id / place_id のいずれかを指定してください"})
+        return attrs
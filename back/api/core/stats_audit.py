@@ -0,0 +1,207 @@
+"""施設集計（place_stats / place_age_band_stats）の整合性チェックと修復（manage.py audit_place_stats）。
+
+- 集計は投稿・写真・モデレーションの各経路で更新されるが、未紐付けの写真・管理画面からの削除・
+  失敗したトランザクション・write-behind の登録漏れ（コミット後の登録が失敗した場合）などでずれ得る。
+- places を id 順に WORKERS × RANGES_PER_WORKER 個の範囲に分け、各範囲を別スレッド（別 DB 接続）で
+  1 文ずつ集計し直して保存値と比べる。reviews / photos は範囲ごとに 1 回しか読まない
+  （reviews は (place_id, created_at) 索引の範囲走査）。
+- ずれのあった施設は REPAIR_BATCH 件ずつ refresh_place_stats_bulk で再計算する（1 バッチ 1 トランザクション）。
+  --dry-run では件数の報告だけを行う。
+- place_stats_dirty に登録済みの施設はフラッシャーが再計算するため対象外にする。
+- 比較する値: 行の有無（レビューか写真がある施設）、review_count、overall_sum、avg_overall、photo_count、
+  last_reviewed_at（レビューがある施設のみ）、年齢帯別の件数・合計。
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from core.review_views import refresh_place_stats_bulk
+from core.schema import has_table
+
+FIELDS = ("missing", "review_count", "overall_sum", "avg_overall", "photo_count", "last_reviewed_at", "age_band")
+
+
+def conf() -> dict:
+    defaults = {
+        "WORKERS": 4,
+        "RANGES_PER_WORKER": 4,
+        "REPAIR_BATCH": 1000,
+    }
+    return {**defaults, **getattr(settings, "STATS_AUDIT", {})}
+
+
+def place_ranges(count: int) -> list[tuple[str, str | None]]:
+    """places を id 順に件数がほぼ等しい count 個の [lo, hi) に分ける（最後の hi は None）。"""
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT MIN(id)
+            FROM (SELECT id, ntile(%s) OVER (ORDER BY id) AS part FROM places) AS s
+            GROUP BY part
+            ORDER BY 1
+            """,
+            [max(1, int(count))],
+        )
+        lows = [str(r[0]) for r in cur.fetchall()]
+    return [(lo, lows[i + 1] if i + 1 < len(lows) else None) for i, lo in enumerate(lows)]
+
+
+def _range_sql(col: str, hi: str | None) -> str:
+    if hi is None:
+        return f"{col} >= %(lo)s::uuid"
+    return f"{col} >= %(lo)s::uuid AND {col} < %(hi)s::uuid"
+
+
+def _drift_sql(hi: str | None) -> str:
+    """範囲内で保存値と再集計値が異なる施設と、異なる項目を返す 1 文。"""
+    if has_table("photos"):
+        photo_cte = f"""
+        ph AS (
+            -- 施設写真とレビュー写真の和集合（refresh_place_stats_bulk と同じ定義）
+            SELECT x.place_id, COUNT(*) AS photo_count
+            FROM (
+                SELECT p.place_id, p.id FROM photos p WHERE {_range_sql("p.place_id", hi)}
+                UNION
+                SELECT r.place_id, p.id FROM photos p JOIN reviews r ON r.id = p.review_id
+                WHERE {_range_sql("r.place_id", hi)}
+            ) AS x
+            GROUP BY x.place_id
+        ),"""
+    else:
+        photo_cte = "ph AS (SELECT NULL::uuid AS place_id, 0::bigint AS photo_count WHERE false),"
+    if has_table("place_age_band_stats"):
+        band_cte = f"""
+        band AS (
+            SELECT r.place_id, r.age_band_id, COUNT(*) AS review_count, SUM(r.overall) AS overall_sum
+            FROM reviews r
+            WHERE r.status = 'public' AND r.age_band_id IS NOT NULL AND {_range_sql("r.place_id", hi)}
+            GROUP BY r.place_id, r.age_band_id
+        ),
+        band_drift AS (
+            SELECT DISTINCT COALESCE(b.place_id, ab.place_id) AS place_id
+            FROM band b
+            FULL JOIN (
+                SELECT * FROM place_age_band_stats
+                WHERE review_count > 0 AND {_range_sql("place_id", hi)}
+            ) AS ab ON ab.place_id = b.place_id AND ab.age_band_id = b.age_band_id
+            WHERE b.review_count IS DISTINCT FROM ab.review_count::bigint
+               OR b.overall_sum IS DISTINCT FROM ab.overall_sum::bigint
+        ),"""
+    else:
+        band_cte = "band_drift AS (SELECT NULL::uuid AS place_id WHERE false),"
+    dirty_sql = ""
+    if has_table("place_stats_dirty"):
+        dirty_sql = "AND NOT EXISTS (SELECT 1 FROM place_stats_dirty d WHERE d.place_id = t.place_id)"
+    return f"""
+        WITH rv AS (
+            SELECT r.place_id,
+                   COUNT(*) AS review_count,
+                   SUM(r.overall) AS overall_sum,
+                   MAX(r.created_at) AS last_reviewed_at
+            FROM reviews r
+            WHERE r.status = 'public' AND {_range_sql("r.place_id", hi)}
+            GROUP BY r.place_id
+        ),
+        {photo_cte}
+        {band_cte}
+        truth AS (
+            SELECT p.id AS place_id,
+                   COALESCE(rv.review_count, 0) AS review_count,
+                   COALESCE(rv.overall_sum, 0) AS overall_sum,
+                   CASE WHEN rv.review_count > 0 THEN round(rv.overall_sum::numeric / rv.review_count, 2) END AS avg_overall,
+                   rv.last_reviewed_at,
+                   COALESCE(ph.photo_count, 0) AS photo_count
+            FROM places p
+            LEFT JOIN rv ON rv.place_id = p.id
+            LEFT JOIN ph ON ph.place_id = p.id
+            WHERE {_range_sql("p.id", hi)}
+        ),
+        diff AS (
+            SELECT t.place_id,
+                   ps.place_id IS NULL AND (t.review_count > 0 OR t.photo_count > 0) AS missing,
+                   ps.place_id IS NOT NULL AND ps.review_count <> t.review_count AS review_count,
+                   ps.place_id IS NOT NULL AND ps.overall_sum <> t.overall_sum AS overall_sum,
+                   ps.place_id IS NOT NULL AND ps.avg_overall IS DISTINCT FROM t.avg_overall AS avg_overall,
+                   ps.place_id IS NOT NULL AND ps.photo_count <> t.photo_count AS photo_count,
+                   ps.place_id IS NOT NULL AND t.review_count > 0
+                     AND ps.last_reviewed_at IS DISTINCT FROM t.last_reviewed_at AS last_reviewed_at,
+                   bd.place_id IS NOT NULL AS age_band
+            FROM truth t
+            LEFT JOIN place_stats ps ON ps.place_id = t.place_id
+            LEFT JOIN band_drift bd ON bd.place_id = t.place_id
+            WHERE true {dirty_sql}
+        )
+        SELECT place_id, {", ".join(FIELDS)}
+        FROM diff
+        WHERE {" OR ".join(FIELDS)}
+    """
+
+
+def audit_range(lo: str, hi: str | None, repair: bool = True, repair_batch: int | None = None) -> dict:
+    """1 範囲を集計し直して比べ、（repair なら）ずれた施設を再計算する。別スレッドから呼ばれる。"""
+    repair_batch = int(repair_batch or conf()["REPAIR_BATCH"])
+    started = time.monotonic()
+    try:
+        with connection.cursor() as cur:
+            cur.execute(_drift_sql(hi), {"lo": lo, "hi": hi})
+            rows = cur.fetchall()
+        drift = dict.fromkeys(FIELDS, 0)
+        for row in rows:
+            for name, flag in zip(FIELDS, row[1:]):
+                drift[name] += int(bool(flag))
+        repaired = 0
+        if repair:
+            ids = [str(row[0]) for row in rows]
+            for i in range(0, len(ids), repair_batch):
+                with transaction.atomic():
+                    refresh_place_stats_bulk(ids[i : i + repair_batch])
+                repaired += len(ids[i : i + repair_batch])
+        return {
+            "lo": lo,
+            "hi": hi,
+            "drifted": len(rows),
+            "fields": drift,
+            "repaired": repaired,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+    finally:
+        # スレッドごとの接続を閉じる（Django の接続はスレッド単位）
+        connection.close()
+
+
+def run(workers: int | None = None, ranges: int | None = None, repair: bool = True, repair_batch: int | None = None,
+        log=None) -> dict:
+    """全施設を範囲に分けて並列にチェックし、集計結果を返す。"""
+    if not has_table("place_stats"):
+        raise RuntimeError("place_stats がありません")
+    c = conf()
+    workers = max(1, int(workers or c["WORKERS"]))
+    ranges = max(1, int(ranges or workers * int(c["RANGES_PER_WORKER"])))
+    started = time.monotonic()
+    parts = place_ranges(ranges)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stats-audit") as pool:
+        futures = [pool.submit(audit_range, lo, hi, repair, repair_batch) for lo, hi in parts]
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            if log:
+                log(f"range {result['lo']}..{result['hi'] or 'end'}: drift {result['drifted']} ({result['seconds']}s)")
+
+    fields = dict.fromkeys(FIELDS, 0)
+    for result in results:
+        for name, n in result["fields"].items():
+            fields[name] += n
+    return {
+        "ranges": len(parts),
+        "workers": workers,
+        "drifted": sum(r["drifted"] for r in results),
+        "repaired": sum(r["repaired"] for r in results),
+        "fields": fields,
+        "dry_run": not repair,
+        "seconds": round(time.monotonic() - started, 3),
+        "slowest_range_seconds": max((r["seconds"] for r in results), default=0.0),
+    }
@@ -0,0 +1,81 @@
+"""place_stats の書き込み後更新（write-behind）のフラッシャー。
+
+- PLACE_STATS['MODE']='write_behind' のとき、レビュー投稿は place_stats を再計算せず、同じトランザクションで
+  place_stats_dirty へ施設 ID を登録するだけになる（core.review_views.schedule_place_stats_refresh）。
+- flush_once() は登録の古い順に BATCH_SIZE 件ずつ取り出し（DELETE ... RETURNING）、同じトランザクションで
+  refresh_place_stats_bulk により 1 文で再計算する。失敗すればロールバックで登録が戻る。
+- manage.py flush_place_stats --loop が FLUSH_INTERVAL_S ごとに flush_all を繰り返す。flush_all は開始時刻
+  以前に登録されたものだけを処理する（処理中に再登録された施設は次の回に回す）ため、1 施設の再計算は
+  1 間隔に高々 1 回になる（その間の書き込みは 1 件の登録にまとまる）。
+- 遅れは /metrics の place_stats_dirty_places / place_stats_lag_seconds（スクレイプ時に DB から計算）で見る。
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from core import metrics
+from core.review_views import refresh_place_stats_bulk
+from core.schema import has_table
+
+
+def conf() -> dict:
+    defaults = {
+        "MODE": "sync",
+        "FLUSH_INTERVAL_S": 5.0,
+        "BATCH_SIZE": 500,
+    }
+    return {**defaults, **getattr(settings, "PLACE_STATS", {})}
+
+
+def flush_once(batch_size: int | None = None, cutoff=None) -> int:
+    """再計算待ちを 1 バッチ処理し、再計算した施設数を返す。cutoff を渡すとそれ以前の登録だけを対象にする。"""
+    batch_size = int(batch_size or conf()["BATCH_SIZE"])
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(
+            """
+            DELETE FROM place_stats_dirty d
+            WHERE d.place_id IN (
+                SELECT place_id FROM place_stats_dirty
+                WHERE %s::timestamptz IS NULL OR first_dirty_at <= %s::timestamptz
+                ORDER BY first_dirty_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING d.place_id, EXTRACT(EPOCH FROM (NOW() - d.first_dirty_at))
+            """,
+            [cutoff, cutoff, batch_size],
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return 0
+        refresh_place_stats_bulk([str(place_id) for place_id, _ in rows])
+    metrics.inc("place_stats_flushed_total", value=len(rows))
+    for _, lag in rows:
+        metrics.observe("place_stats_flush_lag_seconds", float(lag))
+    return len(rows)
+
+
+def flush_all(batch_size: int | None = None) -> int:
+    """開始時点までに登録された再計算待ちが無くなるまで flush_once を繰り返す。"""
+    batch_size = int(batch_size or conf()["BATCH_SIZE"])
+    with connection.cursor() as cur:
+        cur.execute("SELECT NOW()")
+        drain_started = cur.fetchone()[0]
+    total = 0
+    while True:
+        n = flush_once(batch_size, cutoff=drain_started)
+        total += n
+        if n < batch_size:
+            return total
+
+
+def dirty_gauges() -> list[tuple[str, dict, float]]:
+    """/metrics 用: 再計算待ちの件数と、最も古い登録からの経過秒数。"""
+    if conf()["MODE"] != "write_behind" or not has_table("place_stats_dirty"):
+        return []
+    with connection.cursor() as cur:
+        cur.execute("SELECT COUNT(*), COALESCE(EXTRACT(EPOCH FROM (NOW() - MIN(first_dirty_at))), 0) FROM place_stats_dirty")
+        count, lag = cur.fetchone()
+    return [
+        ("place_stats_dirty_places", {}, float(count)),
+        ("place_stats_lag_seconds", {}, float(lag)),
+    ]
@@ -0,0 +1,428 @@
+"""外部プロバイダ（Google Places 等）からの施設同期。
+
+- place_sync_jobs のキューを FOR UPDATE SKIP LOCKED で取得し、複数ワーカーで重複処理しない。
+- HTTP 取得は asyncio で同時実行数を制限しつつ、プロバイダ単位のレート制限をかける。
+- place_source_meta.etag を If-None-Match として送り、未変更(304/同一ハッシュ)の場合は upsert を省略する。
+- places への反映は 1 文の一括 upsert とし、manual_lock = true の施設は上書きしない。
+  施設の同一性は (provider, provider_place_id) で判定する（google_place_id / data_source='google' は Google のみ）。
+"""
+import asyncio
+import hashlib
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+STATUS_OK = "ok"
+STATUS_NOT_MODIFIED = "not_modified"
+STATUS_ERROR = "error"
+
+
+@dataclass
+class FetchResult:
+    """プロバイダからの取得結果。"""
+    status: str
+    payload: dict | None = None
+    etag: str | None = None
+    error: str | None = None
+
+
+@dataclass
+class SyncJob:
+    """取得済みの同期ジョブ（place_sync_jobs の1行）。"""
+    id: str
+    place_id: str | None
+    provider: str
+    provider_place_id: str
+
+
+def sync_settings() -> dict:
+    """PLACE_SYNC 設定に既定値を補って返す。"""
+    defaults = {
+        "PROVIDERS": {"google": {"CLASS": "core.sync.GooglePlacesClient", "OPTIONS": {}}},
+        "BATCH_SIZE": 50,
+        "CONCURRENCY": 8,
+        "RATE_LIMITS": {"google": 10.0},
+        "TIMEOUT": 10.0,
+        "STALE_RUNNING_MINUTES": 30,
+    }
+    return {**defaults, **getattr(settings, "PLACE_SYNC", {})}
+
+
+class PlaceProviderClient:
+    """プロバイダクライアントの基底クラス。
+    - fetch はブロッキング I/O でよい（ワーカー側でスレッドに逃がす）。
+    - normalize は places へ書き込む列（name/address/lat/lng 等）の dict を返す。
+    """
+
+    name = ""
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+
+    def fetch(self, provider_place_id: str, etag: str | None) -> FetchResult:
+        raise NotImplementedError
+
+    def normalize(self, payload: dict) -> dict:
+        raise NotImplementedError
+
+
+class HttpJsonClient(PlaceProviderClient):
+    """JSON を返す HTTP API 用の共通実装（条件付き GET に対応）。
+    - base_url を差し替えればローカルの疑似 HTTP サーバーに向けられる。
+    """
+
+    def __init__(self, base_url: str, timeout: float = 10.0):
+        super().__init__(timeout=timeout)
+        self.base_url = base_url.rstrip("/")
+
+    def build_request(self, provider_place_id: str) -> urllib.request.Request:
+        url = f"{self.base_url}/places/{urllib.parse.quote(provider_place_id, safe='')}"
+        return urllib.request.Request(url, method="GET")
+
+    def fetch(self, provider_place_id: str, etag: str | None) -> FetchResult:
+        req = self.build_request(provider_place_id)
+        if etag:
+            req.add_header("If-None-Match", etag)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                body = resp.read()
+                server_etag = resp.headers.get("ETag")
+        except urllib.error.HTTPError as exc:
+            if exc.code == 304:
+                return FetchResult(status=STATUS_NOT_MODIFIED, etag=etag)
+            return FetchResult(status=STATUS_ERROR, error=f"HTTP {exc.code}")
+        except (urllib.error.URLError, TimeoutError) as exc:
+            return FetchResult(status=STATUS_ERROR, error=str(exc))
+
+        # ETag を返さない API 向けに本文のハッシュを etag として扱う
+        new_etag = server_etag or f'W/"{hashlib.sha256(body).hexdigest()}"'
+        if etag and new_etag == etag:
+            return FetchResult(status=STATUS_NOT_MODIFIED, etag=etag)
+        try:
+            payload = json.loads(body.decode("utf-8"))
+        except ValueError:
+            return FetchResult(status=STATUS_ERROR, error="invalid JSON response")
+        return FetchResult(status=STATUS_OK, payload=payload, etag=new_etag)
+
+
+# Google の type → categories.code の対応（未対応の type は既定カテゴリへ）
+GOOGLE_TYPE_CATEGORY_MAP = {
+    "park": "park",
+    "playground": "park",
+    "amusement_park": "park",
+    "amusement_center": "indoor_kids",
+    "indoor_playground": "indoor_kids",
+    "childrens_camp": "indoor_kids",
+    "restaurant": "restaurant",
+    "cafe": "restaurant",
+    "family_restaurant": "restaurant",
+}
+
+
+class GooglePlacesClient(HttpJsonClient):
+    """Google Places API (New) の Place Details クライアント。"""
+
+    name = "google"
+    FIELD_MASK = "id,displayName,formattedAddress,location,nationalPhoneNumber,websiteUri,regularOpeningHours,types"
+
+    def __init__(self, base_url: str | None = None, api_key: str | None = None, timeout: float = 10.0):
+        super().__init__(base_url or getattr(settings, "GOOGLE_PLACES_BASE_URL", "https://places.googleapis.com/v1"), timeout)
+        self.api_key = api_key if api_key is not None else getattr(settings, "GOOGLE_PLACES_API_KEY", "")
+
+    def build_request(self, provider_place_id: str) -> urllib.request.Request:
+        req = super().build_request(provider_place_id)
+        req.add_header("X-Goog-FieldMask", self.FIELD_MASK)
+        if self.api_key:
+            req.add_header("X-Goog-Api-Key", self.api_key)
+        return req
+
+    def normalize(self, payload: dict) -> dict:
+        location = payload.get("location") or {}
+        types = payload.get("types") or []
+        category_code = next((GOOGLE_TYPE_CATEGORY_MAP[t] for t in types if t in GOOGLE_TYPE_CATEGORY_MAP), None)
+        return {
+            "name": (payload.get("displayName") or {}).get("text"),
+            "address": payload.get("formattedAddress"),
+            "phone": payload.get("nationalPhoneNumber"),
+            "website_url": payload.get("websiteUri"),
+            "opening_hours_json": payload.get("regularOpeningHours"),
+            "lat": location.get("latitude"),
+            "lng": location.get("longitude"),
+            "category_code": category_code,
+        }
+
+
+def load_providers() -> dict[str, PlaceProviderClient]:
+    """PLACE_SYNC['PROVIDERS'] からクライアントを生成する。
+    - 値は {"CLASS": ドット区切りパス, "OPTIONS": コンストラクタのキーワード引数}（パスの文字列だけでも可）。
+    - timeout は OPTIONS に無ければ PLACE_SYNC['TIMEOUT'] を渡す。name はプロバイダ名で上書きする。
+    """
+    conf = sync_settings()
+    providers = {}
+    for name, spec in conf["PROVIDERS"].items():
+        if isinstance(spec, str):
+            spec = {"CLASS": spec}
+        options = {"timeout": conf["TIMEOUT"], **spec.get("OPTIONS", {})}
+        try:
+            client = import_string(spec["CLASS"])(**options)
+        except TypeError as exc:
+            raise ImproperlyConfigured(f"PLACE_SYNC['PROVIDERS'][{name!r}]: {exc}") from exc
+        client.name = name
+        providers[name] = client
+    return providers
+
+
+class AsyncRateLimiter:
+    """トークンバケット方式のレート制限（rate: 1秒あたりの許可数）。"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def fetch_all(
+    jobs: list[SyncJob],
+    etags: dict[tuple[str, str], str],
+    providers: dict[str, PlaceProviderClient],
+    concurrency: int,
+    rate_limits: dict[str, float],
+) -> dict[str, FetchResult]:
+    """ジョブ群を同時実行数 concurrency で取得する（DB には触れない）。"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    limiters = {name: AsyncRateLimiter(rate_limits.get(name, 0)) for name in providers}
+
+    async def run(job: SyncJob) -> tuple[str, FetchResult]:
+        client = providers.get(job.provider)
+        if client is None:
+            return job.id, FetchResult(status=STATUS_ERROR, error=f"unknown provider: {job.provider}")
+        async with semaphore:
+            await limiters[job.provider].acquire()
+            etag = etags.get((job.provider, job.provider_place_id))
+            try:
+                result = await asyncio.to_thread(client.fetch, job.provider_place_id, etag)
+            except Exception as exc:  # プロバイダ実装の想定外エラーはジョブ失敗として記録
+                result = FetchResult(status=STATUS_ERROR, error=str(exc))
+        return job.id, result
+
+    pairs = await asyncio.gather(*(run(job) for job in jobs))
+    return dict(pairs)
+
+
+def claim_jobs(limit: int, stale_minutes: int) -> list[SyncJob]:
+    """queued（または放置された running）のジョブを SKIP LOCKED で取得し running にする。"""
+    sql = """
+        UPDATE place_sync_jobs j
+        SET status = 'running', started_at = NOW(), finished_at = NULL, error_message = NULL
+        WHERE j.id IN (
+            SELECT id FROM place_sync_jobs
+            WHERE (status = 'queued' AND scheduled_at <= NOW())
+               OR (status = 'running' AND started_at < NOW() - make_interval(mins => %s))
+            ORDER BY scheduled_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING j.id, j.place_id, j.provider, j.provider_place_id
+    """
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            cur.execute(sql, [int(stale_minutes), int(limit)])
+            rows = cur.fetchall()
+    return [
+        SyncJob(id=str(jid), place_id=str(pid) if pid else None, provider=provider, provider_place_id=ppid or "")
+        for jid, pid, provider, ppid in rows
+    ]
+
+
+def load_etags(jobs: list[SyncJob]) -> dict[tuple[str, str], str]:
+    """各ジョブの最新 etag を 1 クエリで取得する。"""
+    if not jobs:
+        return {}
+    sql = """
+        SELECT DISTINCT ON (provider, provider_place_id) provider, provider_place_id, etag
+        FROM place_source_meta
+        WHERE provider = ANY(%s) AND provider_place_id = ANY(%s) AND etag IS NOT NULL
+        ORDER BY provider, provider_place_id, fetched_at DESC
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, [list({j.provider for j in jobs}), list({j.provider_place_id for j in jobs})])
+        return {(provider, ppid): etag for provider, ppid, etag in cur.fetchall()}
+
+
+UPSERT_PLACES_SQL = """
+    INSERT INTO places (name, category_id, address, phone, website_url, opening_hours_json, geog,
+                        google_place_id, data_source, provider, provider_place_id)
+    SELECT v.name, COALESCE(c.id, existing.category_id), v.address, v.phone, v.website_url, v.opening_hours::jsonb,
+           ST_SetSRID(ST_MakePoint(v.lng, v.lat), 4326)::geography,
+           CASE WHEN v.provider = 'google' THEN v.ppid END,
+           (CASE WHEN v.provider = 'google' THEN 'google' ELSE 'external' END)::data_source,
+           v.provider, v.ppid
+    FROM unnest(%s::text[], %s::text[], %s::text[], %s::text[], %s::text[], %s::text[], %s::text[], %s::float8[],
+                %s::float8[], %s::text[])
+         AS v(provider, ppid, name, address, phone, website_url, opening_hours, lat, lng, category_code)
+    LEFT JOIN categories c ON c.code = v.category_code
+    LEFT JOIN places existing ON existing.provider = v.provider AND existing.provider_place_id = v.ppid
+    -- 既存施設はカテゴリを維持。新規でカテゴリ未解決の行は作成しない（ジョブ側で失敗扱い）
+    WHERE COALESCE(c.id, existing.category_id) IS NOT NULL
+    ON CONFLICT (provider, provider_place_id) DO UPDATE
+    SET name = EXCLUDED.name,
+        address = EXCLUDED.address,
+        phone = EXCLUDED.phone,
+        website_url = EXCLUDED.website_url,
+        opening_hours_json = EXCLUDED.opening_hours_json,
+        geog = EXCLUDED.geog
+    WHERE places.manual_lock = false
+"""
+
+
+def apply_results(jobs: list[SyncJob], results: dict[str, FetchResult], providers: dict[str, PlaceProviderClient]) -> dict[str, int]:
+    """取得結果を places / place_source_meta / place_sync_jobs に一括反映する。"""
+    counts = {"updated": 0, "not_modified": 0, "failed": 0}
+    errors: dict[str, str] = {}
+    changed: list[tuple[SyncJob, FetchResult, dict]] = []
+    unchanged: list[SyncJob] = []
+
+    default_category = sync_settings().get("DEFAULT_CATEGORY")
+    for job in jobs:
+        result = results.get(job.id) or FetchResult(status=STATUS_ERROR, error="not fetched")
+        if result.status == STATUS_ERROR:
+            errors[job.id] = result.error or "fetch failed"
+        elif result.status == STATUS_NOT_MODIFIED:
+            unchanged.append(job)
+        else:
+            fields = providers[job.provider].normalize(result.payload or {})
+            fields["category_code"] = fields.get("category_code") or default_category
+            if not fields.get("name") or fields.get("lat") is None or fields.get("lng") is None:
+                errors[job.id] = "payload lacks name or location"
+            else:
+                changed.append((job, result, fields))
+
+    # 同一バッチ内で同じ (プロバイダ, Place ID) が重複すると ON CONFLICT が失敗するため 1 件に絞る
+    upserts = list({(j.provider, j.provider_place_id): f for j, _, f in changed}.items())
+
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            if upserts:
+                cur.execute(
+                    UPSERT_PLACES_SQL,
+                    [
+                        [provider for (provider, _), _ in upserts],
+                        [ppid for (_, ppid), _ in upserts],
+                        [f["name"] for _, f in upserts],
+                        [f.get("address") for _, f in upserts],
+                        [f.get("phone") for _, f in upserts],
+                        [f.get("website_url") for _, f in upserts],
+                        [json.dumps(f["opening_hours_json"]) if f.get("opening_hours_json") is not None else None for _, f in upserts],
+                        [float(f["lat"]) for _, f in upserts],
+                        [float(f["lng"]) for _, f in upserts],
+                        [f.get("category_code") for _, f in upserts],
+                    ],
+                )
+
+            # (provider, provider_place_id) → places.id（manual_lock で更新されなかった施設も含めて解決）
+            cur.execute(
+                """
+                SELECT p.provider, p.provider_place_id, p.id
+                FROM places p
+                JOIN unnest(%s::text[], %s::text[]) AS v(provider, ppid)
+                  ON p.provider = v.provider AND p.provider_place_id = v.ppid
+                """,
+                [[j.provider for j in jobs], [j.provider_place_id for j in jobs]],
+            )
+            place_ids = {(provider, ppid): str(pid) for provider, ppid, pid in cur.fetchall()}
+
+            meta_rows = [
+                (place_ids[(j.provider, j.provider_place_id)], j.provider, j.provider_place_id, json.dumps(r.payload), r.etag)
+                for j, r, _ in changed
+                if (j.provider, j.provider_place_id) in place_ids
+            ]
+            if meta_rows:
+                cur.execute(
+                    """
+                    INSERT INTO place_source_meta (place_id, provider, provider_place_id, raw_json, etag)
+                    SELECT v.place_id, v.provider, v.ppid, v.raw::jsonb, v.etag
+                    FROM unnest(%s::uuid[], %s::text[], %s::text[], %s::text[], %s::text[]) AS v(place_id, provider, ppid, raw, etag)
+                    """,
+                    [list(col) for col in zip(*meta_rows)],
+                )
+            if unchanged:
+                # 未変更の場合は最新メタの取得時刻だけ更新する
+                cur.execute(
+                    """
+                    UPDATE place_source_meta m SET fetched_at = NOW()
+                    WHERE m.id IN (
+                        SELECT DISTINCT ON (provider, provider_place_id) id
+                        FROM place_source_meta
+                        WHERE provider = ANY(%s) AND provider_place_id = ANY(%s)
+                        ORDER BY provider, provider_place_id, fetched_at DESC
+                    )
+                    """,
+                    [list({j.provider for j in unchanged}), [j.provider_place_id for j in unchanged]],
+                )
+
+            for job, _, _ in changed:
+                if (job.provider, job.provider_place_id) not in place_ids:
+                    errors[job.id] = "unknown category; place was not created"
+
+            done = [j for j in jobs if j.id not in errors]
+            if done:
+                cur.execute(
+                    """
+                    UPDATE place_sync_jobs j
+                    SET status = 'succeeded', finished_at = NOW(), place_id = COALESCE(v.place_id, j.place_id)
+                    FROM unnest(%s::uuid[], %s::uuid[]) AS v(id, place_id)
+                    WHERE j.id = v.id
+                    """,
+                    [[j.id for j in done], [place_ids.get((j.provider, j.provider_place_id)) for j in done]],
+                )
+            if errors:
+                cur.execute(
+                    """
+                    UPDATE place_sync_jobs j
+                    SET status = 'failed', finished_at = NOW(), error_message = v.message
+                    FROM unnest(%s::uuid[], %s::text[]) AS v(id, message)
+                    WHERE j.id = v.id
+                    """,
+                    [list(errors.keys()), list(errors.values())],
+                )
+
+    counts["updated"] = len([j for j, _, _ in changed if j.id not in errors])
+    counts["not_modified"] = len(unchanged)
+    counts["failed"] = len(errors)
+    return counts
+
+
+def run_batch(providers: dict[str, PlaceProviderClient] | None = None, batch_size: int | None = None, concurrency: int | None = None) -> dict[str, int]:
+    """1 バッチ分（取得→HTTP→反映）を処理し、件数を返す。"""
+    conf = sync_settings()
+    providers = providers if providers is not None else load_providers()
+    jobs = claim_jobs(batch_size or conf["BATCH_SIZE"], conf["STALE_RUNNING_MINUTES"])
+    if not jobs:
+        return {"claimed": 0, "updated": 0, "not_modified": 0, "failed": 0}
+    etags = load_etags(jobs)
+    results = asyncio.run(fetch_all(jobs, etags, providers, concurrency or conf["CONCURRENCY"], conf["RATE_LIMITS"]))
+    counts = apply_results(jobs, results, providers)
+    return {"claimed": len(jobs), **counts}
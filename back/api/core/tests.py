@@ -1,3 +1,733 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, connections, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from core import export, idempotency, query_plans, search_index, stats_flusher, token_maintenance
+from core.authentication import ClaimsJWTAuthentication, ClaimsRefreshToken, _version_cache_key
+from core.middleware import RateLimitHeadersMiddleware
+from core.moderation import moderate_reviews
+from core.opening_hours import parse_open_at
+from core.place_import import RowError, _parse_features
+from core.ratelimit import GCRAThrottle, MemoryStore, SharedStore, gcra, parse_rate, reset_limiter
+from core.review_views import refresh_place_stats_bulk, schedule_place_stats_refresh
+from core.schema import reset_capabilities
+from core.sync import STATUS_ERROR, STATUS_NOT_MODIFIED, STATUS_OK, HttpJsonClient, load_providers, run_batch
+from core.views import MetricsView, PlacesBatchView, search_places_sql
+
+
+class ParseFeaturesTests(SimpleTestCase):
+    def test_csv_tokens(self):
+        self.assertEqual(
+            _parse_features("nursing_room|diaper_table:2"),
+            [
+                {"code": "nursing_room", "value": 1, "detail": None},
+                {"code": "diaper_table", "value": 2, "detail": None},
+            ],
+        )
+
+    def test_csv_invalid_value_is_row_error(self):
+        with self.assertRaisesMessage(RowError, "invalid feature value: nursing_room"):
+            _parse_features("nursing_room:abc")
+
+    def test_out_of_range_value_is_row_error(self):
+        with self.assertRaisesMessage(RowError, "feature value out of range: wifi"):
+            _parse_features("wifi:40000")
+        with self.assertRaisesMessage(RowError, "feature value out of range: wifi"):
+            _parse_features({"wifi": -32769})
+        self.assertEqual(_parse_features({"wifi": 32767})[0]["value"], 32767)
+
+
+@skipIf(search_index.np is None, "NumPy がインストールされていません")
+class SearchIndexIncrementalTests(TestCase):
+    """差分更新後のメモリ内インデックスが SQL 検索と一致すること（特徴の変更・削除と追加が同時の場合）。"""
+
+    def setUp(self):
+        reset_capabilities()
+        with connection.cursor() as cur:
+            cur.execute("INSERT INTO categories (code, label) VALUES ('park', '公園') RETURNING id")
+            self.category_id = cur.fetchone()[0]
+            cur.execute("INSERT INTO features (code, label) VALUES ('nursing_room', '授乳室') RETURNING id")
+            self.feature_id = cur.fetchone()[0]
+            self.a = self._insert_place(cur, "A", 35.6800, 139.7600)
+            self.b = self._insert_place(cur, "B", 35.6810, 139.7610)
+
+    def _insert_place(self, cur, name, lat, lng):
+        cur.execute(
+            """
+            INSERT INTO places (name, category_id, geog)
+            VALUES (%s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography)
+            RETURNING id
+            """,
+            [name, self.category_id, lng, lat],
+        )
+        return str(cur.fetchone()[0])
+
+    def _ids(self, items):
+        return [item["id"] for item in items]
+
+    def test_incremental_matches_sql(self):
+        base = search_index.load_full()
+        with connection.cursor() as cur:
+            cur.execute("INSERT INTO place_features (place_id, feature_id, value) VALUES (%s, %s, 1)", [self.a, self.feature_id])
+            cur.execute("DELETE FROM places WHERE id = %s", [self.b])
+            c = self._insert_place(cur, "C", 35.6805, 139.7605)
+
+        snapshot = search_index.load_incremental(base, overlap_s=300)
+        self.assertIsNotNone(snapshot)
+        for args in (
+            {"sort": "distance"},
+            {"sort": "new"},
+            {"sort": "distance", "features_list": ["nursing_room"]},
+        ):
+            query = {"lat": 35.68, "lng": 139.76, "radius_m": 1000, "limit": 20, "offset": 0, **args}
+            with self.subTest(**args):
+                self.assertEqual(self._ids(snapshot.search(**query)), self._ids(search_places_sql(**query)))
+        self.assertNotIn(self.b, self._ids(snapshot.search(35.68, 139.76, 1000, 20, 0, "distance")))
+        self.assertIn(c, self._ids(snapshot.search(35.68, 139.76, 1000, 20, 0, "distance")))
+
+
+@skipIf(search_index.np is None, "NumPy がインストールされていません")
+class SnapshotDigestTests(SimpleTestCase):
+    def _snapshot(self, label="公園", prior=(3.5, 5.0)):
+        np = search_index.np
+        columns = {
+            "ids": np.asarray([b"0" * 32], dtype="S32"),
+            "names": search_index.StringColumn.from_strings(["A"]),
+            "categories": np.zeros(1, dtype=np.int16),
+            "lat": np.asarray([35.68]),
+            "lng": np.asarray([139.76]),
+            "cells": np.zeros(1, dtype=np.int64),
+            "avg": np.asarray([np.nan]),
+            "reviews": np.zeros(1, dtype=np.int64),
+            "created_us": np.zeros(1, dtype=np.int64),
+            "features": np.zeros((1, 1), dtype=np.uint8),
+        }
+        return search_index.Snapshot(columns, [("park", label)], ["nursing_room"], prior, (None, None, None), 0.0, 0.0)
+
+    def test_digest_changes_with_lookups_only(self):
+        base = search_index.content_digest(self._snapshot())
+        self.assertEqual(base, search_index.content_digest(self._snapshot()))
+        self.assertNotEqual(base, search_index.content_digest(self._snapshot(label="広場")))
+        self.assertNotEqual(base, search_index.content_digest(self._snapshot(prior=(3.6, 5.0))))
+
+    def test_written_snapshot_records_digest(self):
+        snapshot = self._snapshot()
+        with tempfile.TemporaryDirectory() as tmp:
+            search_index.write_snapshot(snapshot, Path(tmp))
+            self.assertEqual(search_index.current_digest(Path(tmp)), search_index.content_digest(snapshot))
+
+
+class QueryPlanSubmitTests(SimpleTestCase):
+    def test_capture_runs_off_the_request_thread(self):
+        done = threading.Event()
+        threads = []
+
+        def fake_capture(collector, route, trace_id):
+            threads.append(threading.current_thread())
+            done.set()
+
+        with mock.patch.object(query_plans, "capture", fake_capture):
+            self.assertTrue(query_plans.submit(query_plans.PlanCollector(True, 0.0, 1), "places-search", "t1"))
+            self.assertTrue(done.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+
+
+class FakePlacesHandler(BaseHTTPRequestHandler):
+    """/places/<id> に server.places[id] を JSON で返す疑似プロバイダ（If-None-Match に対応）。"""
+
+    def do_GET(self):
+        pid = self.path.rsplit("/", 1)[-1]
+        payload = self.server.places.get(pid)
+        if payload is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(payload).encode("utf-8")
+        etag = f'"{len(body)}-{hash(body) & 0xFFFF}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class AcmeClient(HttpJsonClient):
+    """テスト用の Google 以外のプロバイダ。"""
+
+    def __init__(self, base_url: str, timeout: float = 10.0, category: str = "park"):
+        super().__init__(base_url, timeout)
+        self.category = category
+
+    def normalize(self, payload: dict) -> dict:
+        return {"name": payload["name"], "lat": payload["lat"], "lng": payload["lng"], "category_code": self.category}
+
+
+class FakeProviderMixin:
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakePlacesHandler)
+        self.server.places = {"p1": {"name": "Acme Park", "lat": 35.68, "lng": 139.76}}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+
+class HttpJsonClientTests(FakeProviderMixin, SimpleTestCase):
+    def test_conditional_fetch(self):
+        client = AcmeClient(self.base_url, timeout=2.0)
+        first = client.fetch("p1", None)
+        self.assertEqual(first.status, STATUS_OK)
+        self.assertEqual(first.payload["name"], "Acme Park")
+        self.assertEqual(client.fetch("p1", first.etag).status, STATUS_NOT_MODIFIED)
+
+    def test_http_error(self):
+        result = AcmeClient(self.base_url, timeout=2.0).fetch("missing", None)
+        self.assertEqual((result.status, result.error), (STATUS_ERROR, "HTTP 404"))
+
+    def test_load_providers_passes_options(self):
+        conf = {"PROVIDERS": {"acme": {"CLASS": "core.tests.AcmeClient", "OPTIONS": {"base_url": self.base_url, "category": "cafe"}}}}
+        with override_settings(PLACE_SYNC=conf):
+            client = load_providers()["acme"]
+        self.assertEqual((client.name, client.base_url, client.category, client.timeout), ("acme", self.base_url, "cafe", 10.0))
+
+    def test_load_providers_missing_option(self):
+        with override_settings(PLACE_SYNC={"PROVIDERS": {"acme": "core.tests.AcmeClient"}}):
+            with self.assertRaises(ImproperlyConfigured):
+                load_providers()
+
+
+class SyncUpsertTests(FakeProviderMixin, TestCase):
+    def test_non_google_provider_is_keyed_by_provider_place_id(self):
+        with connection.cursor() as cur:
+            cur.execute("INSERT INTO categories (code, label) VALUES ('park', '公園')")
+        client = AcmeClient(self.base_url, timeout=2.0)
+        client.name = "acme"
+        for name in ("Acme Park", "Acme Park 2"):
+            self.server.places["p1"]["name"] = name
+            with connection.cursor() as cur:
+                cur.execute("INSERT INTO place_sync_jobs (provider, provider_place_id) VALUES ('acme', 'p1')")
+            counts = run_batch(providers={"acme": client})
+            self.assertEqual((counts["updated"], counts["failed"]), (1, 0))
+        with connection.cursor() as cur:
+            cur.execute("SELECT name, data_source::text, google_place_id FROM places WHERE provider = 'acme' AND provider_place_id = 'p1'")
+            self.assertEqual(cur.fetchall(), [("Acme Park 2", "external", None)])
+
+
+class IncrementalExportTests(TestCase):
+    def test_deleted_place_is_exported_as_tombstone(self):
+        reset_capabilities()
+        with connection.cursor() as cur:
+            cur.execute("INSERT INTO categories (code, label) VALUES ('park', '公園') RETURNING id")
+            category_id = cur.fetchone()[0]
+            cur.execute(
+                """
+                INSERT INTO places (name, category_id, geog)
+                VALUES ('A', %s, ST_SetSRID(ST_MakePoint(139.76, 35.68), 4326)::geography)
+                RETURNING id, updated_at
+                """,
+                [category_id],
+            )
+            place_id, updated_at = cur.fetchone()
+            cur.execute("DELETE FROM places WHERE id = %s", [place_id])
+        rows = [json.loads(line) for line in export.iter_ndjson("places", updated_at, export.current_watermark("places"))]
+        self.assertEqual([(row["id"], row["deleted"]) for row in rows], [(str(place_id), True)])
+
+
+class PlaceStatsFlusherTests(TestCase):
+    def setUp(self):
+        reset_capabilities()
+        with connection.cursor() as cur:
+            cur.execute("INSERT INTO categories (code, label) VALUES ('park', '公園') RETURNING id")
+            category_id = cur.fetchone()[0]
+            cur.execute(
+                """
+                INSERT INTO places (name, category_id, geog)
+                SELECT 'P' || i, %s, ST_SetSRID(ST_MakePoint(139.76, 35.68), 4326)::geography
+                FROM generate_series(1, 2) AS i
+                RETURNING id
+                """,
+                [category_id],
+            )
+            self.place_ids = sorted(str(row[0]) for row in cur.fetchall())
+
+    def _dirty(self):
+        with connection.cursor() as cur:
+            cur.execute("SELECT place_id::text FROM place_stats_dirty ORDER BY place_id")
+            return [row[0] for row in cur.fetchall()]
+
+    @override_settings(PLACE_STATS={"MODE": "write_behind"})
+    def test_registration_rolls_back_with_the_write(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            schedule_place_stats_refresh(self.place_ids[0])
+            self.assertEqual(self._dirty(), [self.place_ids[0]])
+            raise RuntimeError("review insert failed")
+        self.assertEqual(self._dirty(), [])
+
+    def test_flush_once_recomputes_and_drains(self):
+        with connection.cursor() as cur:
+            cur.execute(
+                "INSERT INTO place_stats (place_id, review_count, photo_count) SELECT unnest(%s::uuid[]), 5, 5",
+                [self.place_ids],
+            )
+            cur.execute("INSERT INTO place_stats_dirty (place_id) SELECT unnest(%s::uuid[])", [self.place_ids])
+        self.assertEqual(stats_flusher.flush_once(batch_size=10), 2)
+        self.assertEqual(self._dirty(), [])
+        with connection.cursor() as cur:
+            cur.execute("SELECT review_count, photo_count FROM place_stats WHERE place_id = ANY(%s::uuid[])", [self.place_ids])
+            self.assertEqual(cur.fetchall(), [(0, 0), (0, 0)])
+
+    def test_flush_all_leaves_registrations_after_cutoff(self):
+        early, late = self.place_ids
+        with connection.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO place_stats_dirty (place_id, first_dirty_at)
+                VALUES (%s, NOW() - interval '1 minute'), (%s, NOW() + interval '1 minute')
+                """,
+                [early, late],
+            )
+        # batch_size=1 で 1 件ずつ取り出しても、開始時刻より後の登録は次の回に回る
+        self.assertEqual(stats_flusher.flush_all(batch_size=1), 1)
+        self.assertEqual(self._dirty(), [late])
+        self.assertEqual(stats_flusher.flush_once(batch_size=1), 1)
+        self.assertEqual(self._dirty(), [])
+
+
+class ModerationDeltaTests(TestCase):
+    """モデレーションの差分更新が、reviews からの再集計（refresh_place_stats_bulk）と同じ結果になること。"""
+
+    def setUp(self):
+        reset_capabilities()
+        user = get_user_model().objects.create_user(username="u", email="u@example.com", password="pw-123456")
+        with connection.cursor() as cur:
+            cur.execute("INSERT INTO categories (code, label) VALUES ('park', '公園') RETURNING id")
+            category_id = cur.fetchone()[0]
+            cur.execute(
+                """
+                INSERT INTO places (name, category_id, geog)
+                VALUES ('A', %s, ST_SetSRID(ST_MakePoint(139.76, 35.68), 4326)::geography)
+                RETURNING id
+                """,
+                [category_id],
+            )
+            self.place_id = str(cur.fetchone()[0])
+            cur.execute("SELECT id FROM age_bands ORDER BY sort LIMIT 2")
+            band_a, band_b = [row[0] for row in cur.fetchall()]
+            self.review_ids = []
+            # 最新のレビューだけが年齢帯 b を持つ（外すと b の行が無くなる）
+            for days_ago, overall, band in ((3, 5, band_a), (2, 4, band_a), (1, 2, band_b)):
+                cur.execute(
+                    """
+                    INSERT INTO reviews (id, place_id, user_id, overall, age_band_id, text, status, created_at, updated_at)
+                    VALUES (gen_random_uuid(), %s, %s, %s, %s, 't', 'public', NOW() - make_interval(days => %s), NOW())
+                    RETURNING id
+                    """,
+                    [self.place_id, user.pk, overall, band, days_ago],
+                )
+                self.review_ids.append(str(cur.fetchone()[0]))
+        refresh_place_stats_bulk([self.place_id])
+
+    def _aggregates(self):
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT review_count, overall_sum, avg_overall, last_reviewed_at FROM place_stats WHERE place_id = %s",
+                [self.place_id],
+            )
+            stats = cur.fetchone()
+            cur.execute(
+                """
+                SELECT age_band_id, review_count, overall_sum, avg_overall FROM place_age_band_stats
+                WHERE place_id = %s ORDER BY age_band_id
+                """,
+                [self.place_id],
+            )
+            return stats, cur.fetchall()
+
+    def _assert_matches_recompute(self):
+        moderated = self._aggregates()
+        refresh_place_stats_bulk([self.place_id])
+        self.assertEqual(moderated, self._aggregates())
+
+    def test_hide_and_restore_match_recompute(self):
+        newest = self.review_ids[-1]
+        moderate_reviews("hidden", review_ids=[newest])
+        stats, bands = self._aggregates()
+        self.assertEqual(stats[:2], (2, 9))
+        self.assertEqual(len(bands), 1)
+        self._assert_matches_recompute()
+
+        moderate_reviews("public", review_ids=[newest])
+        self.assertEqual(len(self._aggregates()[1]), 2)
+        self._assert_matches_recompute()
+
+    def test_pending_to_hidden_changes_nothing(self):
+        moderate_reviews("pending", review_ids=self.review_ids[:1])
+        before = self._aggregates()
+        moderate_reviews("hidden", review_ids=self.review_ids[:1])
+        self.assertEqual(self._aggregates(), before)
+        self._assert_matches_recompute()
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        reset_capabilities()
+        self.user = get_user_model().objects.create_user(username="u", email="u@example.com", password="pw-123456")
+        access = ClaimsRefreshToken.for_user(self.user).access_token
+        self.request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_new_user_gets_a_version_row(self):
+        with connection.cursor() as cur:
+            cur.execute("SELECT version FROM user_auth_versions WHERE user_id = %s", [self.user.pk])
+            self.assertEqual(cur.fetchone(), (0,))
+
+    def test_claims_user_for_reads(self):
+        user, _ = ClaimsJWTAuthentication().authenticate(self.request)
+        self.assertNotIsInstance(user, get_user_model())
+        self.assertEqual(str(user.id), str(self.user.pk))
+
+    def test_deleted_user_is_rejected(self):
+        user_id = self.user.pk
+        self.user.delete()
+        # キャッシュ済みの世代は VERSION_TTL_S 秒で切れる（ここでは切れた後を見る）
+        cache.delete(_version_cache_key(user_id))
+        with self.assertRaises(AuthenticationFailed):
+            ClaimsJWTAuthentication().authenticate(self.request)
+
+
+class PartitionedTokenUniquenessTests(TestCase):
+    def test_duplicates_are_rejected_after_conversion(self):
+        token_maintenance.convert_to_partitioned("month", 1)
+        user = get_user_model().objects.create_user(username="u", email="u@example.com", password="pw-123456")
+        expires_at = timezone.now() + timedelta(days=1)
+        token = OutstandingToken.objects.create(user=user, jti="j1", token="t", expires_at=expires_at)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            OutstandingToken.objects.create(user=user, jti="j1", token="t", expires_at=expires_at)
+        # simplejwt の blacklist() と同じ get_or_create は既存行を返す
+        self.assertEqual(OutstandingToken.objects.get_or_create(jti="j1", defaults={"expires_at": expires_at})[0].pk, token.pk)
+        BlacklistedToken.objects.create(token=token)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BlacklistedToken.objects.create(token=token)
+        self.assertEqual(BlacklistedToken.objects.filter(token=token).count(), 1)
+
+
+class IdempotentEchoView(APIView):
+    calls = 0
+
+    @idempotency.idempotent("test-echo")
+    def post(self, request):
+        type(self).calls += 1
+        body = {"n": type(self).calls, "at": datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc), "b": 1, "a": 2}
+        return Response(body, status=int(request.data.get("status", 201)))
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        reset_capabilities()
+        IdempotentEchoView.calls = 0
+        self.user = get_user_model().objects.create_user(username="u", email="u@example.com", password="pw-123456")
+
+    def _post(self, data, key="k1"):
+        request = APIRequestFactory().post("/echo", data, format="json", HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, user=self.user)
+        return IdempotentEchoView.as_view()(request).render()
+
+    def test_replay_is_byte_identical(self):
+        first = self._post({"x": 1})
+        second = self._post({"x": 1})
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(second.content, first.content)
+        self.assertIn(b"2026-01-02T03:04:05.123456Z", second.content)
+        self.assertEqual(IdempotentEchoView.calls, 1)
+
+    def test_same_key_with_other_payload_is_422(self):
+        self._post({"x": 1})
+        response = self._post({"x": 2})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(IdempotentEchoView.calls, 1)
+
+    @override_settings(IDEMPOTENCY={"WAIT_S": 0.1})
+    def test_concurrent_duplicate_is_409(self):
+        # 別セッションが同じキーの処理中（advisory lock を保持）
+        other = connections.create_connection("default")
+        try:
+            with other.cursor() as cur:
+                cur.execute("SELECT pg_advisory_lock(%s)", [idempotency._lock_id(self.user.pk, "k1")])
+            response = self._post({"x": 1})
+        finally:
+            other.close()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(IdempotentEchoView.calls, 0)
+
+    def test_server_error_is_not_stored(self):
+        self.assertEqual(self._post({"status": 503}).status_code, 503)
+        self.assertEqual(self._post({"status": 503}).status_code, 503)
+        self.assertEqual(IdempotentEchoView.calls, 2)
+        with connection.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM idempotency_keys")
+            self.assertEqual(cur.fetchone()[0], 0)
+
+
+class ParseOpenAtTests(SimpleTestCase):
+    def test_local_and_utc(self):
+        # 2024-01-01 は月曜
+        self.assertEqual(parse_open_at("2024-01-01T09:30"), 570)
+        self.assertEqual(parse_open_at("2024-01-01T00:30:00Z"), 570)
+
+    def test_unencoded_plus_offset(self):
+        self.assertEqual(parse_open_at("2024-01-07T23:00:00 09:00"), 6 * 1440 + 23 * 60)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            parse_open_at("tomorrow")
+
+
+class OpeningHoursMinutesTests(TestCase):
+    """マイグレーション 0017 の opening_hours_minutes()（月曜 0:00 = 0 の週内の分）。"""
+
+    def minutes(self, value):
+        with connection.cursor() as cur:
+            cur.execute("SELECT opening_hours_minutes(%s::jsonb)::text", [json.dumps(value)])
+            return cur.fetchone()[0]
+
+    def test_api_format(self):
+        self.assertEqual(self.minutes({"mon": [["09:00", "18:00"]], "tue": []}), "{[540,1080)}")
+        self.assertEqual(self.minutes({"sat": [["00:00", "24:00"]]}), "{[7200,8640)}")
+
+    def test_overnight(self):
+        self.assertEqual(self.minutes({"fri": [["22:00", "02:00"]]}), "{[7080,7320)}")
+
+    def test_week_wrap(self):
+        self.assertEqual(self.minutes({"sun": [["22:00", "02:00"]]}), "{[0,120),[9960,10080)}")
+
+    def test_google_new_format(self):
+        periods = [{"open": {"day": 1, "hour": 9, "minute": 0}, "close": {"day": 1, "hour": 17, "minute": 30}}]
+        self.assertEqual(self.minutes({"periods": periods}), "{[540,1050)}")
+
+    def test_google_legacy_format_wraps_week(self):
+        periods = [{"open": {"day": 0, "time": "2200"}, "close": {"day": 1, "time": "0200"}}]
+        self.assertEqual(self.minutes({"periods": periods}), "{[0,120),[9960,10080)}")
+
+    def test_google_open_all_day(self):
+        self.assertEqual(self.minutes({"periods": [{"open": {"day": 0, "time": "0000"}}]}), "{[0,10080)}")
+
+    def test_closed_and_unknown(self):
+        self.assertEqual(self.minutes({"mon": []}), "{}")
+        self.assertIsNone(self.minutes({}))
+        self.assertIsNone(self.minutes([]))
+
+    def test_unparsable_is_null(self):
+        self.assertIsNone(self.minutes({"mon": [["nine", "18:00"]]}))
+        self.assertIsNone(self.minutes({"periods": [{"open": {"day": "x"}, "close": {"day": 1}}]}))
+
+    def test_trigger_keeps_column_in_sync(self):
+        with connection.cursor() as cur:
+            cur.execute("INSERT INTO categories (code, label) VALUES ('park', '公園') RETURNING id")
+            category_id = cur.fetchone()[0]
+            cur.execute(
+                """
+                INSERT INTO places (name, category_id, geog, opening_hours_json)
+                VALUES ('A', %s, ST_SetSRID(ST_MakePoint(139.76, 35.68), 4326)::geography, %s::jsonb)
+                RETURNING id, opening_minutes::text
+                """,
+                [category_id, json.dumps({"mon": [["09:00", "18:00"]]})],
+            )
+            place_id, minutes = cur.fetchone()
+            self.assertEqual(minutes, "{[540,1080)}")
+            cur.execute(
+                "UPDATE places SET opening_hours_json = NULL WHERE id = %s RETURNING opening_minutes", [place_id]
+            )
+            self.assertIsNone(cur.fetchone()[0])
+
+
+class PlacesBatchParserTests(SimpleTestCase):
+    def test_form_body_is_unsupported_media_type(self):
+        request = APIRequestFactory().post("/api/places/batch", {"ids": "x"}, format="multipart")
+        response = PlacesBatchView.as_view()(request).render()
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(response["Content-Type"], "application/json")
+
+
+class MetricsAccessTests(SimpleTestCase):
+    def get(self, **headers):
+        return MetricsView.as_view()(RequestFactory().get("/metrics", **headers))
+
+    @override_settings(METRICS={"TOKEN": None, "ALLOW_UNAUTHENTICATED": False})
+    def test_no_token_is_closed_by_default(self):
+        self.assertEqual(self.get().status_code, 403)
+
+    @override_settings(METRICS={"TOKEN": "s3cret", "ALLOW_UNAUTHENTICATED": False})
+    def test_token(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        self.assertEqual(self.get(HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+    @override_settings(METRICS={"TOKEN": None, "ALLOW_UNAUTHENTICATED": True})
+    def test_internal_only_bind(self):
+        self.assertEqual(self.get().status_code, 200)
+
+
+class ExplainableTests(SimpleTestCase):
+    def test_plain_select(self):
+        self.assertTrue(query_plans.explainable("SELECT id FROM places WHERE id = %s"))
+        self.assertTrue(query_plans.explainable("WITH up AS (SELECT 1) SELECT p.id FROM places p CROSS JOIN up"))
+
+    def test_side_effect_functions_are_rejected(self):
+        for sql in (
+            "SELECT pg_try_advisory_lock(%s)",
+            "SELECT pg_advisory_unlock(%s)",
+            "SELECT pg_advisory_xact_lock(1) FROM places",
+            "SELECT nextval('places_seq') FROM places",
+            "SELECT setval('places_seq', 1)",
+            "SELECT set_config('statement_timeout', '0', false) FROM places",
+        ):
+            with self.subTest(sql=sql):
+                self.assertFalse(query_plans.explainable(sql))
+
+    def test_writes_and_row_locks_are_rejected(self):
+        self.assertFalse(query_plans.explainable("WITH d AS (DELETE FROM x RETURNING id) SELECT * FROM d"))
+        self.assertFalse(query_plans.explainable("SELECT 1 FROM place_stats WHERE place_id = %s FOR UPDATE"))
+
+
+class GCRATests(SimpleTestCase):
+    rate = parse_rate("60/min", burst=2)  # 間隔 1 秒、2 件まで連続で通る
+
+    def test_burst_then_reject(self):
+        tat, first = gcra(None, 100.0, self.rate)
+        self.assertEqual((first.allowed, first.limit, first.remaining, first.reset), (True, 2, 1, 1))
+        tat, second = gcra(tat, 100.0, self.rate)
+        self.assertEqual((second.allowed, second.remaining, second.reset), (True, 0, 2))
+        rejected_tat, third = gcra(tat, 100.0, self.rate)
+        self.assertIsNone(rejected_tat)
+        self.assertEqual((third.allowed, third.remaining, third.reset), (False, 0, 2))
+        self.assertAlmostEqual(third.retry_after, 1.0)
+        # Retry-After だけ待てば 1 件通る
+        _, retried = gcra(tat, 100.0 + third.retry_after, self.rate)
+        self.assertTrue(retried.allowed)
+        self.assertEqual(retried.remaining, 0)
+
+    def test_idle_bucket_refills(self):
+        tat, _ = gcra(None, 100.0, self.rate)
+        tat, _ = gcra(tat, 100.0, self.rate)
+        _, result = gcra(tat, 110.0, self.rate)
+        self.assertEqual((result.allowed, result.remaining, result.reset), (True, 1, 1))
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("10/s"), parse_rate("10/sec"))
+        self.assertEqual(parse_rate("120/h").burst, 120)
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rate("0/m")
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rate("10/x")
+
+
+class RateLimitStoreTests(SimpleTestCase):
+    rate = parse_rate("60/min", burst=2)
+
+    def _check(self, store, key, now):
+        seen = []
+
+        def func(tat):
+            seen.append(tat)
+            return gcra(tat, now, self.rate)
+
+        result = store.update(key, now, func)
+        return seen[0], result
+
+    def test_memory_store_evicts_expired_then_oldest(self):
+        store = MemoryStore(max_keys=10)
+        self._check(store, "old", 0.0)
+        for i in range(10):
+            self._check(store, f"k{i}", 100.0)
+        # 期限切れの "old" だけが捨てられる
+        self.assertNotIn("old", store._tats)
+        self.assertEqual(len(store._tats), 10)
+        self._check(store, "k10", 100.0)
+        # すべて有効なら古い順に超過分 + 1 割を捨てる
+        self.assertEqual(list(store._tats), [f"k{i}" for i in range(2, 11)])
+
+    def test_shared_store_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "ratelimit.bin")
+            first, second = SharedStore(path, slots=64), SharedStore(path, slots=64)
+            self.assertTrue(self._check(first, "u1", 100.0)[1].allowed)
+            self.assertTrue(self._check(second, "u1", 100.0)[1].allowed)
+            tat, result = self._check(first, "u1", 100.0)
+            self.assertEqual(tat, 102.0)
+            self.assertFalse(result.allowed)
+            # 拒否では TAT を進めない
+            self.assertEqual(self._check(second, "u1", 100.0)[0], 102.0)
+
+    def test_shared_store_overwrites_oldest_slot_when_full(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SharedStore(str(Path(tmp) / "ratelimit.bin"), slots=16)
+            buckets = store.slots - store.PROBES + 1
+            # すべて同じ探索範囲に入るハッシュ
+            hashes = {f"k{i}": buckets * (i + 1) + 3 for i in range(store.PROBES + 1)}
+            with mock.patch.object(store, "_hash", side_effect=hashes.__getitem__):
+                for i in range(store.PROBES):
+                    self._check(store, f"k{i}", 100.0 + i * 0.1)
+                self._check(store, f"k{store.PROBES}", 100.5)
+                # TAT の最も古い k0 が上書きされ、他は残る
+                self.assertIsNotNone(self._check(store, "k1", 100.5)[0])
+                self.assertIsNone(self._check(store, "k0", 100.5)[0])
+
+
+class RateLimitedView(APIView):
+    permission_classes = [AllowAny]
+    throttle_classes = [GCRAThrottle]
+
+    def get(self, request):
+        return Response({"ok": True})
+
+
+@override_settings(RATE_LIMIT={"STORE": "memory", "DEFAULT": {"anon": "1/min"}})
+class RateLimitHeadersTests(SimpleTestCase):
+    def setUp(self):
+        reset_limiter()
+        self.addCleanup(reset_limiter)
+        self.handler = RateLimitHeadersMiddleware(RateLimitedView.as_view())
+
+    def _get(self):
+        return self.handler(RequestFactory().get("/", REMOTE_ADDR="203.0.113.9"))
+
+    def test_headers_and_retry_after(self):
+        first = self._get()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual((first["RateLimit-Limit"], first["RateLimit-Remaining"], first["RateLimit-Reset"]), ("1", "0", "60"))
+        second = self._get()
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second["Retry-After"], "60")
+        self.assertEqual((second["RateLimit-Remaining"], second["RateLimit-Reset"]), ("0", "60"))
+
+    def test_unlimited_route_has_no_headers(self):
+        with override_settings(RATE_LIMIT={"STORE": "memory", "DEFAULT": None}):
+            reset_limiter()
+            response = self._get()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("RateLimit-Limit", response)
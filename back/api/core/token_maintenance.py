@@ -0,0 +1,316 @@
+"""JWT ブラックリスト（rest_framework_simplejwt.token_blacklist）の掃除と時間パーティション化。
+
+- ROTATE_REFRESH_TOKENS / BLACKLIST_AFTER_ROTATION により /api/auth/refresh のたびに
+  token_blacklist_outstandingtoken と token_blacklist_blacklistedtoken に行が増える。期限切れの行は不要。
+- 通常の構成: 期限切れの outstanding と、それを指す blacklisted を BATCH_SIZE 件ずつ 1 文で削除する
+  （expires_at の索引は 0015 で作成。1 バッチ 1 トランザクションで、ロックを長く持たない）。
+- パーティション構成（convert_to_partitioned で一度だけ切り替える。任意）:
+  - outstanding は expires_at、blacklisted は blacklisted_at で PARTITION_PERIOD（month / week）ごとに分割する。
+  - 期限切れだけになったパーティションは DROP TABLE で即座に捨てる（行単位の DELETE をしない）。
+    blacklisted は「期間の終わり + REFRESH_TOKEN_LIFETIME」を過ぎたら対象トークンも必ず期限切れになっている。
+  - パーティションキーを含まない一意制約は持てないため、jti と blacklisted の token_id の一意性は
+    BEFORE INSERT トリガ（install_unique_guards）で保つ。キーごとの勧告ロックを取ってから既存行を探し、
+    あれば unique_violation を返す（simplejwt の get_or_create は IntegrityError を受けて既存行を読み直す）。
+    同じ jti は同じ expires_at を持つので、outstanding には (jti, expires_at) の一意索引も張る。
+    blacklisted→outstanding の外部キーは持てないため、削除の連鎖は掃除の側で行う。
+  - DEFAULT パーティションも作るので、先のパーティションを作り忘れても書き込みは失敗しない
+    （DEFAULT に入った行は通常の構成と同じく行単位で削除する）。
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+logger = logging.getLogger("core.token_maintenance")
+
+OUTSTANDING = "token_blacklist_outstandingtoken"
+BLACKLISTED = "token_blacklist_blacklistedtoken"
+
+# 期間 → (date_trunc の単位, interval, パーティション名の書式)
+PERIODS = {
+    "month": ("month", "1 month", "YYYY_MM"),
+    "week": ("week", "1 week", "IYYY_IW"),
+}
+
+
+def conf() -> dict:
+    defaults = {
+        "BATCH_SIZE": 5000,
+        "SLEEP_S": 0.05,
+        "PARTITION_PERIOD": "month",
+        "PARTITIONS_AHEAD": 3,
+    }
+    return {**defaults, **getattr(settings, "TOKEN_PRUNE", {})}
+
+
+def refresh_lifetime() -> timedelta:
+    return settings.SIMPLE_JWT.get("REFRESH_TOKEN_LIFETIME", timedelta(days=1))
+
+
+def is_partitioned(table: str = OUTSTANDING) -> bool:
+    with connection.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relnamespace = 'public'::regnamespace", [table])
+        row = cur.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def table_sizes() -> dict[str, dict]:
+    """テーブルごとの合計サイズ（索引・TOAST 込み）と推定行数。パーティションは合算する。"""
+    sizes = {}
+    with connection.cursor() as cur:
+        for table in (OUTSTANDING, BLACKLISTED):
+            cur.execute(
+                """
+                SELECT COALESCE(SUM(pg_total_relation_size(t.relid)), 0)::bigint,
+                       COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint,
+                       COUNT(*) FILTER (WHERE t.isleaf AND t.level > 0)
+                FROM pg_partition_tree(%s::regclass) t
+                JOIN pg_class c ON c.oid = t.relid
+                """,
+                [table],
+            )
+            total_bytes, rows, partitions = cur.fetchone()
+            sizes[table] = {"bytes": int(total_bytes), "rows_estimate": int(rows), "partitions": int(partitions)}
+    return sizes
+
+
+def delete_expired_batch(batch_size: int) -> int:
+    """期限切れの outstanding を最大 batch_size 件、それを指す blacklisted と一緒に削除する。"""
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(
+            f"""
+            WITH doomed AS (
+                SELECT id FROM {OUTSTANDING}
+                WHERE expires_at < NOW()
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ),
+            blacklisted AS (
+                DELETE FROM {BLACKLISTED} b USING doomed d WHERE b.token_id = d.id
+            )
+            DELETE FROM {OUTSTANDING} o USING doomed d WHERE o.id = d.id
+            """,
+            [batch_size],
+        )
+        return cur.rowcount
+
+
+def prune_rows(batch_size: int, sleep_s: float = 0.0, max_batches: int | None = None) -> int:
+    """delete_expired_batch を対象が無くなるまで（または max_batches 回）繰り返し、削除件数を返す。"""
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        n = delete_expired_batch(batch_size)
+        deleted += n
+        batches += 1
+        if n < batch_size:
+            break
+        if sleep_s:
+            time.sleep(sleep_s)
+    return deleted
+
+
+def _partitions(table: str) -> list[tuple[str, datetime | None, datetime | None]]:
+    """(パーティション名, 下限, 上限) の一覧。DEFAULT パーティションは下限・上限が None。"""
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname
+            """,
+            [table],
+        )
+        rows = cur.fetchall()
+    result = []
+    for name, bound in rows:
+        if bound == "DEFAULT":
+            result.append((name, None, None))
+            continue
+        # FOR VALUES FROM ('2026-10-01 00:00:00+00') TO ('2026-11-01 00:00:00+00')
+        lower, upper = bound.split("'")[1], bound.split("'")[3]
+        result.append((name, datetime.fromisoformat(lower), datetime.fromisoformat(upper)))
+    return result
+
+
+def ensure_partitions(period: str, ahead: int, since: datetime | None = None) -> list[str]:
+    """since（既定: 今）から ahead 期間先までのパーティションを両テーブルに作る。作成した名前を返す。"""
+    unit, step, fmt = PERIODS[period]
+    created = []
+    with connection.cursor() as cur:
+        for table in (OUTSTANDING, BLACKLISTED):
+            cur.execute(
+                f"""
+                SELECT g, g + interval '{step}', to_char(g, '{fmt}')
+                FROM generate_series(
+                    date_trunc(%s, COALESCE(%s::timestamptz, NOW())),
+                    date_trunc(%s, NOW()) + %s * interval '{step}',
+                    interval '{step}'
+                ) AS g
+                """,
+                [unit, since, unit, int(ahead)],
+            )
+            for lower, upper, suffix in cur.fetchall():
+                name = f"{table}_p{suffix}"
+                cur.execute("SELECT 1 FROM pg_class WHERE relname = %s", [name])
+                if cur.fetchone():
+                    continue
+                try:
+                    with transaction.atomic():
+                        cur.execute(
+                            f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+                            [lower, upper],
+                        )
+                except DatabaseError as exc:
+                    # 作り忘れの間に DEFAULT へ同じ範囲の行が入っていると作れない（その行は行単位で削除される）
+                    logger.warning("パーティション %s を作成できませんでした: %s", name, exc)
+                    continue
+                created.append(name)
+    return created
+
+
+def drop_expired_partitions(now: datetime | None = None) -> list[str]:
+    """中の行がすべて不要になったパーティションを DROP する。削除した名前を返す。"""
+    now = now or datetime.now(timezone.utc)
+    lifetime = refresh_lifetime()
+    dropped = []
+    with connection.cursor() as cur:
+        for table, grace in ((BLACKLISTED, lifetime), (OUTSTANDING, timedelta(0))):
+            for name, _, upper in _partitions(table):
+                if upper is not None and upper + grace <= now:
+                    cur.execute(f"DROP TABLE {name}")
+                    dropped.append(name)
+    return dropped
+
+
+def _has_unique_guards(cur) -> bool:
+    cur.execute(
+        "SELECT COUNT(*) FROM pg_trigger WHERE tgname = 'trg_token_unique_guard' AND tgrelid IN (%s::regclass, %s::regclass)",
+        [OUTSTANDING, BLACKLISTED],
+    )
+    return cur.fetchone()[0] == 2
+
+
+def install_unique_guards() -> None:
+    """パーティション構成の 2 テーブルに jti / token_id の一意性を保つトリガを作る（作成済みなら何もしない）。"""
+    with transaction.atomic(), connection.cursor() as cur:
+        if _has_unique_guards(cur):
+            return
+        for table, column in ((OUTSTANDING, "jti"), (BLACKLISTED, "token_id")):
+            func = f"{table}_unique_guard"
+            cur.execute(
+                f"""
+                CREATE OR REPLACE FUNCTION {func}() RETURNS trigger LANGUAGE plpgsql AS $$
+                BEGIN
+                  -- 同じキーの挿入をコミットまで直列にし、ロック後の新しいスナップショットで既存行を探す
+                  PERFORM pg_advisory_xact_lock('{table}'::regclass::oid::int, hashtext(NEW.{column}::text));
+                  IF EXISTS (SELECT 1 FROM {table} WHERE {column} = NEW.{column}) THEN
+                    RAISE unique_violation USING MESSAGE = format('duplicate {column} in {table}: %s', NEW.{column});
+                  END IF;
+                  RETURN NEW;
+                END $$;
+                DROP TRIGGER IF EXISTS trg_token_unique_guard ON {table};
+                CREATE TRIGGER trg_token_unique_guard BEFORE INSERT ON {table}
+                  FOR EACH ROW EXECUTE FUNCTION {func}();
+                """
+            )
+
+
+def convert_to_partitioned(period: str, ahead: int) -> dict[str, int]:
+    """2 テーブルをパーティション構成へ作り替える（期限切れでない行だけを移す）。移した行数を返す。
+    1 トランザクションで行い、処理中は両テーブルを ACCESS EXCLUSIVE でロックする（ログイン/リフレッシュが待つ）。
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period は {', '.join(PERIODS)} のいずれかです")
+    if is_partitioned(OUTSTANDING):
+        return {"outstanding": 0, "blacklisted": 0}
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(f"LOCK TABLE {OUTSTANDING}, {BLACKLISTED} IN ACCESS EXCLUSIVE MODE")
+        cur.execute(f"ALTER TABLE {BLACKLISTED} RENAME TO {BLACKLISTED}_legacy")
+        cur.execute(f"ALTER TABLE {OUTSTANDING} RENAME TO {OUTSTANDING}_legacy")
+
+        for table, key in ((OUTSTANDING, "expires_at"), (BLACKLISTED, "blacklisted_at")):
+            seq = f"{table}_part_id_seq"
+            # 元の id が identity でも serial でも同じになるよう、専用のシーケンスを既定値にする
+            cur.execute(
+                f"""
+                CREATE TABLE {table} (LIKE {table}_legacy INCLUDING DEFAULTS) PARTITION BY RANGE ({key});
+                CREATE SEQUENCE IF NOT EXISTS {seq};
+                SELECT setval('{seq}', COALESCE((SELECT MAX(id) FROM {table}_legacy), 0) + 1, false);
+                ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{seq}');
+                ALTER SEQUENCE {seq} OWNED BY {table}.id;
+                ALTER TABLE {table} ADD CONSTRAINT {table}_part_pkey PRIMARY KEY (id, {key});
+                CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;
+                """
+            )
+        cur.execute(
+            f"""
+            CREATE UNIQUE INDEX ON {OUTSTANDING} (jti, expires_at);
+            CREATE INDEX ON {OUTSTANDING} (user_id);
+            CREATE INDEX ON {OUTSTANDING} (expires_at);
+            CREATE INDEX ON {BLACKLISTED} (token_id);
+            ALTER TABLE {OUTSTANDING} ADD FOREIGN KEY (user_id) REFERENCES auth_user(id) DEFERRABLE INITIALLY DEFERRED;
+            """
+        )
+
+        # 既存の行が入るよう、残す行の最古の時刻からパーティションを作る
+        cur.execute(f"SELECT MIN(expires_at) FROM {OUTSTANDING}_legacy WHERE expires_at >= NOW()")
+        oldest = cur.fetchone()[0]
+        cur.execute(
+            f"""
+            SELECT MIN(b.blacklisted_at) FROM {BLACKLISTED}_legacy b
+            JOIN {OUTSTANDING}_legacy o ON o.id = b.token_id
+            WHERE o.expires_at >= NOW()
+            """
+        )
+        oldest_blacklisted = cur.fetchone()[0]
+        since = min((t for t in (oldest, oldest_blacklisted) if t is not None), default=None)
+        ensure_partitions(period, ahead, since=since)
+        install_unique_guards()
+
+        cur.execute(f"INSERT INTO {OUTSTANDING} SELECT * FROM {OUTSTANDING}_legacy WHERE expires_at >= NOW()")
+        outstanding = cur.rowcount
+        cur.execute(
+            f"""
+            INSERT INTO {BLACKLISTED}
+            SELECT b.* FROM {BLACKLISTED}_legacy b
+            JOIN {OUTSTANDING}_legacy o ON o.id = b.token_id
+            WHERE o.expires_at >= NOW()
+            """
+        )
+        blacklisted = cur.rowcount
+        cur.execute(f"DROP TABLE {BLACKLISTED}_legacy")
+        cur.execute(f"DROP TABLE {OUTSTANDING}_legacy")
+    return {"outstanding": outstanding, "blacklisted": blacklisted}
+
+
+def delete_orphaned_blacklisted() -> int:
+    """パーティション構成で、outstanding 側のパーティションが先に DROP された DEFAULT 内の blacklisted を削除する。"""
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            DELETE FROM {BLACKLISTED}_default b
+            WHERE NOT EXISTS (SELECT 1 FROM {OUTSTANDING} o WHERE o.id = b.token_id)
+            """
+        )
+        return cur.rowcount
+
+
+def run(batch_size: int | None = None, sleep_s: float | None = None, max_batches: int | None = None) -> dict:
+    """1 回分の掃除。パーティション構成なら先のパーティション作成と期限切れパーティションの DROP も行う。"""
+    c = conf()
+    batch_size = int(batch_size or c["BATCH_SIZE"])
+    sleep_s = float(c["SLEEP_S"] if sleep_s is None else sleep_s)
+    result = {"created_partitions": [], "dropped_partitions": [], "deleted_rows": 0}
+    if is_partitioned(OUTSTANDING):
+        # 一意性のトリガが無い版で切り替えた構成にも後から入れる
+        install_unique_guards()
+        result["created_partitions"] = ensure_partitions(c["PARTITION_PERIOD"], int(c["PARTITIONS_AHEAD"]))
+        result["dropped_partitions"] = drop_expired_partitions()
+        result["deleted_rows"] += delete_orphaned_blacklisted()
+    result["deleted_rows"] += prune_rows(batch_size, sleep_s, max_batches)
+    return result
@@ -11,6 +11,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from core.exceptions import error_response
+from core.idempotency import idempotent
+from core.metrics import track_in_progress
 from core.models import Photo, Place
 from core.serializers import UploadPhotoSerializer
 
@@ -37,6 +39,7 @@ def resolve_extension(upload_name: str, content_type: str) -> str:
 class UploadView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent("photo-upload")
     def post(self, request):
         serializer = UploadPhotoSerializer(data=request.data)
         if not serializer.is_valid():
@@ -87,7 +90,7 @@ class UploadView(APIView):
         absolute_path = Path(storage.path(saved_name))
 
         try:
-            with Image.open(absolute_path) as img:
+            with track_in_progress("image_processing_in_progress"), Image.open(absolute_path) as img:
                 img = ImageOps.exif_transpose(img)
                 width, height = img.size
                 if max(width, height) > MAX_DIMENSION:
@@ -1,11 +1,32 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import connection
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views import View
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
 import base64
+from datetime import datetime
+import hashlib
+import hmac
 import json
 import uuid
+from core import search_index
+from core.auth_views import profile_summary
 from core.exceptions import error_response  # 共通エラーフォーマッタ
+from core.metrics import render_text
+from core.opening_hours import parse_open_at
+from core.ranking import RANK_COLUMNS, available as ranking_available, covering_cells, relevance_settings
+from core.renderers import FastJSONMixin
+from core.schema import has_table
+from core.serializers import PlacesBatchSerializer
+
+
+AGE_BAND_CODES_TTL_S = 300
 
 
 class PingView(APIView):
@@ -13,11 +34,375 @@ class PingView(APIView):
         return Response({"pong": True})
 
 
-class PlacesSearchView(APIView):
+class MetricsView(View):
+    """Prometheus 形式のメトリクス。
+    - METRICS['TOKEN'] が設定されている場合は `Authorization: Bearer <token>` を要求する。
+    - TOKEN が未設定の場合は METRICS['ALLOW_UNAUTHENTICATED']（既定は DEBUG 時のみ）でなければ 403。
+    """
+
+    def get(self, request):
+        conf = getattr(settings, "METRICS", {})
+        token = conf.get("TOKEN")
+        if token:
+            if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+                return HttpResponse(status=403)
+        elif not conf.get("ALLOW_UNAUTHENTICATED", settings.DEBUG):
+            return HttpResponse(status=403)
+        return HttpResponse(render_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def search_places_sql(
+    lat: float,
+    lng: float,
+    radius_m: float,
+    limit: int,
+    offset: int,
+    sort: str,
+    q: str | None = None,
+    category: str | None = None,
+    features_list: list[str] | None = None,
+    open_minute: int | None = None,
+    age_band: str | None = None,
+    age_band_filter: bool = False,
+) -> list[dict]:
+    """PlacesSearchView の SQL 実装（入力は検証済みであること）。items を返す。
+    open_minute: 週内の分（core.opening_hours）。指定時はその時刻に営業中の施設に限る。
+    age_band: 年齢帯コード。指定時は各 item の rating.age_band に年齢帯の評価を載せ、sort=score / reviews では
+      その年齢帯のレビューがある施設を先に年齢帯の集計（place_age_band_stats）の順で、残りを通常の順で並べる。
+      age_band_filter=True ならその年齢帯のレビューがある施設に限る。reviews テーブルは読まない。
+    """
+    features_list = features_list or []
+    use_age_band = bool(age_band) and has_table("place_age_band_stats")
+    # 検索SQLの構築（PostGIS KNN + 追加フィルタ）
+    # up: 検索地点（と年齢帯の ID）。各 CTE / 本体から CROSS JOIN で参照する
+    up_sql = "SELECT ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography AS g"
+    up_params = [
+        float(lng),  # ST_MakePoint(X=lng, Y=lat)
+        float(lat),
+    ]
+    if use_age_band:
+        up_sql += ", (SELECT id FROM age_bands WHERE code = %s) AS age_band_id"
+        up_params.append(age_band)
+    where = ["ST_DWithin(p.geog, up.g, %s)"]
+    params = [float(radius_m)]
+
+    if category:
+        where.append("c.code = %s")
+        params.append(category)
+    if q:
+        where.append("p.search_vector @@ plainto_tsquery('simple', %s)")
+        params.append(q)
+    if open_minute is not None:
+        # GiST 索引 (geog, opening_minutes) で半径条件と同時に評価される
+        where.append("p.opening_minutes @> %s::int4")
+        params.append(int(open_minute))
+    if use_age_band and age_band_filter:
+        where.append(
+            "EXISTS (SELECT 1 FROM place_age_band_stats abf "
+            "WHERE abf.place_id = p.id AND abf.age_band_id = up.age_band_id AND abf.review_count > 0)"
+        )
+
+    # features AND条件（指定された全コードを満たす施設に限定）
+    for code in features_list:
+        where.append(
+            "EXISTS (SELECT 1 FROM place_features pf JOIN features f2 ON f2.id = pf.feature_id "
+            "WHERE pf.place_id = p.id AND f2.code = %s AND COALESCE(pf.value,1) > 0)"
+        )
+        params.append(code)
+
+    where_sql = " AND ".join(where)
+
+    # place_stats が未作成な環境では NULL 行を結合し、ORDER BY の式はそのまま使えるようにする
+    if has_table("place_stats"):
+        stats_join = "LEFT JOIN place_stats ps ON ps.place_id = p.id"
+    else:
+        stats_join = "LEFT JOIN (SELECT NULL::numeric AS avg_overall, NULL::int AS review_count) ps ON true"
+
+    if use_age_band:
+        band_cols = ", ab.avg_overall AS band_avg_overall, ab.review_count AS band_review_count"
+        band_join = "LEFT JOIN place_age_band_stats ab ON ab.place_id = p.id AND ab.age_band_id = up.age_band_id"
+    else:
+        band_cols = ""
+        band_join = ""
+
+    select_sql = f"""
+    SELECT p.id, p.name,
+           c.code AS category_code, c.label AS category_label,
+           p.lat, p.lng,
+           ST_Distance(p.geog, up.g) AS dist_m,
+           ps.avg_overall, ps.review_count,
+           p.created_at,
+           COALESCE((
+             SELECT array_agg(f.code ORDER BY f.code)
+             FROM place_features pf
+             JOIN features f ON f.id = pf.feature_id
+             WHERE pf.place_id = p.id AND COALESCE(pf.value,1) > 0
+           ), ARRAY[]::text[]) AS features_summary
+           {band_cols}
+    FROM places p
+    JOIN categories c ON c.id = p.category_id
+    {stats_join}
+    CROSS JOIN up
+    {band_join}
+    """
+
+    # 並び順の構築
+    if sort == "relevance":
+        # 1 段目: KNN で近い順に候補を CANDIDATES 件、2 段目: 候補だけをスコアで並べ替える
+        rel = relevance_settings()
+        weights = rel["WEIGHTS"]
+        candidates = int(rel["CANDIDATES"])
+        if ranking_available():
+            rating_join = "LEFT JOIN place_rank pr ON pr.place_id = p.id"
+            rating_expr = "pr.rank_score"
+        else:
+            rating_join = ""
+            rating_expr = "COALESCE(ps.avg_overall, 3.5)"
+        text_expr = "0"
+        text_params = []
+        if q:
+            # 正規化 32: rank / (rank + 1) で 0〜1 に収める
+            text_expr = "ts_rank_cd(p.search_vector, plainto_tsquery('simple', %s), 32)"
+            text_params = [q]
+        sql = f"""
+        WITH up AS (
+            {up_sql}
+        ),
+        candidates AS (
+            SELECT p.id AS place_id
+            FROM places p
+            JOIN categories c ON c.id = p.category_id
+            CROSS JOIN up
+            WHERE {where_sql}
+            ORDER BY p.geog <-> up.g
+            LIMIT %s
+        ),
+        scored AS (
+            SELECT p.id AS place_id,
+                   %s * power(0.5, ST_Distance(p.geog, up.g) / %s)
+                 + %s * (COALESCE({rating_expr}, 0) - 1) / 4.0
+                 + %s * LEAST(ln(1 + COALESCE(ps.review_count, 0)) / ln(1 + %s), 1)
+                 + %s * {text_expr} AS relevance
+            FROM candidates cd
+            JOIN places p ON p.id = cd.place_id
+            {stats_join}
+            {rating_join}
+            CROSS JOIN up
+        )
+        {select_sql}
+        JOIN scored s ON s.place_id = p.id
+        ORDER BY s.relevance DESC, p.geog <-> up.g, p.id
+        LIMIT %s OFFSET %s
+        """
+        params_with_page = [
+            *up_params,
+            *params,
+            candidates,
+            float(weights["distance"]),
+            float(rel["DISTANCE_HALF_LIFE_M"]),
+            float(weights["rating"]),
+            float(weights["reviews"]),
+            float(rel["REVIEWS_SATURATION"]),
+            float(weights["text"]),
+            *text_params,
+            int(limit),
+            int(offset),
+        ]
+    elif sort in RANK_COLUMNS and ranking_available() and use_age_band:
+        # 年齢帯つきの score / reviews: 年齢帯のレビューがある施設（部分索引で年齢帯ごとに引ける少数）だけを
+        # 年齢帯の値で並べ、その後ろに残りの施設を place_rank のセル走査（下の分岐と同じ）で並べる
+        rank_col = RANK_COLUMNS[sort]
+        if sort == "score":
+            band_key = "(sp.weight * sp.mean + ab.overall_sum) / (sp.weight + ab.review_count)"
+        else:
+            band_key = "ab.review_count::float8"
+        rest_sql = ""
+        rest_params = []
+        if not age_band_filter:
+            rest_sql = f"""
+            UNION ALL
+            SELECT top.place_id, top.rank_value, 1 AS part
+            FROM unnest(%s::int[]) AS cell(id)
+            CROSS JOIN LATERAL (
+                SELECT pr.place_id, pr.{rank_col}::float8 AS rank_value
+                FROM place_rank pr
+                JOIN places p ON p.id = pr.place_id
+                JOIN categories c ON c.id = p.category_id
+                CROSS JOIN up
+                WHERE pr.grid_cell = cell.id AND {where_sql}
+                  AND NOT EXISTS (
+                    SELECT 1 FROM place_age_band_stats x
+                    WHERE x.place_id = p.id AND x.age_band_id = up.age_band_id AND x.review_count > 0
+                  )
+                ORDER BY pr.{rank_col} DESC, p.geog <-> up.g, p.id
+                LIMIT %s
+            ) AS top"""
+            rest_params = [covering_cells(lat, lng, radius_m), *params, int(offset) + int(limit)]
+        sql = f"""
+        WITH up AS (
+            {up_sql}
+        ),
+        ranked AS (
+            (
+                SELECT ab.place_id, {band_key} AS rank_value, 0 AS part
+                FROM place_age_band_stats ab
+                JOIN places p ON p.id = ab.place_id
+                JOIN categories c ON c.id = p.category_id
+                CROSS JOIN up
+                CROSS JOIN search_rank_prior sp
+                WHERE ab.age_band_id = up.age_band_id AND ab.review_count > 0 AND {where_sql}
+                ORDER BY rank_value DESC, p.geog <-> up.g, p.id
+                LIMIT %s
+            )
+            {rest_sql}
+        )
+        {select_sql}
+        JOIN ranked rk ON rk.place_id = p.id
+        ORDER BY rk.part, rk.rank_value DESC, p.geog <-> up.g, p.id
+        LIMIT %s OFFSET %s
+        """
+        params_with_page = [
+            *up_params,
+            *params,
+            int(offset) + int(limit),
+            *rest_params,
+            int(limit),
+            int(offset),
+        ]
+    elif sort in RANK_COLUMNS and ranking_available():
+        # score / reviews: place_rank の (grid_cell, 順位列) 索引をセルごとに上位 offset+limit 件だけ読み、
+        # それらを併合して並べる（半径内の全件を集計・ソートしない）。挙動の詳細は core.ranking を参照
+        rank_col = RANK_COLUMNS[sort]
+        sql = f"""
+        WITH up AS (
+            {up_sql}
+        ),
+        ranked AS (
+            SELECT top.place_id, top.rank_value
+            FROM unnest(%s::int[]) AS cell(id)
+            CROSS JOIN LATERAL (
+                SELECT pr.place_id, pr.{rank_col} AS rank_value
+                FROM place_rank pr
+                JOIN places p ON p.id = pr.place_id
+                JOIN categories c ON c.id = p.category_id
+                CROSS JOIN up
+                WHERE pr.grid_cell = cell.id AND {where_sql}
+                ORDER BY pr.{rank_col} DESC, p.geog <-> up.g, p.id
+                LIMIT %s
+            ) AS top
+        )
+        {select_sql}
+        JOIN ranked rk ON rk.place_id = p.id
+        ORDER BY rk.rank_value DESC, p.geog <-> up.g, p.id
+        LIMIT %s OFFSET %s
+        """
+        params_with_page = [
+            *up_params,
+            covering_cells(lat, lng, radius_m),
+            *params,
+            int(offset) + int(limit),
+            int(limit),
+            int(offset),
+        ]
+    else:
+        order_sql = "p.geog <-> up.g, p.id"
+        if use_age_band and sort == "score":
+            # place_rank が無い環境: 年齢帯の評価の単純平均で並べる（上の分岐と同様に年齢帯のレビューがある施設が先）
+            order_sql = "(ab.review_count > 0) IS TRUE DESC, COALESCE(ab.avg_overall,0) DESC, p.geog <-> up.g, p.id"
+        elif use_age_band and sort == "reviews":
+            order_sql = "COALESCE(ab.review_count,0) DESC, p.geog <-> up.g, p.id"
+        elif sort == "score":
+            order_sql = "COALESCE(ps.avg_overall,0) DESC, p.geog <-> up.g, p.id"
+        elif sort == "reviews":
+            order_sql = "COALESCE(ps.review_count,0) DESC, p.geog <-> up.g, p.id"
+        elif sort == "new":
+            order_sql = "p.created_at DESC, p.geog <-> up.g, p.id"
+        sql = f"""
+        WITH up AS (
+            {up_sql}
+        )
+        {select_sql}
+        WHERE {where_sql}
+        ORDER BY {order_sql}
+        LIMIT %s OFFSET %s
+        """
+        params_with_page = [*up_params, *params, int(limit), int(offset)]
+
+    # 実行と整形
+    with connection.cursor() as cur:
+        cur.execute(sql, params_with_page)
+        rows = cur.fetchall()
+
+    if not use_age_band:
+        return [format_search_item(row) for row in rows]
+    items = []
+    for row in rows:
+        item = format_search_item(row[:-2])
+        band_avg, band_count = row[-2:]
+        item["rating"]["age_band"] = {
+            "code": age_band,
+            "overall": float(band_avg) if band_avg is not None else None,
+            "count": int(band_count or 0),
+        }
+        items.append(item)
+    return items
+
+
+def format_search_item(row) -> dict:
+    """検索 SQL の 1 行を PlacesSearchView の item 形へ整形する（PlacesBatchView と共用）。
+    row: (id, name, category_code, category_label, lat, lng, dist_m, avg_overall, review_count, created_at, features_summary)
+    """
+    (
+        place_id,
+        name,
+        category_code,
+        category_label,
+        plat,
+        plng,
+        dist_m,
+        avg_overall,
+        review_count,
+        created_at,
+        features_summary,
+    ) = row
+    return {
+        "id": str(place_id),
+        "name": name,
+        "category": {"code": category_code, "label": category_label},
+        "location": {
+            "lat": float(plat) if plat is not None else None,
+            "lng": float(plng) if plng is not None else None,
+            "distance_m": float(dist_m) if dist_m is not None else None,
+        },
+        "features_summary": features_summary or [],
+        "rating": {"overall": float(avg_overall) if avg_overall is not None else None, "count": int(review_count or 0)},
+        "thumbnail_url": None,
+        "created_at": created_at,
+    }
+
+
+def age_band_codes() -> frozenset[str]:
+    """年齢帯コードの一覧（検証用。キャッシュに AGE_BAND_CODES_TTL_S 秒保持）。"""
+    codes = cache.get("age_band_codes")
+    if codes is None:
+        with connection.cursor() as cur:
+            cur.execute("SELECT code FROM age_bands")
+            codes = frozenset(r[0] for r in cur.fetchall())
+        cache.set("age_band_codes", codes, AGE_BAND_CODES_TTL_S)
+    return codes
+
+
+class PlacesSearchView(FastJSONMixin, APIView):
     """施設検索。
     必須: lat, lng
-    任意: radius_m(既定3000, 最大30000), limit(既定20, 最大50), cursor(base64), q, category, sort
-    並び替え(sort): distance | score | reviews | new
+    任意: radius_m(既定3000, 最大30000), limit(既定20, 最大50), cursor(base64), q, category, sort,
+          open_at('now' または ISO 8601 の日時。その時刻に営業中の施設に限る。営業時間が不明な施設は除く),
+          age_band(年齢帯コード。その年齢帯のレビューがある施設に限り、score / reviews は年齢帯の集計で並べる)
+    age_band を省略したログインユーザーの sort=score / reviews は、プロフィールの child_age_band で並べる
+    （絞り込みはしない）。`age_band=` のように空で指定すると年齢帯を使わない。未知のコードは 400。
+    並び替え(sort): distance | score | reviews | new | relevance
+      - score はベイズ平均（place_rank.rank_score）、reviews はレビュー件数の降順。同値は距離順
+      - relevance は距離減衰・評価・件数・テキスト一致（q 指定時）の加重和（近い順の候補から再順位付け）
     仕様: 半径内で PostGIS KNN を使いつつ、指定の sort に応じて ORDER BY を切り替え、`{ items, next_cursor }` を返す。
     """
 
@@ -96,10 +481,10 @@ class PlacesSearchView(APIView):
             )
 
         sort = qp.get("sort") or "distance"
-        if sort not in ("distance", "score", "reviews", "new"):
+        if sort not in ("distance", "score", "reviews", "new", "relevance"):
             return error_response(
                 code="VALIDATION_ERROR",
-                message="sort must be one of 'distance', 'score', 'reviews', 'new'",
+                message="sort must be one of 'distance', 'score', 'reviews', 'new', 'relevance'",
                 details={"field": "sort"},
             )
 
@@ -117,114 +502,187 @@ class PlacesSearchView(APIView):
         except Exception:
             features_list = []
 
-        # 2) 検索SQLの構築（PostGIS KNN + 追加フィルタ）
-        where = ["ST_DWithin(p.geog, up.g, %s)"]
-        params = [
-            float(lng),  # ST_MakePoint(X=lng, Y=lat)
-            float(lat),
-            float(radius_m),
-        ]
+        open_minute = None
+        if qp.get("open_at"):
+            try:
+                open_minute = parse_open_at(qp["open_at"])
+            except ValueError:
+                return error_response(
+                    code="VALIDATION_ERROR",
+                    message="open_at must be 'now' or an ISO 8601 datetime",
+                    details={"field": "open_at"},
+                )
 
-        if category:
-            where.append("c.code = %s")
-            params.append(category)
-        if q:
-            where.append("p.search_vector @@ plainto_tsquery('simple', %s)")
-            params.append(q)
-
-        # features AND条件（指定された全コードを満たす施設に限定）
-        for code in features_list:
-            where.append(
-                "EXISTS (SELECT 1 FROM place_features pf JOIN features f2 ON f2.id = pf.feature_id "
-                "WHERE pf.place_id = p.id AND f2.code = %s AND COALESCE(pf.value,1) > 0)"
+        # 年齢帯（明示指定は絞り込み＋並び替え。プロフィールからの既定は score / reviews の並び替えのみで、
+        # それ以外の sort ではメモリ内インデックスや place_rank の経路をそのまま使う）
+        age_band = qp.get("age_band")
+        age_band_filter = bool(age_band)
+        if age_band and age_band not in age_band_codes():
+            return error_response(
+                code="VALIDATION_ERROR", message="unknown age_band", details={"field": "age_band"}
             )
-            params.append(code)
+        if age_band is None and sort in RANK_COLUMNS and request.user.is_authenticated:
+            band = profile_summary(request.user.id)["child_age_band"]
+            age_band = band["code"] if band else None
+
+        # 2) 検索（メモリ内インデックスが有効で対応できる条件ならそれを使い、それ以外は SQL）
+        search_args = dict(
+            lat=lat, lng=lng, radius_m=radius_m, limit=limit, offset=offset, sort=sort,
+            q=q, category=category, features_list=features_list, open_minute=open_minute,
+            age_band=age_band or None, age_band_filter=age_band_filter,
+        )
+        items = search_index.search(**search_args) if search_index.enabled() else None
+        source = "memory"
+        if items is None:
+            items = search_places_sql(**search_args)
+            source = "sql"
+
+        # relevance は候補数までしか並べ替えないため、それ以降のページは無い
+        result_cap = int(relevance_settings()["CANDIDATES"]) if sort == "relevance" else None
+        next_cursor = None
+        if len(items) == limit and (result_cap is None or offset + limit < result_cap):
+            next_cursor_obj = {"offset": offset + limit}
+            next_cursor = base64.urlsafe_b64encode(json.dumps(next_cursor_obj).encode("utf-8")).decode("utf-8")
 
-        where_sql = " AND ".join(where)
+        return Response({"items": items, "next_cursor": next_cursor}, headers={"X-Search-Source": source})
 
-        # 並び順の構築
-        order_sql = "p.geog <-> up.g, p.id"
-        if sort == "score":
-            order_sql = "COALESCE(ps.avg_overall,0) DESC, p.geog <-> up.g, p.id"
-        elif sort == "reviews":
-            order_sql = "COALESCE(ps.review_count,0) DESC, p.geog <-> up.g, p.id"
-        elif sort == "new":
-            order_sql = "p.created_at DESC, p.geog <-> up.g, p.id"
 
+class PlacesBatchView(FastJSONMixin, APIView):
+    """複数施設の要約を一括で返す（お気に入り・履歴など ID 既知の一覧向け）。
+    入力(JSON): ids(UUID 最大100件, 必須), lat/lng(任意・両方指定で distance_m を計算), fields(任意・返す項目)
+    返却: `{ items, missing }`。items は PlacesSearchView と同じ形（id は常に含む）で ids の順、
+    missing は存在しない ID。取得は `WHERE id = ANY(%s)` の 1 クエリのみ。
+    JSON 以外の本文（フォーム・multipart）は 415。
+    """
+
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        serializer = PlacesBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return error_response(
+                code="VALIDATION_ERROR",
+                message="入力内容に誤りがあります",
+                details=serializer.errors,
+            )
+
+        data = serializer.validated_data
+        # 重複を除き、指定順を保つ
+        ids = list(dict.fromkeys(str(pid) for pid in data["ids"]))
+        fields = set(data.get("fields") or PlacesBatchSerializer.FIELD_CHOICES)
+        lat, lng = data.get("lat"), data.get("lng")
+
+        if has_table("place_stats"):
+            stats_join = "LEFT JOIN place_stats ps ON ps.place_id = p.id"
+        else:
+            stats_join = "LEFT JOIN (SELECT NULL::numeric AS avg_overall, NULL::int AS review_count) ps ON true"
+        params: list = []
+        if lat is not None:
+            dist_sql = "ST_Distance(p.geog, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography)"
+            params.extend([float(lng), float(lat)])
+        else:
+            dist_sql = "NULL::float8"
+        # 特徴の集約は要求されたときだけ行う
+        if "features_summary" in fields:
+            features_sql = """COALESCE((
+                 SELECT array_agg(f.code ORDER BY f.code)
+                 FROM place_features pf
+                 JOIN features f ON f.id = pf.feature_id
+                 WHERE pf.place_id = p.id AND COALESCE(pf.value,1) > 0
+               ), ARRAY[]::text[])"""
+        else:
+            features_sql = "NULL::text[]"
         sql = f"""
-        WITH up AS (
-            SELECT ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography AS g
-        )
         SELECT p.id, p.name,
                c.code AS category_code, c.label AS category_label,
                p.lat, p.lng,
-               ST_Distance(p.geog, up.g) AS dist_m,
+               {dist_sql} AS dist_m,
                ps.avg_overall, ps.review_count,
                p.created_at,
-               COALESCE((
-                 SELECT array_agg(f.code ORDER BY f.code)
-                 FROM place_features pf
-                 JOIN features f ON f.id = pf.feature_id
-                 WHERE pf.place_id = p.id AND COALESCE(pf.value,1) > 0
-               ), ARRAY[]::text[]) AS features_summary
+               {features_sql} AS features_summary
         FROM places p
         JOIN categories c ON c.id = p.category_id
-        LEFT JOIN place_stats ps ON ps.place_id = p.id
-        CROSS JOIN up
-        WHERE {where_sql}
-        ORDER BY {order_sql}
-        LIMIT %s OFFSET %s
+        {stats_join}
+        WHERE p.id = ANY(%s::uuid[])
         """
-
-        params_with_page = [*params, int(limit), int(offset)]
-
-        # 3) 実行と整形
+        params.append(ids)
         with connection.cursor() as cur:
-            cur.execute(sql, params_with_page)
+            cur.execute(sql, params)
             rows = cur.fetchall()
 
-        items = []
+        found = {}
         for row in rows:
-            (
-                place_id,
-                name,
-                category_code,
-                category_label,
-                plat,
-                plng,
-                dist_m,
-                avg_overall,
-                review_count,
-                created_at,
-                features_summary,
-            ) = row
-            items.append(
-                {
-                    "id": str(place_id),
-                    "name": name,
-                    "category": {"code": category_code, "label": category_label},
-                    "location": {"lat": float(plat) if plat is not None else None, "lng": float(plng) if plng is not None else None, "distance_m": float(dist_m)},
-                    "features_summary": features_summary or [],
-                    "rating": {"overall": float(avg_overall) if avg_overall is not None else None, "count": int(review_count or 0)},
-                    "thumbnail_url": None,
-                    "created_at": created_at,
-                }
-            )
-
-        next_cursor = None
-        if len(items) == limit:
-            next_cursor_obj = {"offset": offset + limit}
-            next_cursor = base64.urlsafe_b64encode(json.dumps(next_cursor_obj).encode("utf-8")).decode("utf-8")
-
-        return Response({"items": items, "next_cursor": next_cursor})
-
-
-class PlaceDetailView(APIView):
+            item = format_search_item(row)
+            found[item["id"]] = {k: v for k, v in item.items() if k == "id" or k in fields}
+        items = [found[pid] for pid in ids if pid in found]
+        missing = [pid for pid in ids if pid not in found]
+        return Response({"items": items, "missing": missing})
+
+
+def place_detail_validators(place_id: str) -> tuple[str, datetime] | None:
+    """施設詳細の ETag / Last-Modified をメタデータだけの 1 クエリで求める（施設が無ければ None）。
+    - Last-Modified: places.updated_at（place_features の変更もトリガで進む）・place_stats の更新・
+      最新の写真・最新の取得元メタの時刻のうち最も新しいもの
+    - ETag: 上記に加えて集計値・写真の件数・特徴（コード/値/詳細/ラベル）を反映した値のハッシュ
+      （削除のように時刻が進まない変更も ETag では検知する）
+    """
+    if has_table("place_stats"):
+        stats_cols = "ps.last_reviewed_at, ps.updated_at, ps.avg_overall, ps.review_count"
+        stats_join = "LEFT JOIN place_stats ps ON ps.place_id = p.id"
+    else:
+        stats_cols = "NULL::timestamptz, NULL::timestamptz, NULL, NULL"
+        stats_join = ""
+    photo_cols = (
+        "ph.photos_at, ph.photo_count"
+        if has_table("photos")
+        else "NULL::timestamptz, NULL"
+    )
+    photo_join = (
+        "LEFT JOIN LATERAL (SELECT MAX(created_at) AS photos_at, COUNT(*) AS photo_count FROM photos WHERE place_id = p.id) ph ON true"
+        if has_table("photos")
+        else ""
+    )
+    meta_cols = (
+        "(SELECT MAX(m.fetched_at) FROM place_source_meta m WHERE m.place_id = p.id)"
+        if has_table("place_source_meta")
+        else "NULL::timestamptz"
+    )
+    sql = f"""
+        SELECT p.updated_at, {stats_cols}, {photo_cols}, {meta_cols},
+               (
+                 SELECT md5(string_agg(
+                   f.code || ':' || COALESCE(pf.value::text, '') || ':' || COALESCE(pf.detail, '') || ':' || f.label,
+                   ',' ORDER BY f.code
+                 ))
+                 FROM place_features pf
+                 JOIN features f ON f.id = pf.feature_id
+                 WHERE pf.place_id = p.id
+               )
+        FROM places p
+        {stats_join}
+        {photo_join}
+        WHERE p.id = %s
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, [str(place_id)])
+        row = cur.fetchone()
+    if not row:
+        return None
+    updated_at, last_reviewed_at, stats_updated_at, _, _, photos_at, _, meta_at, _ = row
+    last_modified = max(
+        t for t in (updated_at, last_reviewed_at, stats_updated_at, photos_at, meta_at) if t is not None
+    )
+    digest = hashlib.sha1("|".join(str(v) for v in (place_id, *row)).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"', last_modified
+
+
+class PlaceDetailView(FastJSONMixin, APIView):
     """施設詳細を返す。
     入力: path param {id}
     返却: API設計に準拠した施設詳細（features/rating/photos/sourceメタを含む）。
     - 現状のDBにはレビュー/写真集計が無いため、rating と photos はプレースホルダ（overall=null, count=0, photos=[]）
     - 取得元メタは places.google_place_id / data_source を返す
+    - ETag / Last-Modified を付与し、If-None-Match / If-Modified-Since が一致すれば本体を組み立てずに 304 を返す
     """
 
     def get(self, request, place_id: str):
@@ -239,91 +697,70 @@ class PlaceDetailView(APIView):
                 status_code=400,
             )
 
-        # 2) 施設本体の取得（カテゴリ含む）
+        # 2) 条件付き GET（メタデータのみのクエリで 304 を判定）
+        validators = place_detail_validators(place_id)
+        if validators is None:
+            return error_response(
+                code="NOT_FOUND", message="place not found", details={"place_id": str(place_id)}, status_code=404
+            )
+        etag, last_modified = validators
+        not_modified = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            not_modified["Last-Modified"] = http_date(last_modified.timestamp())
+            return not_modified
+
+        # 施設本体の取得（カテゴリ含む）
         # 施設本体 + カテゴリ + place_stats（平均★/件数）を取得
-        sql_place = """
-            SELECT p.id, p.name, p.description, p.address, p.phone, p.website_url,
-                   p.opening_hours_json, p.lat, p.lng,
-                   c.code AS category_code, c.label AS category_label,
-                   p.google_place_id, p.data_source,
-                   ps.avg_overall, ps.review_count,
-                   p.created_at, p.updated_at
-            FROM places p
-            JOIN categories c ON c.id = p.category_id
-            LEFT JOIN place_stats ps ON ps.place_id = p.id
-            WHERE p.id = %s
-            LIMIT 1
-        """
-
-        # place_stats が未作成な環境でも動作するようフォールバックを用意
-        sql_place_fallback = """
+        # place_stats が未作成な環境ではスキーマ検出結果に従い NULL/0 を返す形に切り替える
+        if has_table("place_stats"):
+            stats_cols = "ps.avg_overall, ps.review_count"
+            stats_join = "LEFT JOIN place_stats ps ON ps.place_id = p.id"
+        else:
+            stats_cols = "NULL::numeric AS avg_overall, 0 AS review_count"
+            stats_join = ""
+        sql_place = f"""
             SELECT p.id, p.name, p.description, p.address, p.phone, p.website_url,
                    p.opening_hours_json, p.lat, p.lng,
                    c.code AS category_code, c.label AS category_label,
                    p.google_place_id, p.data_source,
+                   {stats_cols},
                    p.created_at, p.updated_at
             FROM places p
             JOIN categories c ON c.id = p.category_id
+            {stats_join}
             WHERE p.id = %s
             LIMIT 1
         """
 
-        try:
-            with connection.cursor() as cur:
-                cur.execute(sql_place, [str(place_id)])
-                row = cur.fetchone()
-            using_stats = True
-        except Exception:
-            with connection.cursor() as cur:
-                cur.execute(sql_place_fallback, [str(place_id)])
-                row = cur.fetchone()
-            using_stats = False
+        with connection.cursor() as cur:
+            cur.execute(sql_place, [str(place_id)])
+            row = cur.fetchone()
 
         if not row:
             return error_response(
                 code="NOT_FOUND", message="place not found", details={"place_id": str(place_id)}, status_code=404
             )
 
-        if using_stats:
-            (
-                pid,
-                name,
-                description,
-                address,
-                phone,
-                website_url,
-                opening_hours_json,
-                lat,
-                lng,
-                category_code,
-                category_label,
-                google_place_id,
-                data_source,
-                avg_overall,
-                review_count,
-                created_at,
-                updated_at,
-            ) = row
-        else:
-            (
-                pid,
-                name,
-                description,
-                address,
-                phone,
-                website_url,
-                opening_hours_json,
-                lat,
-                lng,
-                category_code,
-                category_label,
-                google_place_id,
-                data_source,
-                created_at,
-                updated_at,
-            ) = row
-            avg_overall = None
-            review_count = 0
+        (
+            pid,
+            name,
+            description,
+            address,
+            phone,
+            website_url,
+            opening_hours_json,
+            lat,
+            lng,
+            category_code,
+            category_label,
+            google_place_id,
+            data_source,
+            avg_overall,
+            review_count,
+            created_at,
+            updated_at,
+        ) = row
 
         # 3) features（place_features×features）を取得
         sql_features = """
@@ -353,13 +790,11 @@ class PlaceDetailView(APIView):
             GROUP BY ra.code
         """
         axes_data = {}
-        with connection.cursor() as cur:
-            try:
+        if has_table("review_scores"):
+            with connection.cursor() as cur:
                 cur.execute(axes_sql, [str(place_id)])
                 axes_rows = cur.fetchall()
-                axes_data = {code: float(avg) for code, avg in axes_rows}
-            except Exception:
-                axes_data = {}
+            axes_data = {code: float(avg) for code, avg in axes_rows}
 
         if avg_overall is None:
             summary_sql = """
@@ -368,14 +803,10 @@ class PlaceDetailView(APIView):
                 WHERE place_id = %s AND status = 'public'
             """
             with connection.cursor() as cur:
-                try:
-                    cur.execute(summary_sql, [str(place_id)])
-                    summary_row = cur.fetchone()
-                    if summary_row:
-                        avg_overall, review_count = summary_row
-                except Exception:
-                    avg_overall = None
-                    review_count = 0
+                cur.execute(summary_sql, [str(place_id)])
+                summary_row = cur.fetchone()
+            if summary_row:
+                avg_overall, review_count = summary_row
 
         rating_axes_map = {
             "cleanliness": "清潔さ",
@@ -392,7 +823,7 @@ class PlaceDetailView(APIView):
 
         # 写真（最新順）
         photos = []
-        try:
+        if has_table("photos"):
             sql_photos = """
                 SELECT id, storage_path, width, height, mime_type
                 FROM photos
@@ -403,28 +834,26 @@ class PlaceDetailView(APIView):
             with connection.cursor() as cur:
                 cur.execute(sql_photos, [str(place_id)])
                 photo_rows = cur.fetchall()
-            photos = []
-            for pid, path, w, h, mt in photo_rows:
+            for photo_id, path, w, h, mt in photo_rows:
                 try:
                     absolute_url = request.build_absolute_uri(path)
                 except Exception:
                     absolute_url = path
                 photos.append(
                     {
-                        "id": str(pid),
+                        "id": str(photo_id),
                         "url": absolute_url,
                         "width": int(w) if w is not None else None,
                         "height": int(h) if h is not None else None,
                         "mime_type": mt,
                     }
                 )
-        except Exception:
-            photos = []
 
         # 取得元メタ（place_source_meta から最新を参照）
         google_meta = None
         if google_place_id:
-            try:
+            synced_at = None
+            if has_table("place_source_meta"):
                 sql_meta = """
                     SELECT fetched_at
                     FROM place_source_meta
@@ -435,13 +864,8 @@ class PlaceDetailView(APIView):
                 with connection.cursor() as cur:
                     cur.execute(sql_meta, [str(place_id)])
                     m = cur.fetchone()
-                google_meta = {
-                    "place_id": google_place_id,
-                    "source": "google",
-                    "synced_at": m[0] if m else None,
-                }
-            except Exception:
-                google_meta = {"place_id": google_place_id, "source": "google", "synced_at": None}
+                synced_at = m[0] if m else None
+            google_meta = {"place_id": google_place_id, "source": "google", "synced_at": synced_at}
 
         # 5) 応答を整形して返却
         return Response(
@@ -462,7 +886,8 @@ class PlaceDetailView(APIView):
                 "data_source": data_source,
                 "created_at": created_at,
                 "updated_at": updated_at,
-            }
+            },
+            headers={"ETag": etag, "Last-Modified": http_date(last_modified.timestamp()), "Cache-Control": "no-cache"},
         )
 
 
@@ -0,0 +1,28 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# API ホットパスのベンチマーク（合成データ生成 → ワークロード再生 → ベースライン比較）
+# - 前提: docker compose で db/api サービスを使用
+# - 例: SIZE=100k REQUESTS=5000 scripts/bench.sh
+# - BASELINE が存在すれば比較し、回帰があれば非ゼロで終了する（無ければ今回の結果をベースラインとして保存）
+
+ROOT_DIR=$(cd "$(dirname "$0")/.." && pwd)
+COMPOSE="docker compose -f $ROOT_DIR/back/docker-compose.yml"
+
+SIZE=${SIZE:-10k}
+SEED=${SEED:-42}
+REQUESTS=${REQUESTS:-2000}
+BASELINE=${BASELINE:-bench/baseline-${SIZE}.json}
+RESULT=${RESULT:-bench/result-${SIZE}.json}
+
+echo "[bench] 合成データを生成（size=${SIZE}, seed=${SEED}）..."
+$COMPOSE run --rm api python manage.py bench_seed --size "$SIZE" --seed "$SEED" --reset
+
+echo "[bench] ワークロードを再生（requests=${REQUESTS}）..."
+$COMPOSE run --rm api mkdir -p bench
+if $COMPOSE run --rm api test -f "$BASELINE"; then
+  $COMPOSE run --rm api python manage.py bench_api --requests "$REQUESTS" --seed "$SEED" --output "$RESULT" --baseline "$BASELINE"
+else
+  $COMPOSE run --rm api python manage.py bench_api --requests "$REQUESTS" --seed "$SEED" --output "$BASELINE"
+  echo "[bench] ベースラインを保存しました: back/api/${BASELINE}"
+fi